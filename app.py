@@ -6,11 +6,11 @@ Authors: Christian Nshuti Manzi & Aime Serge Tuyishime
 
 from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
-import pickle
 import os
 import time
 from datetime import datetime
 import threading
+import importlib.util
 
 # Try to import optional dependencies
 try:
@@ -20,11 +20,10 @@ except ImportError:
     NUMPY_AVAILABLE = False
     print("⚠ NumPy not available - model training will not work")
 
-try:
-    import tensorflow as tf
-    TENSORFLOW_AVAILABLE = True
-except ImportError:
-    TENSORFLOW_AVAILABLE = False
+# Only looked up: TensorFlow is imported when training or serving with it,
+# so the NumPy engine starts without paying for the import
+TENSORFLOW_AVAILABLE = importlib.util.find_spec('tensorflow') is not None
+if not TENSORFLOW_AVAILABLE:
     print("⚠ TensorFlow not available - model training will not work")
 
 app = Flask(__name__)
@@ -36,6 +35,19 @@ tokenizer = None
 SEQUENCE_LENGTH = 50
 vocab_size = 0
 model_type = "LSTM"
+session = None
+scheduler = None
+session_lock = threading.Lock()
+
+# Micro-batching of concurrent /api/generate requests
+GENERATE_MAX_BATCH = int(os.environ.get('GENERATE_MAX_BATCH', 16))
+GENERATE_MAX_WAIT_MS = float(os.environ.get('GENERATE_MAX_WAIT_MS', 2))
+# 'tensorflow', 'numpy' (saved_models/model_weights.npz, no TensorFlow
+# needed), 'numpy-int8' (model_weights_int8.npz, about 4x less weight
+# memory) or 'auto': TensorFlow when installed, otherwise NumPy
+INFERENCE_ENGINE = os.environ.get('INFERENCE_ENGINE', 'auto')
+# Sequences (items x n) allowed in one /api/generate/batch request
+GENERATE_BATCH_MAX_SEQUENCES = int(os.environ.get('GENERATE_BATCH_MAX_SEQUENCES', 256))
 
 # Training state
 training_state = {
@@ -47,99 +59,130 @@ training_state = {
     'loss': 0,
     'accuracy': 0,
     'logs': [],
+    'throughput': None,
     'should_stop': False
 }
 
+def use_numpy_engine():
+    """Whether to serve with the NumPy engine instead of TensorFlow"""
+    if INFERENCE_ENGINE in ('numpy', 'numpy-int8'):
+        return True
+    return INFERENCE_ENGINE == 'auto' and not TENSORFLOW_AVAILABLE
+
+def inference_engine():
+    """Name of the engine generation runs on"""
+    if not use_numpy_engine():
+        return 'tensorflow'
+    return 'numpy-int8' if INFERENCE_ENGINE == 'numpy-int8' else 'numpy'
+
 def load_model_and_tokenizer():
     """Load the trained model and tokenizer"""
     global model, tokenizer, vocab_size
 
-    if not TENSORFLOW_AVAILABLE:
+    if use_numpy_engine():
+        if not NUMPY_AVAILABLE:
+            print("✗ NumPy not installed - cannot load model")
+            return False
+    elif not TENSORFLOW_AVAILABLE:
         print("✗ TensorFlow not installed - cannot load model")
         return False
 
     try:
-        # Import TensorFlow
-        import tensorflow as tf
-        from tensorflow import keras
-        from tensorflow.keras.preprocessing.sequence import pad_sequences
+        # Load model: exported weights for the NumPy engine, else Keras
+        if use_numpy_engine():
+            from numpy_engine import NumpyModel, WEIGHTS_FILE, QUANTIZED_WEIGHTS_FILE
 
-        # Load model
-        model_path = 'saved_models/final_model.h5'
-        if os.path.exists(model_path):
-            model = keras.models.load_model(model_path)
-            print(f"✓ Model loaded from {model_path}")
+            quantized = INFERENCE_ENGINE == 'numpy-int8'
+            model_path = os.path.join(
+                'saved_models', QUANTIZED_WEIGHTS_FILE if quantized else WEIGHTS_FILE
+            )
+            if not os.path.exists(model_path):
+                print(f"✗ Exported weights not found at {model_path}")
+                print(f"   Export them with: python export_numpy.py{' --quantize' if quantized else ''}")
+                return False
+            model = NumpyModel.load(model_path)
         else:
-            print(f"✗ Model not found at {model_path}")
-            return False
+            from tensorflow import keras
 
-        # Load tokenizer
-        tokenizer_path = 'saved_models/tokenizer.pkl'
-        if os.path.exists(tokenizer_path):
-            with open(tokenizer_path, 'rb') as f:
-                tokenizer = pickle.load(f)
+            model_path = 'saved_models/final_model.h5'
+            if not os.path.exists(model_path):
+                print(f"✗ Model not found at {model_path}")
+                return False
+            model = keras.models.load_model(model_path)
+        print(f"✓ Model loaded from {model_path}")
+
+        # Load tokenizer (tokenizer.json, or an older tokenizer.pkl)
+        from preprocessing import load_tokenizer
+
+        tokenizer = load_tokenizer('saved_models')
+        if tokenizer is not None:
             vocab_size = len(tokenizer.word_index) + 1
-            print(f"✓ Tokenizer loaded from {tokenizer_path}")
+            print("✓ Tokenizer loaded from saved_models/")
         else:
-            print(f"✗ Tokenizer not found at {tokenizer_path}")
+            print("✗ Tokenizer not found in saved_models/")
             return False
 
+        # Trace the decoding step now rather than on the first request
+        get_scheduler()
+        print(f"✓ Inference session ready ({inference_engine()} engine)")
+
         return True
     except Exception as e:
         print(f"Error loading model: {e}")
         return False
 
-def generate_text(seed_text, num_words, temperature=1.0):
-    """Generate text using the loaded model"""
+def get_session():
+    """Inference session for the loaded model, rebuilt if the model changed"""
+    global session
+
+    with session_lock:
+        if session is None or session.model is not model or session.tokenizer is not tokenizer:
+            from numpy_engine import NumpyModel, NumpySession
+
+            if isinstance(model, NumpyModel):
+                session = NumpySession(model, tokenizer, SEQUENCE_LENGTH)
+            else:
+                from inference import InferenceSession
+
+                session = InferenceSession(model, tokenizer, SEQUENCE_LENGTH)
+        return session
+
+def get_scheduler():
+    """Micro-batching scheduler over the current inference session"""
+    global scheduler
+
+    current = get_session()
+    with session_lock:
+        if scheduler is None or scheduler.session is not current:
+            from batching import GenerationScheduler
+
+            if scheduler is not None:
+                scheduler.close()
+            scheduler = GenerationScheduler(
+                current,
+                max_batch=GENERATE_MAX_BATCH,
+                max_wait_ms=GENERATE_MAX_WAIT_MS
+            )
+        return scheduler
+
+def generate_text(seed_text, num_words, temperature=1.0, decoding='sample',
+                  top_k=40, top_p=0.9, beam_width=4):
+    """Generate text using the loaded model and a decoding method"""
     global model, tokenizer, SEQUENCE_LENGTH
 
     if model is None or tokenizer is None:
         return "Error: Model not loaded"
 
-    if not TENSORFLOW_AVAILABLE or not NUMPY_AVAILABLE:
-        return "Error: TensorFlow/NumPy not installed"
+    if not NUMPY_AVAILABLE:
+        return "Error: NumPy not installed"
 
     try:
-        from tensorflow.keras.preprocessing.sequence import pad_sequences
-
-        generated_text = seed_text.lower()
-
-        for _ in range(num_words):
-            # Tokenize current text
-            token_list = tokenizer.texts_to_sequences([generated_text])[0]
-
-            # Take last SEQUENCE_LENGTH tokens
-            token_list = token_list[-SEQUENCE_LENGTH:]
-
-            # Pad to model input size
-            token_list = pad_sequences(
-                [token_list],
-                maxlen=SEQUENCE_LENGTH,
-                padding='pre'
-            )
-
-            # Predict next word probabilities
-            predicted_probs = model.predict(token_list, verbose=0)[0]
-
-            # Apply temperature sampling
-            if temperature != 1.0:
-                predicted_probs = np.log(predicted_probs + 1e-10) / temperature
-                predicted_probs = np.exp(predicted_probs)
-                predicted_probs = predicted_probs / np.sum(predicted_probs)
-
-            # Sample from distribution
-            predicted_index = np.random.choice(
-                len(predicted_probs),
-                p=predicted_probs
-            )
-
-            # Convert index to word
-            for word, index in tokenizer.word_index.items():
-                if index == predicted_index:
-                    generated_text += " " + word
-                    break
-
-        return generated_text
+        # Batched with concurrent requests: the seed is read once, then
+        # one LSTM step per generated word
+        return get_scheduler().generate(
+            seed_text, num_words, temperature,
+            decoding=decoding, top_k=top_k, top_p=top_p, beam_width=beam_width
+        )
     except Exception as e:
         return f"Error generating text: {str(e)}"
 
@@ -148,6 +191,36 @@ def index():
     """Render the main page"""
     return render_template('index.html')
 
+def parse_generation_params(data):
+    """Validated generation parameters of one request body or batch item"""
+    params = {
+        'seed_text': data.get('seed_text', 'to be or not to'),
+        'num_words': int(data.get('num_words', 30)),
+        'temperature': float(data.get('temperature', 1.0)),
+        'decoding': data.get('decoding', 'sample'),
+        'top_k': int(data.get('top_k', 40)),
+        'top_p': float(data.get('top_p', 0.9)),
+        'beam_width': int(data.get('beam_width', 4))
+    }
+
+    from decoding import DECODING_METHODS
+
+    if not params['seed_text']:
+        raise ValueError('Seed text is required')
+    if params['num_words'] < 1 or params['num_words'] > 100:
+        raise ValueError('Number of words must be between 1 and 100')
+    if params['temperature'] < 0.1 or params['temperature'] > 2.0:
+        raise ValueError('Temperature must be between 0.1 and 2.0')
+    if params['decoding'] not in DECODING_METHODS:
+        raise ValueError(f"Decoding must be one of: {', '.join(DECODING_METHODS)}")
+    if params['top_k'] < 1 or params['top_k'] > 1000:
+        raise ValueError('top_k must be between 1 and 1000')
+    if params['top_p'] <= 0.0 or params['top_p'] > 1.0:
+        raise ValueError('top_p must be greater than 0 and at most 1')
+    if params['beam_width'] < 1 or params['beam_width'] > 16:
+        raise ValueError('Beam width must be between 1 and 16')
+    return params
+
 @app.route('/api/generate', methods=['POST'])
 def api_generate():
     """API endpoint for text generation"""
@@ -161,34 +234,101 @@ def api_generate():
 
         data = request.get_json()
 
-        seed_text = data.get('seed_text', 'to be or not to')
-        num_words = int(data.get('num_words', 30))
-        temperature = float(data.get('temperature', 1.0))
-
         # Validate inputs
-        if not seed_text:
-            return jsonify({'success': False, 'error': 'Seed text is required'}), 400
-
-        if num_words < 1 or num_words > 100:
-            return jsonify({'success': False, 'error': 'Number of words must be between 1 and 100'}), 400
-
-        if temperature < 0.1 or temperature > 2.0:
-            return jsonify({'success': False, 'error': 'Temperature must be between 0.1 and 2.0'}), 400
+        try:
+            params = parse_generation_params(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
         # Time the generation
         start_time = time.time()
 
         # Generate text
-        result = generate_text(seed_text, num_words, temperature)
+        result = generate_text(**params)
 
         generation_time = time.time() - start_time
 
         return jsonify({
             'success': True,
-            'seed_text': seed_text,
+            'seed_text': params['seed_text'],
             'generated_text': result,
-            'num_words': num_words,
-            'temperature': temperature,
+            'num_words': params['num_words'],
+            'temperature': params['temperature'],
+            'decoding': params['decoding'],
+            'top_k': params['top_k'],
+            'top_p': params['top_p'],
+            'beam_width': params['beam_width'],
+            'generation_time': f"{generation_time:.3f}s",
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/generate/batch', methods=['POST'])
+def api_generate_batch():
+    """Generate n completions for each of several seeds in one batch"""
+    try:
+        if model is None or tokenizer is None:
+            return jsonify({
+                'success': False,
+                'error': 'Model not loaded. Please train a model first using the Train Model tab.'
+            }), 503
+
+        data = request.get_json()
+        items = data.get('items', [])
+
+        # Validate inputs
+        if not items:
+            return jsonify({'success': False, 'error': 'At least one item is required'}), 400
+
+        try:
+            item_params = [parse_generation_params(item) for item in items]
+            counts = [int(item.get('n', 1)) for item in items]
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        if min(counts) < 1 or max(counts) > 16:
+            return jsonify({'success': False, 'error': 'n must be between 1 and 16'}), 400
+
+        if sum(counts) > GENERATE_BATCH_MAX_SEQUENCES:
+            return jsonify({
+                'success': False,
+                'error': f'At most {GENERATE_BATCH_MAX_SEQUENCES} sequences per batch'
+            }), 400
+
+        # Returned so an unseeded batch can be replayed
+        seed = data.get('seed')
+        seed = int(seed) if seed is not None else int(np.random.randint(2**31))
+
+        from batching import generate_batch
+
+        # One row per completion, all run as a single batch
+        requests = [params for params, n in zip(item_params, counts) for _ in range(n)]
+        start_time = time.time()
+        outputs = generate_batch(get_session(), requests, seed=seed)
+        generation_time = time.time() - start_time
+
+        results = []
+        for params, n in zip(item_params, counts):
+            rows, outputs = outputs[:n], outputs[n:]
+            item_time = max(row['time_s'] for row in rows)
+            results.append(dict(
+                params,
+                n=n,
+                generated_texts=[row['generated_text'] for row in rows],
+                words=sum(row['words'] for row in rows),
+                generation_time=f"{item_time:.3f}s"
+            ))
+
+        total_words = sum(result['words'] for result in results)
+        return jsonify({
+            'success': True,
+            'results': results,
+            'seed': seed,
+            'sequences': len(requests),
+            'words': total_words,
+            'words_per_sec': total_words / generation_time if generation_time else 0.0,
             'generation_time': f"{generation_time:.3f}s",
             'timestamp': datetime.now().isoformat()
         })
@@ -240,9 +380,18 @@ def api_status():
         'embedding_type': embedding_type,
         'embedding_dim': embedding_dim,
         'tensorflow_available': TENSORFLOW_AVAILABLE,
-        'numpy_available': NUMPY_AVAILABLE
+        'numpy_available': NUMPY_AVAILABLE,
+        'inference_engine': inference_engine()
     })
 
+@app.route('/api/generate/stats', methods=['GET'])
+def api_generate_stats():
+    """Queue and batch-size statistics of the generation scheduler"""
+    if scheduler is None:
+        return jsonify({'success': False, 'error': 'No generation requests served yet'}), 404
+
+    return jsonify({'success': True, 'stats': scheduler.stats()})
+
 @app.route('/api/health', methods=['GET'])
 def api_health():
     """Health check endpoint"""
@@ -252,6 +401,9 @@ def api_health():
         'model_ready': model is not None and tokenizer is not None
     })
 
+class TrainingStopped(Exception):
+    """Raised between pipeline stages when a stop was requested"""
+
 def train_model_background(config):
     """Background training function"""
     global training_state, model, tokenizer
@@ -265,34 +417,20 @@ def train_model_background(config):
         # Create trainer with config
         trainer = RNNTrainer(config)
 
-        training_state['status'] = 'downloading'
-        training_state['logs'].append('Downloading dataset...')
-        raw_text = trainer.download_data()
-
-        if training_state['should_stop']:
-            training_state['status'] = 'stopped'
-            return
-
-        training_state['status'] = 'preprocessing'
-        training_state['logs'].append('Preprocessing text...')
-        cleaned_text = trainer.clean_text(raw_text)
-        trainer.create_tokenizer(cleaned_text)
-        sequences = trainer.create_sequences(cleaned_text)
-        X, y = trainer.prepare_data(sequences)
+        stage_logs = {
+            'downloading': 'Downloading dataset...',
+            'preprocessing': 'Preprocessing text...',
+            'loading_embeddings': 'Loading embeddings...'
+        }
 
-        if training_state['should_stop']:
-            training_state['status'] = 'stopped'
-            return
+        def on_stage(stage):
+            if training_state['should_stop']:
+                raise TrainingStopped()
+            training_state['status'] = stage
+            training_state['logs'].append(stage_logs[stage])
 
-        training_state['status'] = 'loading_embeddings'
-        training_state['logs'].append('Loading embeddings...')
-        embeddings = trainer.load_embeddings([
-            'glove.2024.dolma.300d/dolma_300_2024_1.2M.100_combined.txt',
-            'dolma_300_2024_1.2M.100_combined.txt',
-            'glove/glove.6B.300d.txt',
-            'glove.6B.300d.txt'
-        ])
-        trainer.create_embedding_matrix(embeddings)
+        # Shared with train_model.py; stages with cached outputs are skipped
+        X, y = trainer.prepare_training_data(on_stage=on_stage)
 
         if training_state['should_stop']:
             training_state['status'] = 'stopped'
@@ -310,29 +448,39 @@ def train_model_background(config):
         training_state['total_epochs'] = config['epochs']
         training_state['logs'].append(f'Training started with {config["epochs"]} epochs...')
 
+        from tensorflow import keras
+
         # Custom callback to update progress
-        class ProgressCallback:
+        class ProgressCallback(keras.callbacks.Callback):
             def __init__(self):
+                super().__init__()
                 self.epoch = 0
 
             def on_epoch_end(self, epoch, logs=None):
                 if training_state['should_stop']:
-                    trainer.model.stop_training = True
+                    self.model.stop_training = True
                     return
 
                 self.epoch = epoch + 1
                 training_state['current_epoch'] = self.epoch
                 training_state['progress'] = (self.epoch / training_state['total_epochs']) * 100
-                training_state['loss'] = logs.get('loss', 0)
-                training_state['accuracy'] = logs.get('accuracy', 0)
+                training_state['loss'] = float(logs.get('loss', 0))
+                training_state['accuracy'] = float(logs.get('accuracy', 0))
                 training_state['logs'].append(
                     f"Epoch {self.epoch}/{training_state['total_epochs']} - "
                     f"loss: {logs.get('loss', 0):.4f} - "
                     f"accuracy: {logs.get('accuracy', 0):.4f}"
                 )
 
+        def on_telemetry(record):
+            training_state['throughput'] = record
+
         # Train model
-        history = trainer.train(X, y)
+        history = trainer.train(
+            X, y,
+            callbacks=[ProgressCallback()],
+            on_telemetry=on_telemetry
+        )
 
         if training_state['should_stop']:
             training_state['status'] = 'stopped'
@@ -349,6 +497,8 @@ def train_model_background(config):
         # Reload the model
         load_model_and_tokenizer()
 
+    except TrainingStopped:
+        training_state['status'] = 'stopped'
     except Exception as e:
         training_state['status'] = 'failed'
         training_state['logs'].append(f'Error: {str(e)}')
@@ -369,13 +519,35 @@ def api_training_start():
 
     try:
         data = request.get_json()
+        training_mode = data.get('training_mode', 'windows')
+        if training_mode not in ('windows', 'tbptt'):
+            raise ValueError("training_mode must be 'windows' or 'tbptt'")
+        resume = bool(data.get('resume', False))
+        checkpoint_minutes = data.get('checkpoint_minutes')
+        if training_mode == 'tbptt' and (resume or checkpoint_minutes is not None):
+            raise ValueError(
+                "Step checkpoints and resume need training_mode='windows'; "
+                "TBPTT runs can't be resumed"
+            )
+        if checkpoint_minutes is None and resume:
+            # A resumed run keeps checkpointing so it can resume again
+            checkpoint_minutes = 10
 
         config = {
             'epochs': int(data.get('epochs', 50)),
             'batch_size': int(data.get('batch_size', 128)),
             'lstm_units': int(data.get('lstm_units', 256)),
             'embedding_dim': int(data.get('embedding_dim', 300)),
-            'learning_rate': float(data.get('learning_rate', 0.001))
+            'learning_rate': float(data.get('learning_rate', 0.001)),
+            'training_mode': training_mode,
+            # Periodic checkpoints, so a crashed or stopped run can resume;
+            # off unless the request asks for them
+            'checkpoint_every_minutes': (
+                float(checkpoint_minutes) if checkpoint_minutes is not None else None
+            ),
+            # Batches between throughput samples (0 turns telemetry off)
+            'telemetry_every_batches': int(data.get('telemetry_every', 50)),
+            'resume': resume
         }
 
         # Reset training state
@@ -388,6 +560,7 @@ def api_training_start():
             'loss': 0,
             'accuracy': 0,
             'logs': [],
+            'throughput': None,
             'should_stop': False
         }
 
@@ -402,6 +575,11 @@ def api_training_start():
             'config': config
         })
 
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -424,6 +602,7 @@ def api_training_status():
         'total_epochs': training_state['total_epochs'],
         'loss': training_state['loss'],
         'accuracy': training_state['accuracy'],
+        'throughput': training_state['throughput'],
         'logs': recent_logs
     })
 
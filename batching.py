@@ -0,0 +1,311 @@
+"""
+Dynamic micro-batching for text generation
+GenerationScheduler serves concurrent generation requests from one worker
+thread: requests queue up, join the running batch between decoding steps,
+and every step advances all active sequences with a single batched
+forward call. Finished sequences leave the batch and resolve their future.
+Beam search requests batch their own beams and run outside the queue.
+generate_batch() runs one client's whole batch of seeds and samples
+together with its own, optionally seeded, random generator.
+"""
+
+import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+from decoding import pick_tokens, beam_search
+
+
+class _Sequence:
+    """One generation request while it is queued or in the batch"""
+
+    def __init__(self, seed_text, num_words, temperature, decoding, top_k, top_p):
+        self.seed_text = seed_text
+        self.remaining = num_words
+        self.temperature = temperature
+        # Rows sharing a key are picked together in one vectorized call
+        self.decoding = (decoding, top_k, top_p)
+        self.ids = []
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.finished = None
+
+    def text(self, id_to_word):
+        return ' '.join([self.seed_text.lower()] + list(id_to_word[self.ids]))
+
+
+def _prime(session, sequences):
+    """Next-token probabilities and states after reading each seed"""
+    windows = session.seed_windows([s.seed_text for s in sequences])
+    zeros = np.zeros((len(sequences), session.units), dtype=np.float32)
+    return session.forward(windows, zeros, zeros)
+
+
+def _advance(session, sequences, probs, h, c, rng=None):
+    """Pick a token for every row and step the rows that continue in place
+
+    Rows are grouped by decoding settings so each group is picked in one
+    vectorized call; returns the rows still unfinished afterwards.
+    """
+    groups = {}
+    for row, sequence in enumerate(sequences):
+        groups.setdefault(sequence.decoding, []).append(row)
+    ids = np.empty(len(sequences), dtype=np.int64)
+    for (decoding, top_k, top_p), rows in groups.items():
+        temperatures = [sequences[row].temperature for row in rows]
+        ids[rows] = pick_tokens(
+            probs[rows], decoding, temperatures, top_k, top_p, rng
+        )
+
+    advance = []
+    for row, (sequence, index) in enumerate(zip(sequences, ids)):
+        sequence.remaining -= 1
+        # Padding id: nothing to emit and the state stays as it is
+        if session.id_to_word[index]:
+            sequence.ids.append(int(index))
+            if sequence.remaining > 0:
+                advance.append(row)
+
+    if advance:
+        probs[advance], h[advance], c[advance] = session.forward(
+            ids[advance].reshape(-1, 1), h[advance], c[advance]
+        )
+
+    now = time.perf_counter()
+    keep = []
+    for row, sequence in enumerate(sequences):
+        if sequence.remaining > 0:
+            keep.append(row)
+        else:
+            sequence.finished = now
+    return keep
+
+
+def generate_batch(session, requests, seed=None):
+    """Generate every request as one batch; returns one result per request
+
+    requests are dicts of generate() arguments (seed_text, num_words,
+    temperature, decoding, top_k, top_p, beam_width). Seeds are
+    pre-padded to the model window and read in one forward call; each
+    step then advances all unfinished rows together, so a batch costs
+    about as many forward calls as its longest request. Sampling draws
+    from a generator seeded with seed, so the same batch and seed give
+    the same text. Beam requests are decoded after the batch, each with
+    its own batch of beams.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    sequences = [
+        _Sequence(
+            r['seed_text'], r['num_words'], r.get('temperature', 1.0),
+            r.get('decoding', 'sample'), r.get('top_k', 40), r.get('top_p', 0.9)
+        )
+        for r in requests
+    ]
+
+    active = [s for s in sequences if s.remaining > 0 and s.decoding[0] != 'beam']
+    if active:
+        probs, h, c = _prime(session, active)
+    while active:
+        keep = _advance(session, active, probs, h, c, rng)
+        active = [active[row] for row in keep]
+        probs, h, c = probs[keep], h[keep], c[keep]
+
+    results = []
+    for request, sequence in zip(requests, sequences):
+        if sequence.decoding[0] == 'beam':
+            text = beam_search(
+                session, sequence.seed_text, sequence.remaining,
+                request.get('beam_width', 4)
+            )
+            words = sequence.remaining
+            sequence.finished = time.perf_counter()
+        else:
+            text = sequence.text(session.id_to_word)
+            words = len(sequence.ids)
+        results.append({
+            'generated_text': text,
+            'words': words,
+            'time_s': (sequence.finished or start) - start
+        })
+    return results
+
+
+class GenerationScheduler:
+    """Batch concurrent generate() calls on one InferenceSession
+
+    When idle, the worker waits for a first request and then up to
+    max_wait_ms for more (or until max_batch are queued) so they are
+    primed together. While sequences are active, queued requests join
+    between steps without waiting. Each step picks one token per row
+    (grouping rows by decoding method), runs one forward call for the rows that continue and routes the ids
+    back to their sequences.
+    """
+
+    def __init__(self, session, max_batch=16, max_wait_ms=2.0):
+        self.session = session
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._active = []
+        self._probs = None
+        self._h = None
+        self._c = None
+
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._steps = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._max_queued = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, seed_text, num_words, temperature=1.0, decoding='sample',
+               top_k=40, top_p=0.9, beam_width=4):
+        """Queue a request; returns a Future resolving to the generated text"""
+        if decoding == 'beam':
+            # Already a batch of beam_width rows; decoded in the caller
+            future = Future()
+            try:
+                future.set_result(
+                    beam_search(self.session, seed_text, num_words, beam_width)
+                )
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        sequence = _Sequence(seed_text, num_words, temperature, decoding, top_k, top_p)
+        self._queue.put(sequence)
+        with self._stats_lock:
+            self._max_queued = max(self._max_queued, self._queue.qsize())
+        return sequence.future
+
+    def generate(self, seed_text, num_words, temperature=1.0, **decoding):
+        """Seed text followed by num_words generated words (blocking)"""
+        return self.submit(seed_text, num_words, temperature, **decoding).result()
+
+    def close(self):
+        """Stop the worker after the requests already queued"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        """Request, queue and batch-size statistics since start"""
+        with self._stats_lock:
+            steps = self._steps
+            rows = sum(size * n for size, n in self._batch_sizes.items())
+            return {
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000,
+                'requests': self._requests,
+                'active': len(self._active),
+                'queued': self._queue.qsize(),
+                'max_queued': self._max_queued,
+                'mean_queue_wait_ms': (
+                    self._queue_wait_total / self._requests * 1000
+                    if self._requests else 0.0
+                ),
+                'max_queue_wait_ms': self._queue_wait_max * 1000,
+                'steps': steps,
+                'mean_batch_size': rows / steps if steps else 0.0,
+                'batch_sizes': {
+                    str(size): n for size, n in sorted(self._batch_sizes.items())
+                }
+            }
+
+    def _gather(self):
+        """Queued requests that fit in the batch; waits only when idle"""
+        room = self.max_batch - len(self._active)
+        joining = []
+        if not self._active:
+            joining.append(self._queue.get())
+            deadline = time.perf_counter() + self.max_wait
+            while joining[-1] is not None and len(joining) < room:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    joining.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+        while joining[-1:] != [None] and len(joining) < room:
+            try:
+                joining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return joining
+
+    def _join(self, sequences):
+        """Read the seeds of new sequences and add them to the batch"""
+        now = time.perf_counter()
+        with self._stats_lock:
+            for sequence in sequences:
+                wait = now - sequence.submitted
+                self._queue_wait_total += wait
+                self._queue_wait_max = max(self._queue_wait_max, wait)
+                self._requests += 1
+
+        started = []
+        for sequence in sequences:
+            if sequence.remaining <= 0:
+                sequence.future.set_result(sequence.text(self.session.id_to_word))
+            elif sequence.future.set_running_or_notify_cancel():
+                started.append(sequence)
+        if not started:
+            return
+
+        probs, h, c = _prime(self.session, started)
+
+        if self._active:
+            probs = np.concatenate([self._probs, probs])
+            h = np.concatenate([self._h, h])
+            c = np.concatenate([self._c, c])
+        self._active += started
+        self._probs, self._h, self._c = probs, h, c
+
+    def _step(self):
+        """Pick a token for every row and advance the rows that continue"""
+        keep = _advance(self.session, self._active, self._probs, self._h, self._c)
+
+        with self._stats_lock:
+            self._steps += 1
+            self._batch_sizes[len(self._active)] += 1
+
+        for sequence in self._active:
+            if sequence.remaining <= 0:
+                sequence.future.set_result(sequence.text(self.session.id_to_word))
+        self._active = [self._active[row] for row in keep]
+        self._probs = self._probs[keep]
+        self._h = self._h[keep]
+        self._c = self._c[keep]
+
+    def _fail(self, sequences, error):
+        for sequence in sequences:
+            if not sequence.future.done():
+                sequence.future.set_exception(error)
+
+    def _run(self):
+        closing = False
+        while not closing or self._active:
+            joining = [] if closing else self._gather()
+            if None in joining:
+                closing = True
+                joining.remove(None)
+
+            try:
+                if joining:
+                    self._join(joining)
+                if self._active:
+                    self._step()
+            except Exception as e:
+                # Fail the affected requests and keep serving the rest
+                self._fail(joining + self._active, e)
+                self._active = []
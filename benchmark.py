@@ -0,0 +1,405 @@
+"""
+Benchmarks for the training and serving hot paths
+Builds a synthetic corpus, tokenizer, embedding file and a tiny model
+offline, times preprocessing, one training epoch and generate_text, and
+writes the results as JSON. With --baseline, results are compared against
+a stored run and regressions make the script exit non-zero.
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TF warnings
+
+import io
+import sys
+import json
+import time
+import shutil
+import string
+import platform
+import argparse
+import tempfile
+import itertools
+import contextlib
+from datetime import datetime
+
+import numpy as np
+
+# Slower than baseline by more than this fraction (and by more than
+# MIN_REGRESSION_SECONDS) counts as a regression
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.001
+
+BENCHMARK_CONFIG = {
+    'sequence_length': 50,
+    'embedding_dim': 50,
+    'lstm_units': 64,
+    'dense_units': 32,
+    'batch_size': 128,
+    'epochs': 1,
+    'use_cache': False,
+    'telemetry_every_batches': 0,
+}
+
+# Decoding methods timed by bench_generation
+DECODERS = [
+    ('greedy', {'decoding': 'greedy'}),
+    ('top_k=40', {'decoding': 'top_k', 'top_k': 40}),
+    ('top_p=0.9', {'decoding': 'top_p', 'top_p': 0.9}),
+    ('beam=8', {'decoding': 'beam', 'beam_width': 8})
+]
+
+
+def synthetic_words(n):
+    """n distinct lowercase pseudo-words that survive clean_text"""
+    words = []
+    for length in itertools.count(2):
+        for letters in itertools.product(string.ascii_lowercase, repeat=length):
+            words.append(''.join(letters))
+            if len(words) == n:
+                return words
+
+
+def synthetic_corpus(vocab_size, n_tokens, seed=0):
+    """Zipf-distributed text over vocab_size words, in lines of 12"""
+    rng = np.random.default_rng(seed)
+    words = np.array(synthetic_words(vocab_size))
+    ranks = np.arange(1, vocab_size + 1)
+    probs = 1.0 / ranks
+    ids = rng.choice(vocab_size, size=n_tokens, p=probs / probs.sum())
+    tokens = words[ids]
+    lines = [' '.join(tokens[i:i + 12]) for i in range(0, n_tokens, 12)]
+    return '\n'.join(lines) + '\n'
+
+
+def write_embedding_file(path, words, dim, seed=0):
+    """GloVe-format text file with a random vector per word"""
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        for word in words:
+            vector = ' '.join(f'{x:.5f}' for x in rng.standard_normal(dim))
+            f.write(f'{word} {vector}\n')
+
+
+def time_call(fn, repeats=3, warmup=1):
+    """Wall-clock seconds of fn() over `repeats` runs after `warmup` runs"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        'median_s': float(np.median(times)),
+        'min_s': float(np.min(times)),
+        'mean_s': float(np.mean(times)),
+        'runs': repeats
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the progress prints of the code under test"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def make_trainer(work_dir, vocab_size, **overrides):
+    from train_model import RNNTrainer
+
+    config = dict(
+        BENCHMARK_CONFIG,
+        max_vocab_size=vocab_size,
+        data_dir=os.path.join(work_dir, 'data'),
+        model_dir=os.path.join(work_dir, 'models'),
+        **overrides
+    )
+    with quiet():
+        return RNNTrainer(config)
+
+
+def bench_preprocessing(results, work_dir, vocab_size, n_tokens, repeats):
+    """clean_text, create_sequences, prepare_data and _load_embedding_file"""
+    trainer = make_trainer(work_dir, vocab_size)
+    raw = synthetic_corpus(vocab_size, n_tokens)
+    tag = f"vocab={vocab_size},tokens={n_tokens}"
+
+    with quiet():
+        text = trainer.clean_text(raw)
+        trainer.create_tokenizer(text)
+        sequences = trainer.create_sequences(text)
+
+        results[f'clean_text[{tag}]'] = time_call(
+            lambda: trainer.clean_text(raw), repeats
+        )
+        results[f'create_sequences[{tag}]'] = time_call(
+            lambda: trainer.create_sequences(text), repeats
+        )
+        results[f'prepare_data[{tag}]'] = time_call(
+            lambda: trainer.prepare_data(sequences), repeats
+        )
+
+        embedding_path = os.path.join(work_dir, f'embeddings_{vocab_size}.txt')
+        write_embedding_file(
+            embedding_path,
+            synthetic_words(vocab_size),
+            trainer.config['embedding_dim']
+        )
+        # Text parse of the vocabulary rows, then the warm binary copy
+        trainer.config['embedding_binary_cache'] = False
+        results[f'load_embedding_file[parse,vocab={vocab_size}]'] = time_call(
+            lambda: trainer._load_embedding_file(embedding_path), repeats
+        )
+        trainer.config['embedding_binary_cache'] = True
+        results[f'load_embedding_file[binary,vocab={vocab_size}]'] = time_call(
+            lambda: trainer._load_embedding_file(embedding_path), repeats
+        )
+
+
+def bench_training(results, work_dir, vocab_size, n_tokens, repeats):
+    """One epoch of RNNTrainer.train on the synthetic corpus"""
+    trainer = make_trainer(work_dir, vocab_size)
+    raw = synthetic_corpus(vocab_size, n_tokens, seed=1)
+
+    with quiet():
+        text = trainer.clean_text(raw)
+        trainer.create_tokenizer(text)
+        X, y = trainer.prepare_data(trainer.create_sequences(text))
+        trainer.create_embedding_matrix(None)
+        trainer.build_model()
+
+        # The warm-up epoch includes tracing the train step
+        timing = time_call(lambda: trainer.train(X, y), repeats)
+
+    timing['samples_per_sec'] = len(X) / timing['median_s']
+    results[f'train_epoch[vocab={vocab_size},samples={len(X)}]'] = timing
+
+
+def bench_generation(results, work_dir, vocab_size, num_words_list, repeats):
+    """app.generate_text latency per generated word"""
+    import app
+
+    trainer = make_trainer(work_dir, vocab_size)
+    raw = synthetic_corpus(vocab_size, max(20 * vocab_size, 20000), seed=2)
+    with quiet():
+        trainer.create_tokenizer(trainer.clean_text(raw))
+        trainer.create_embedding_matrix(None)
+        model = trainer.build_model()
+    model.build((None, trainer.config['sequence_length']))
+
+    app.model = model
+    app.tokenizer = trainer.tokenizer
+    app.SEQUENCE_LENGTH = trainer.config['sequence_length']
+    seed_text = ' '.join(synthetic_words(8))
+
+    for num_words in num_words_list:
+        np.random.seed(0)
+        timing = time_call(
+            lambda: app.generate_text(seed_text, num_words), repeats
+        )
+        timing['per_word_ms'] = timing['median_s'] / num_words * 1000
+        results[f'generate_text[vocab={vocab_size},num_words={num_words}]'] = timing
+
+    # Decoding methods at the longest length; beam 8 vs greedy shows what
+    # batching the beams saves
+    num_words = max(num_words_list)
+    for name, options in DECODERS:
+        np.random.seed(0)
+        timing = time_call(
+            lambda: app.generate_text(seed_text, num_words, **options), repeats
+        )
+        timing['per_word_ms'] = timing['median_s'] / num_words * 1000
+        results[f'decode[{name},vocab={vocab_size},num_words={num_words}]'] = timing
+
+
+def environment():
+    import tensorflow as tf
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'tensorflow': tf.__version__,
+        'numpy': np.__version__
+    }
+
+
+def run_benchmarks(vocab_sizes=(1000, 10000), num_words=(1, 10, 30),
+                   corpus_tokens=200000, train_tokens=30000, repeats=3,
+                   only=None):
+    """Run every benchmark group (or those in `only`) and return the report"""
+    groups = only or ['preprocessing', 'training', 'generation']
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix='rnn-bench-')
+    try:
+        for vocab_size in vocab_sizes:
+            if 'preprocessing' in groups:
+                print(f"  preprocessing (vocab {vocab_size:,})...")
+                bench_preprocessing(
+                    results, work_dir, vocab_size, corpus_tokens, repeats
+                )
+            if 'training' in groups:
+                print(f"  training epoch (vocab {vocab_size:,})...")
+                bench_training(
+                    results, work_dir, vocab_size, train_tokens, repeats
+                )
+            if 'generation' in groups:
+                print(f"  generate_text (vocab {vocab_size:,})...")
+                bench_generation(
+                    results, work_dir, vocab_size, num_words, repeats
+                )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {'environment': environment(), 'results': results}
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Median-time ratios against a baseline report; returns the regressions"""
+    rows, regressions = [], []
+    for name, current in report['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        ratio = current['median_s'] / previous['median_s']
+        slower = current['median_s'] - previous['median_s']
+        regressed = ratio > 1 + tolerance and slower > MIN_REGRESSION_SECONDS
+        row = {
+            'name': name,
+            'baseline_s': previous['median_s'],
+            'current_s': current['median_s'],
+            'ratio': ratio,
+            'regression': regressed
+        }
+        rows.append(row)
+        if regressed:
+            regressions.append(row)
+    return rows, regressions
+
+
+def print_results(report, rows=None):
+    print(f"\n{'benchmark':<58} {'median':>10} {'min':>10}")
+    for name, timing in report['results'].items():
+        print(f"{name:<58} {timing['median_s'] * 1000:>8.2f}ms "
+              f"{timing['min_s'] * 1000:>8.2f}ms")
+
+    if rows:
+        print(f"\n{'benchmark':<58} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        for row in rows:
+            flag = '  ⚠️  REGRESSION' if row['regression'] else ''
+            print(f"{row['name']:<58} {row['baseline_s'] * 1000:>8.2f}ms "
+                  f"{row['current_s'] * 1000:>8.2f}ms {row['ratio']:>6.2f}x{flag}")
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark preprocessing, training and generation on '
+                    'synthetic offline data'
+    )
+    parser.add_argument(
+        '--output',
+        default='benchmark_results.json',
+        help='Where to write the results (default: benchmark_results.json)'
+    )
+    parser.add_argument(
+        '--baseline',
+        default=None,
+        help='Results file to compare against; exits with status 1 on a '
+             'regression'
+    )
+    parser.add_argument(
+        '--save-baseline',
+        default=None,
+        help='Also write the results to this baseline file'
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help='Allowed slowdown vs the baseline as a fraction '
+             f'(default: {DEFAULT_TOLERANCE})'
+    )
+    parser.add_argument(
+        '--only',
+        nargs='+',
+        choices=['preprocessing', 'training', 'generation'],
+        default=None,
+        help='Run only these benchmark groups'
+    )
+    parser.add_argument(
+        '--vocab-sizes',
+        type=int,
+        nargs='+',
+        default=[1000, 10000],
+        help='Vocabulary sizes to benchmark (default: 1000 10000)'
+    )
+    parser.add_argument(
+        '--num-words',
+        type=int,
+        nargs='+',
+        default=[1, 10, 30],
+        help='generate_text lengths to time (default: 1 10 30)'
+    )
+    parser.add_argument(
+        '--repeats',
+        type=int,
+        default=3,
+        help='Timed runs per benchmark after one warm-up run (default: 3)'
+    )
+    parser.add_argument(
+        '--quick',
+        action='store_true',
+        help='Smaller corpora and a single repeat, for a fast sanity run'
+    )
+
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("BENCHMARKS")
+    print("="*60)
+
+    report = run_benchmarks(
+        vocab_sizes=args.vocab_sizes,
+        num_words=args.num_words,
+        corpus_tokens=20000 if args.quick else 200000,
+        train_tokens=5000 if args.quick else 30000,
+        repeats=1 if args.quick else args.repeats,
+        only=args.only
+    )
+
+    rows, regressions = None, []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        rows, regressions = compare(report, baseline, args.tolerance)
+        report['baseline'] = {
+            'path': args.baseline,
+            'environment': baseline.get('environment'),
+            'tolerance': args.tolerance,
+            'comparison': rows
+        }
+        env, base_env = report['environment'], baseline.get('environment', {})
+        for key in ('cpu_count', 'tensorflow', 'numpy'):
+            if base_env.get(key) != env[key]:
+                print(f"⚠️  Baseline {key} differs: {base_env.get(key)} vs {env[key]}")
+
+    print_results(report, rows)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results saved: {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({k: report[k] for k in ('environment', 'results')}, f, indent=2)
+        print(f"✓ Baseline saved: {args.save_baseline}")
+
+    if regressions:
+        print(f"\n⚠️  {len(regressions)} regression(s) beyond "
+              f"{args.tolerance:.0%} of the baseline")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Rotating training checkpoints written on a background thread
+A checkpoint is an .npz of arrays plus a .json of metadata; the JSON is
+written last, so its presence marks a complete checkpoint
+"""
+
+import os
+import glob
+import json
+import queue
+import threading
+
+import numpy as np
+
+
+def checkpoint_prefixes(directory):
+    """Complete checkpoints in a directory, oldest first"""
+    prefixes = []
+    for meta_path in glob.glob(os.path.join(directory, 'ckpt-*.json')):
+        prefix = meta_path[:-len('.json')]
+        if os.path.exists(f"{prefix}.npz"):
+            prefixes.append(prefix)
+    return sorted(prefixes)
+
+
+def latest_checkpoint(directory):
+    """Prefix of the newest complete checkpoint, or None"""
+    prefixes = checkpoint_prefixes(directory)
+    return prefixes[-1] if prefixes else None
+
+
+def load_checkpoint(prefix):
+    """Arrays and metadata of a checkpoint"""
+    with open(f"{prefix}.json", 'r') as f:
+        meta = json.load(f)
+    with np.load(f"{prefix}.npz") as data:
+        arrays = {name: data[name] for name in data.files}
+    return arrays, meta
+
+
+def _write_synced(path, write):
+    """Write through a temp file, fsync it and move it into place"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_checkpoint(prefix, arrays, meta):
+    """Write one checkpoint; it only counts once its JSON exists"""
+    _write_synced(f"{prefix}.npz", lambda f: np.savez(f, **arrays))
+    _write_synced(
+        f"{prefix}.json",
+        lambda f: f.write(json.dumps(meta, indent=2).encode('utf-8'))
+    )
+
+
+def rotate_checkpoints(directory, keep):
+    """Delete all but the newest `keep` checkpoints"""
+    removed = checkpoint_prefixes(directory)[:-keep] if keep else []
+    for prefix in removed:
+        # JSON first, so a half-deleted checkpoint is never picked up
+        for ext in ('json', 'npz'):
+            try:
+                os.remove(f"{prefix}.{ext}")
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+class CheckpointWriter:
+    """Writes checkpoints on a background thread, one write in flight
+
+    submit() only hands over arrays that are already host copies, so the
+    training loop waits on disk I/O only if the previous checkpoint is
+    still being written.
+    """
+
+    def __init__(self, directory, keep=3):
+        self.directory = directory
+        self.keep = keep
+        self.last_path = None
+        self._error = None
+        self._queue = queue.Queue(maxsize=1)
+        os.makedirs(directory, exist_ok=True)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            step, arrays, meta = item
+            try:
+                prefix = os.path.join(self.directory, f"ckpt-{step:010d}")
+                write_checkpoint(prefix, arrays, meta)
+                rotate_checkpoints(self.directory, self.keep)
+                self.last_path = prefix
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"Checkpoint write failed: {error}") from error
+
+    def submit(self, step, arrays, meta):
+        """Queue a checkpoint for writing"""
+        self._raise_error()
+        self._queue.put((step, arrays, meta))
+
+    def flush(self):
+        """Wait until every queued checkpoint is on disk"""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Flush and stop the writer thread"""
+        self._queue.join()
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
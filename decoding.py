@@ -0,0 +1,127 @@
+"""
+Decoding strategies for next-word generation
+Token pickers (sample, greedy, top-k, top-p) choose one id per row of
+next-token probabilities, vectorized over rows and working on partial
+sorts of the vocabulary. beam_search expands every beam of a request in
+one batched forward call. Only NumPy is needed; any session with
+seed_windows(), forward() and id_to_word can drive them.
+"""
+
+import numpy as np
+
+DECODING_METHODS = ('sample', 'greedy', 'top_k', 'top_p', 'beam')
+
+# Candidates taken per row before top-p widens its partial sort
+NUCLEUS_CANDIDATES = 256
+
+
+def apply_temperature(probs, temperature):
+    """Rescale rows of probabilities by a scalar or per-row temperature"""
+    temperature = np.asarray(temperature, dtype=np.float64).reshape(-1, 1)
+    if not (temperature != 1.0).any():
+        return probs
+    logits = np.log(probs + 1e-10) / temperature
+    return np.exp(logits - logits.max(axis=1, keepdims=True))
+
+
+def sample_tokens(probs, temperature=1.0, rng=None):
+    """Draw one token id per row of next-token probabilities at a temperature
+
+    Temperature (a scalar or one per row) rescales log-probabilities; the
+    draw is an inverse-CDF lookup, vectorized over rows. rng defaults to
+    the global NumPy state.
+    """
+    rng = rng or np.random
+    probs = np.atleast_2d(np.asarray(probs, dtype=np.float64))
+    probs = apply_temperature(probs, temperature)
+    cdf = np.cumsum(probs, axis=1)
+    draws = rng.random((len(cdf), 1)) * cdf[:, -1:]
+    ids = (cdf <= draws).sum(axis=1)
+    return np.minimum(ids, cdf.shape[1] - 1)
+
+
+def top_k_candidates(probs, k):
+    """Ids and probabilities of the k most likely tokens per row, unordered"""
+    k = min(k, probs.shape[1])
+    ids = np.argpartition(probs, probs.shape[1] - k, axis=1)[:, -k:]
+    return ids, np.take_along_axis(probs, ids, axis=1)
+
+
+def top_p_candidates(probs, p):
+    """Smallest most-likely token set per row whose mass reaches p
+
+    Sorts only the top NUCLEUS_CANDIDATES of each row, widening the
+    partial sort for rows whose nucleus doesn't fit. Tokens outside a
+    row's nucleus get probability 0.
+    """
+    vocab = probs.shape[1]
+    total = probs.sum(axis=1, keepdims=True)
+    k = min(vocab, NUCLEUS_CANDIDATES)
+    while True:
+        ids, values = top_k_candidates(probs, k)
+        order = np.argsort(-values, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+        mass = np.cumsum(values, axis=1) / total
+        if k == vocab or (mass[:, -1] >= p).all():
+            break
+        k = min(vocab, k * 4)
+
+    # Keep every token whose preceding mass is still below p
+    keep = (mass - values / total) < p
+    return ids, np.where(keep, values, 0.0)
+
+
+def pick_tokens(probs, method='sample', temperature=1.0, top_k=40,
+                top_p=0.9, rng=None):
+    """One next-token id per row of probabilities under a decoding method"""
+    probs = np.atleast_2d(np.asarray(probs, dtype=np.float64))
+    if method == 'greedy':
+        return probs.argmax(axis=1)
+    if method == 'sample':
+        return sample_tokens(probs, temperature, rng)
+    if method == 'top_k':
+        # Temperature keeps the order, so it only needs the k candidates
+        ids, values = top_k_candidates(probs, top_k)
+    elif method == 'top_p':
+        ids, values = top_p_candidates(apply_temperature(probs, temperature), top_p)
+        temperature = 1.0
+    else:
+        raise ValueError(f"Unknown decoding method: {method}")
+
+    picked = sample_tokens(values, temperature, rng)
+    return ids[np.arange(len(ids)), picked]
+
+
+def beam_search(session, seed_text, num_words, beam_width=4):
+    """Most likely num_words continuation under a beam of beam_width
+
+    Every step takes each beam's beam_width best extensions with a
+    partial sort (the overall best can only come from these), keeps the
+    best beam_width of the candidates and advances the surviving beams in
+    one batched forward call. The padding id is never extended, since it
+    has no word.
+    """
+    windows = session.seed_windows([seed_text])
+    zeros = np.zeros((1, session.units), dtype=np.float32)
+    probs, h, c = session.forward(windows, zeros, zeros)
+
+    scores = np.zeros(1)
+    history = np.zeros((1, 0), dtype=np.int64)
+    for step in range(num_words):
+        probs = probs.astype(np.float64)
+        probs[:, 0] = -1.0
+        tokens, values = top_k_candidates(probs, min(beam_width, probs.shape[1] - 1))
+        total = (scores[:, None] + np.log(values + 1e-10)).ravel()
+
+        best = np.argsort(-total)[:beam_width]
+        beams = best // tokens.shape[1]
+        tokens = tokens.ravel()[best]
+
+        scores = total[best]
+        history = np.concatenate([history[beams], tokens[:, None]], axis=1)
+        if step < num_words - 1:
+            probs, h, c = session.forward(tokens[:, None], h[beams], c[beams])
+
+    words = session.id_to_word[history[0]] if num_words else []
+    return ' '.join([seed_text.lower()] + list(words))
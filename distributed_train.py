@@ -0,0 +1,516 @@
+"""
+Data-parallel RNN training across worker processes
+Each worker trains a replica of the RNNTrainer model on its own contiguous
+shard of the token windows; gradients are summed across workers every step
+with tf.distribute.MultiWorkerMirroredStrategy. Workers run on localhost
+(--workers N) or on several hosts (--hosts ... --index i on each host).
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TF warnings
+
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras.callbacks import ModelCheckpoint
+
+from train_model import RNNTrainer, sliding_windows
+
+# Config keys used on top of RNNTrainer's defaults
+DISTRIBUTED_DEFAULTS = {
+    # Learning rate multiplier as the global batch grows with workers
+    'lr_scaling': 'linear',
+    'steps_per_epoch': None,
+    # Intra-op threads per worker (None: TF default)
+    'worker_threads': None,
+    'save_model': True,
+}
+
+
+def free_ports(n):
+    """Ask the OS for n currently unused localhost ports"""
+    sockets = []
+    for _ in range(n):
+        s = socket.socket()
+        s.bind(('localhost', 0))
+        sockets.append(s)
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def tf_config(hosts, index):
+    """TF_CONFIG value for worker `index` of a cluster of host:port addresses"""
+    return json.dumps({
+        'cluster': {'worker': list(hosts)},
+        'task': {'type': 'worker', 'index': index}
+    })
+
+
+def shard_bounds(n_tokens, window, stride, n_shards):
+    """Contiguous token ranges, one per shard, each yielding whole windows
+
+    Shards start on a stride boundary and overlap by window - 1 tokens, so
+    every window of the full range falls in exactly one shard.
+    """
+    starts = [(n_tokens * k // n_shards) // stride * stride
+              for k in range(n_shards)]
+    ends = starts[1:] + [n_tokens]
+    return [(start, min(end + window - 1, n_tokens))
+            for start, end in zip(starts, ends)]
+
+
+class DistributedTrainer(RNNTrainer):
+    """RNNTrainer whose model is replicated and trained on token shards"""
+
+    def __init__(self, config, strategy):
+        super().__init__({**DISTRIBUTED_DEFAULTS, **(config or {})})
+        if self.config['training_mode'] == 'tbptt':
+            raise ValueError("Distributed training needs training_mode='windows'")
+        if self.checkpointing():
+            raise ValueError(
+                "Distributed training doesn't write step checkpoints or resume"
+            )
+
+        self.strategy = strategy
+        resolver = strategy.cluster_resolver
+        self.num_workers = strategy.num_replicas_in_sync
+        self.worker_index = resolver.task_id if resolver else 0
+        self.is_chief = self.worker_index == 0
+
+        # Each step sees num_workers * batch_size windows
+        scale = {
+            'linear': self.num_workers,
+            'sqrt': self.num_workers ** 0.5,
+            'none': 1
+        }[self.config['lr_scaling']]
+        self.config['learning_rate'] *= scale
+
+        # Only the chief keeps checkpoints and the final artifacts
+        if not self.is_chief:
+            self.config['model_dir'] = tempfile.mkdtemp(prefix='rnn-worker-')
+
+    def build_model(self):
+        """Build LSTM model with its variables mirrored on every worker"""
+        with self.strategy.scope():
+            model = super().build_model()
+        print(f"\n✓ Worker {self.worker_index + 1}/{self.num_workers}, "
+              f"learning rate {self.config['learning_rate']:g} "
+              f"({self.config['lr_scaling']} scaling)")
+        return model
+
+    def _shard_dataset(self, tokens):
+        """This worker's window dataset and the step count all workers share"""
+        window = self.config['sequence_length'] + 1
+        stride = self.config['sequence_stride']
+        batch_size = self.config['batch_size']
+        bounds = shard_bounds(len(tokens), window, stride, self.num_workers)
+
+        # Workers must run the same number of steps or the all-reduce hangs
+        steps = min(
+            len(sliding_windows(tokens[start:end], window, stride))
+            // batch_size
+            for start, end in bounds
+        )
+        if steps < 1:
+            raise ValueError(
+                f"{len(tokens):,} tokens are too few for {self.num_workers} "
+                f"workers with batch size {batch_size}"
+            )
+
+        start, end = bounds[self.worker_index]
+        return tokens[start:end], steps
+
+    def _distribute(self, tokens, shuffle, max_steps=None):
+        shard, steps = self._shard_dataset(tokens)
+        if max_steps:
+            steps = min(steps, max_steps)
+
+        def dataset_fn(context):
+            dataset, _ = self._window_dataset(shard, shuffle=shuffle)
+            return dataset.take(steps)
+
+        return self.strategy.distribute_datasets_from_function(dataset_fn), steps
+
+    def _make_step(self, training):
+        """Compiled per-replica step returning the global mean loss"""
+        model = self.model
+        strategy = self.strategy
+
+        def replica_step(batch):
+            x, y = (batch[0], None) if len(batch) == 1 else batch
+            with tf.GradientTape() as tape:
+                y_pred = model(x, training=training)
+                # Already divided by the number of replicas under a strategy
+                loss = model.compute_loss(
+                    x=x, y=y, y_pred=y_pred, training=training
+                )
+            if training:
+                # The Keras optimizer sums gradients across replicas, which
+                # gives the gradient of the global mean loss
+                grads = tape.gradient(loss, model.trainable_variables)
+                model.optimizer.apply_gradients(
+                    zip(grads, model.trainable_variables)
+                )
+            return loss
+
+        @tf.function(jit_compile=self.config['jit_compile'] or None)
+        def step(iterator):
+            losses = strategy.run(replica_step, args=(next(iterator),))
+            # Every replica has the same batch size, so the sum of the
+            # scaled replica losses is the global mean
+            return strategy.reduce('SUM', losses, axis=None)
+
+        return step
+
+    def train(self, X=None, y=None, callbacks=None, on_telemetry=None):
+        """Train the model on this worker's shard, in lockstep with the others"""
+        print("\n" + "="*60)
+        print("TRAINING MODEL (DATA PARALLEL)")
+        print("="*60)
+
+        split = int(len(self.tokens) * (1 - self.config['validation_split']))
+        max_steps = self.config['steps_per_epoch']
+        train_ds, steps = self._distribute(
+            self.tokens[:split], shuffle=True, max_steps=max_steps
+        )
+        val_ds, val_steps = self._distribute(
+            self.tokens[split:], shuffle=False, max_steps=max_steps
+        )
+        global_batch = self.config['batch_size'] * self.num_workers
+
+        train_step = self._make_step(training=True)
+        val_step = self._make_step(training=False)
+
+        # The same Keras callbacks, driven by hand; every worker sees the
+        # same all-reduced losses, so they take the same decisions
+        history = keras.callbacks.History()
+        callbacks = [
+            callback
+            for callback in self._training_callbacks(callbacks, on_telemetry)
+            if self.is_chief or not isinstance(callback, ModelCheckpoint)
+        ]
+        callback_list = keras.callbacks.CallbackList(
+            callbacks + [history], model=self.model
+        )
+
+        print(f"\nTraining started: {datetime.now()}")
+        print(f"Workers: {self.num_workers}")
+        print(f"Steps per epoch: {steps:,} x {global_batch:,} windows")
+        print(f"Validation steps: {val_steps:,}")
+        print(f"Max epochs: {self.config['epochs']}")
+
+        start_time = time.time()
+        self.model.stop_training = False
+        callback_list.on_train_begin()
+
+        for epoch in range(self.config['epochs']):
+            callback_list.on_epoch_begin(epoch)
+            epoch_start = time.perf_counter()
+
+            iterator = iter(train_ds)
+            total = 0.0
+            for batch in range(steps):
+                callback_list.on_train_batch_begin(batch)
+                total += train_step(iterator)
+                callback_list.on_train_batch_end(batch)
+            loss = float(total) / steps
+            epoch_time = time.perf_counter() - epoch_start
+
+            iterator = iter(val_ds)
+            total = 0.0
+            for _ in range(val_steps):
+                total += val_step(iterator)
+
+            logs = {
+                'loss': loss,
+                'val_loss': float(total) / val_steps,
+                'epoch_time': epoch_time,
+                'samples_per_sec': steps * global_batch / epoch_time
+            }
+            print(f"Epoch {epoch + 1}/{self.config['epochs']} - "
+                  f"loss: {logs['loss']:.4f} - "
+                  f"val_loss: {logs['val_loss']:.4f} - "
+                  f"{logs['samples_per_sec']:,.0f} samples/sec")
+
+            callback_list.on_epoch_end(epoch, logs)
+            if self.model.stop_training:
+                break
+
+        callback_list.on_train_end()
+        training_time = time.time() - start_time
+
+        print("\n" + "="*60)
+        print("TRAINING COMPLETE")
+        print("="*60)
+        print(f"Time: {training_time/3600:.2f} hours")
+        print(f"Final loss: {history.history['loss'][-1]:.4f}")
+        print(f"Final val loss: {history.history['val_loss'][-1]:.4f}")
+
+        if self.config['output_head'] == 'sampled':
+            self.model = self.export_full_softmax(self.model)
+        return history
+
+
+def run_worker(config, result_path=None):
+    """Train as one worker of the cluster described by TF_CONFIG"""
+    config = {**DISTRIBUTED_DEFAULTS, **config}
+
+    # Must happen before the strategy initialises the TF runtime
+    threads = config.get('worker_threads')
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(max(1, threads // 2))
+
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    trainer = DistributedTrainer(config, strategy)
+
+    trainer.prepare_training_data()
+    trainer.build_model()
+    history = trainer.train()
+
+    if trainer.is_chief:
+        if config['save_model']:
+            trainer.save_model(history)
+        if result_path:
+            with open(result_path, 'w') as f:
+                json.dump({
+                    'workers': trainer.num_workers,
+                    'history': {
+                        key: [float(v) for v in values]
+                        for key, values in history.history.items()
+                    }
+                }, f, indent=2)
+    else:
+        shutil.rmtree(trainer.config['model_dir'], ignore_errors=True)
+
+    return history
+
+
+def launch_local(num_workers, config, prepare=True):
+    """Run num_workers worker processes on localhost and wait for them"""
+    config = {**DISTRIBUTED_DEFAULTS, **config}
+    if not config['worker_threads']:
+        config['worker_threads'] = max(1, (os.cpu_count() or 1) // num_workers)
+
+    if prepare and config.get('use_cache', True):
+        # Fill the stage cache once so workers don't all preprocess at once
+        RNNTrainer(config).prepare_training_data()
+
+    hosts = [f"localhost:{port}" for port in free_ports(num_workers)]
+    run_dir = tempfile.mkdtemp(prefix='rnn-distributed-')
+    config_path = os.path.join(run_dir, 'config.json')
+    result_path = os.path.join(run_dir, 'result.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+
+    print(f"\nLaunching {num_workers} workers on {', '.join(hosts)} "
+          f"({config['worker_threads']} threads each)")
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__),
+             '--worker-config', config_path, '--result', result_path],
+            env={**os.environ, 'TF_CONFIG': tf_config(hosts, index)}
+        )
+        for index in range(num_workers)
+    ]
+
+    try:
+        codes = [proc.wait() for proc in procs]
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+
+    if any(codes):
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise RuntimeError(f"Worker exit codes: {codes}")
+
+    with open(result_path, 'r') as f:
+        result = json.load(f)
+    shutil.rmtree(run_dir, ignore_errors=True)
+    return result
+
+
+def scaling_report(worker_counts, config, output_path=None):
+    """Measure samples/sec at each worker count and write a JSON report"""
+    print("\n" + "="*60)
+    print("DATA-PARALLEL SCALING")
+    print("="*60)
+
+    config = {**DISTRIBUTED_DEFAULTS, **config}
+    base = dict(config, save_model=False, epochs=max(2, config.get('epochs', 2)))
+    rows = []
+    for i, num_workers in enumerate(worker_counts):
+        model_dir = tempfile.mkdtemp(prefix='rnn-scaling-')
+        try:
+            result = launch_local(
+                num_workers, dict(base, model_dir=model_dir), prepare=i == 0
+            )
+        finally:
+            shutil.rmtree(model_dir, ignore_errors=True)
+
+        # The first epoch includes tracing; average the ones after it
+        history = result['history']
+        rows.append({
+            'workers': num_workers,
+            'samples_per_sec': float(np.mean(history['samples_per_sec'][1:])),
+            'loss': history['loss'][-1],
+            'val_loss': history['val_loss'][-1]
+        })
+
+    single = rows[0]['samples_per_sec'] / rows[0]['workers']
+    print(f"\n{'workers':>8} {'samples/sec':>14} {'speedup':>9} {'efficiency':>11} "
+          f"{'loss':>8} {'val_loss':>9}")
+    for row in rows:
+        row['speedup'] = row['samples_per_sec'] / single
+        row['efficiency'] = row['speedup'] / row['workers']
+        print(f"{row['workers']:>8} {row['samples_per_sec']:>14,.0f} "
+              f"{row['speedup']:>8.2f}x {row['efficiency']:>10.0%} "
+              f"{row['loss']:>8.4f} {row['val_loss']:>9.4f}")
+
+    report = {
+        'cpu_count': os.cpu_count(),
+        'batch_size_per_worker': config['batch_size'],
+        'lr_scaling': config['lr_scaling'],
+        'results': rows
+    }
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Report saved: {output_path}")
+    return report
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='Data-parallel training of the RNN next-word model'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=2,
+        help='Worker processes to launch on localhost (default: 2)'
+    )
+    parser.add_argument(
+        '--hosts',
+        default=None,
+        help='Comma-separated host:port of every worker; run this once per '
+             'host with its --index instead of using --workers'
+    )
+    parser.add_argument(
+        '--index',
+        type=int,
+        default=0,
+        help='Position of this host in --hosts (default: 0)'
+    )
+    parser.add_argument(
+        '--scaling-report',
+        default=None,
+        help='Comma-separated worker counts to benchmark, e.g. 1,2,4,8'
+    )
+    parser.add_argument(
+        '--epochs',
+        type=int,
+        default=50,
+        help='Number of training epochs (default: 50)'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=128,
+        help='Batch size per worker (default: 128)'
+    )
+    parser.add_argument(
+        '--steps-per-epoch',
+        type=int,
+        default=None,
+        help='Cap on steps per epoch (default: a full pass over the shard)'
+    )
+    parser.add_argument(
+        '--lr-scaling',
+        choices=['linear', 'sqrt', 'none'],
+        default='linear',
+        help='How the learning rate grows with the number of workers '
+             '(default: linear)'
+    )
+    parser.add_argument(
+        '--lstm-units',
+        type=int,
+        default=256,
+        help='LSTM units (default: 256)'
+    )
+    parser.add_argument(
+        '--embedding-dim',
+        type=int,
+        default=300,
+        help='Embedding dimension (default: 300)'
+    )
+    parser.add_argument(
+        '--model-mode',
+        choices=['standard', 'fast'],
+        default='standard',
+        help='LSTM layout (default: standard)'
+    )
+    parser.add_argument(
+        '--output-head',
+        choices=['softmax', 'sampled'],
+        default='softmax',
+        help='Full or sampled softmax during training (default: softmax)'
+    )
+    parser.add_argument(
+        '--corpus',
+        default=None,
+        help='Directory or glob of local text shards to train on'
+    )
+    parser.add_argument('--worker-config', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker_config:
+        # Spawned by launch_local with TF_CONFIG already set
+        with open(args.worker_config, 'r') as f:
+            run_worker(json.load(f), result_path=args.result)
+        return
+
+    config = {
+        'epochs': args.epochs,
+        'batch_size': args.batch_size,
+        'steps_per_epoch': args.steps_per_epoch,
+        'lr_scaling': args.lr_scaling,
+        'lstm_units': args.lstm_units,
+        'embedding_dim': args.embedding_dim,
+        'model_mode': args.model_mode,
+        'output_head': args.output_head,
+        'corpus': args.corpus
+    }
+
+    if args.hosts:
+        os.environ['TF_CONFIG'] = tf_config(args.hosts.split(','), args.index)
+        run_worker(config)
+    elif args.scaling_report:
+        counts = [int(n) for n in args.scaling_report.split(',')]
+        model_dir = RNNTrainer(config).config['model_dir']
+        scaling_report(
+            counts, config,
+            output_path=os.path.join(model_dir, 'scaling_report.json')
+        )
+    else:
+        launch_local(args.workers, config)
+
+
+if __name__ == '__main__':
+    main()
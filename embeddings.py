@@ -0,0 +1,242 @@
+"""
+Binary cache for GloVe/Dolma word embedding files
+The text file is parsed once, in parallel byte-range chunks, into a
+float32 .npy matrix (opened as a memmap) plus a word list, so later
+runs only gather vocabulary rows
+"""
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from stage_cache import file_fingerprint
+
+
+def line_ranges(path, n_chunks):
+    """Split a file into byte ranges; a line belongs to the range it starts in"""
+    size = os.path.getsize(path)
+    n_chunks = max(1, min(n_chunks, size // (1 << 16) or 1))
+    bounds = [size * i // n_chunks for i in range(n_chunks + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_range(path, start, end, dim, vocabulary=None):
+    """Parse the lines starting in [start, end), skipping words not in vocabulary"""
+    words = []
+    vectors = []
+    skipped = 0
+    malformed = 0
+
+    with open(path, 'rb') as f:
+        if start > 0:
+            # Finish the line that straddles the boundary; it belongs to
+            # the previous range
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+
+        while pos < end:
+            raw = f.readline()
+            if not raw:
+                break
+            pos += len(raw)
+
+            try:
+                parts = raw.decode('utf-8').split(None, 1)
+            except UnicodeDecodeError:
+                malformed += 1
+                continue
+            if len(parts) != 2:
+                malformed += 1
+                continue
+
+            # Vocabulary check first, so unused lines never reach float parsing
+            word = parts[0]
+            if vocabulary is not None and word not in vocabulary:
+                skipped += 1
+                continue
+
+            values = parts[1].split()
+            if len(values) != dim:
+                malformed += 1
+                continue
+            try:
+                vectors.append(np.array(values, dtype=np.float32))
+            except ValueError:
+                malformed += 1
+                continue
+            words.append(word)
+
+    array = np.array(vectors, dtype=np.float32).reshape(len(vectors), dim)
+    stats = {'matched': len(words), 'skipped': skipped, 'malformed': malformed}
+    return words, array, stats
+
+
+def _convert_range(path, start, end, dim, part_path):
+    """Parse one byte range and write its vectors to a part file"""
+    words, array, stats = _parse_range(path, start, end, dim)
+    np.save(part_path, array)
+    return words, stats
+
+
+def _run_ranges(fn, tasks, workers):
+    """Run fn over argument tuples, on a process pool when workers > 1"""
+    if workers <= 1 or len(tasks) == 1:
+        return [fn(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, *zip(*tasks)))
+
+
+def _merge_stats(results):
+    return {
+        key: sum(stats[key] for stats in results)
+        for key in ('matched', 'skipped', 'malformed')
+    }
+
+
+def _chunk_count(path, workers, chunk_bytes=64 << 20):
+    """Enough chunks to balance the pool while bounding per-chunk memory"""
+    return max(workers * 4, -(-os.path.getsize(path) // chunk_bytes))
+
+
+def parse_embedding_file(path, dim, vocabulary=None, workers=None):
+    """Parse a text embedding file in parallel byte-range chunks"""
+    workers = workers or os.cpu_count() or 1
+    tasks = [
+        (path, start, end, dim, vocabulary)
+        for start, end in line_ranges(path, _chunk_count(path, workers))
+    ]
+    results = _run_ranges(_parse_range, tasks, workers)
+
+    words = [word for chunk_words, _, _ in results for word in chunk_words]
+    vectors = np.concatenate([array for _, array, _ in results])
+    return EmbeddingTable(vectors, words), _merge_stats(
+        [stats for _, _, stats in results]
+    )
+
+
+class EmbeddingTable:
+    """Word vectors in a float32 matrix, memory-mapped when loaded from cache"""
+
+    def __init__(self, vectors, words):
+        self.vectors = vectors
+        self.words = words
+
+    def __len__(self):
+        return len(self.words)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def gather(self, word_index, vocab_size):
+        """Embedding matrix for ids below vocab_size, and how many were found"""
+        wanted = {word: i for word, i in word_index.items() if i < vocab_size}
+
+        # Later duplicates win, like building a dict from the text file
+        rows = {}
+        for row, word in enumerate(self.words):
+            token_id = wanted.get(word)
+            if token_id is not None:
+                rows[token_id] = row
+
+        matrix = np.zeros((vocab_size, self.dim), dtype=np.float32)
+        if rows:
+            ids = np.fromiter(rows.keys(), dtype=np.int64, count=len(rows))
+            src = np.fromiter(rows.values(), dtype=np.int64, count=len(rows))
+            order = np.argsort(src)  # read the memmap front to back
+            matrix[ids[order]] = self.vectors[src[order]]
+
+        return matrix, len(rows)
+
+    @classmethod
+    def load(cls, prefix):
+        """Open a converted table"""
+        with open(f"{prefix}.words.txt", 'r', encoding='utf-8') as f:
+            words = f.read().split('\n')[:-1]
+        vectors = np.load(f"{prefix}.npy", mmap_mode='r')
+        return cls(vectors[:len(words)], words)
+
+
+def cache_prefix(path, cache_dir, dim):
+    """Where the binary copy of an embedding file lives"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}-{dim}")
+
+
+def is_converted(path, prefix, dim):
+    """True if prefix holds an up-to-date conversion of path"""
+    meta_path = f"{prefix}.json"
+    if not os.path.exists(meta_path):
+        return False
+
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    return (
+        'stats' in meta
+        and meta['dim'] == dim
+        and meta['source'] == file_fingerprint(path)
+    )
+
+
+def convert_embedding_file(path, prefix, dim, workers=None):
+    """Parse a text embedding file in parallel into prefix.npy / prefix.words.txt"""
+    os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    # Each chunk is written to its own part file, then stitched in order
+    ranges = line_ranges(path, _chunk_count(path, workers))
+    tmp = f".tmp-{os.getpid()}"
+    part_paths = [f"{prefix}.part{i}{tmp}.npy" for i in range(len(ranges))]
+    results = _run_ranges(
+        _convert_range,
+        [(path, start, end, dim, part)
+         for (start, end), part in zip(ranges, part_paths)],
+        workers
+    )
+    stats = _merge_stats([chunk_stats for _, chunk_stats in results])
+
+    vectors = np.lib.format.open_memmap(
+        f"{prefix}.npy{tmp}",
+        mode='w+',
+        dtype=np.float32,
+        shape=(stats['matched'], dim)
+    )
+    row = 0
+    with open(f"{prefix}.words.txt{tmp}", 'w', encoding='utf-8') as f:
+        for (words, _), part in zip(results, part_paths):
+            vectors[row:row + len(words)] = np.load(part, mmap_mode='r')
+            row += len(words)
+            f.writelines(word + '\n' for word in words)
+            os.remove(part)
+
+    vectors.flush()
+    del vectors
+    os.replace(f"{prefix}.npy{tmp}", f"{prefix}.npy")
+    os.replace(f"{prefix}.words.txt{tmp}", f"{prefix}.words.txt")
+
+    # Written last: its presence marks a complete conversion
+    with open(f"{prefix}.json", 'w') as f:
+        json.dump({
+            'dim': dim,
+            'stats': stats,
+            'source': file_fingerprint(path)
+        }, f, indent=2)
+
+    return stats
+
+
+def load_embedding_table(path, cache_dir, dim, workers=None):
+    """Open the binary copy of an embedding file, converting it on first use"""
+    prefix = cache_prefix(path, cache_dir, dim)
+
+    if is_converted(path, prefix, dim):
+        with open(f"{prefix}.json", 'r') as f:
+            stats = json.load(f)['stats']
+    else:
+        print(f"  Converting to binary cache: {prefix}.npy")
+        stats = convert_embedding_file(path, prefix, dim, workers)
+
+    return EmbeddingTable.load(prefix), stats
@@ -0,0 +1,336 @@
+"""
+Export a trained model for the NumPy inference engine
+Writes model_weights.npz next to final_model.h5, checks the NumPy forward
+pass against Keras on random windows and on step-by-step decoding, and
+measures import time, RSS and per-token latency of the engines, each in
+a fresh interpreter. Exits non-zero if the outputs differ by more than
+--tolerance. With --quantize, also writes model_weights_int8.npz and
+reports its top-1/top-5 agreement and perplexity against the float model.
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TF warnings
+
+import sys
+import json
+import argparse
+import subprocess
+
+import numpy as np
+
+DEFAULT_TOLERANCE = 1e-4
+
+# Run by measure_engine() in a fresh interpreter, so the import time and
+# RSS only cover one engine
+MEASURE_SCRIPT = '''
+import sys, json, time
+start = time.perf_counter()
+from {module} import {imports}
+imported = time.perf_counter()
+session = {session}.load(sys.argv[1]{load_args})
+loaded = time.perf_counter()
+
+import numpy as np
+from profiling import process_rss
+
+num_words, repeats = int(sys.argv[2]), int(sys.argv[3])
+session.generate('the', 2, decoding='greedy')
+times = []
+for _ in range(repeats):
+    t = time.perf_counter()
+    session.generate('the', num_words, decoding='greedy')
+    times.append(time.perf_counter() - t)
+print(json.dumps({{
+    'import_s': imported - start,
+    'load_s': loaded - imported,
+    'rss_mb': process_rss() / 2**20,
+    'per_token_ms': float(np.median(times)) / num_words * 1000
+}}))
+'''
+
+# engine -> (module, session class, weights file constant or None)
+ENGINES = {
+    'tensorflow': ('inference', 'InferenceSession', None),
+    'numpy': ('numpy_engine', 'NumpySession', None),
+    'numpy-int8': ('numpy_engine', 'NumpySession', 'QUANTIZED_WEIGHTS_FILE')
+}
+
+
+def random_windows(num_windows, sequence_length, vocab_size, seed=0):
+    """Token windows with random amounts of leading padding, one all padding"""
+    rng = np.random.default_rng(seed)
+    windows = rng.integers(1, vocab_size, (num_windows, sequence_length))
+    padding = rng.integers(0, sequence_length + 1, num_windows)
+    padding[0] = sequence_length
+    windows[np.arange(sequence_length) < padding[:, None]] = 0
+    return windows.astype(np.int32)
+
+
+def relative_diff(expected, actual):
+    """Largest |difference| relative to the expected value"""
+    return float((np.abs(expected - actual) / np.maximum(np.abs(expected), 1e-6)).max())
+
+
+def check_windows(keras_model, numpy_model, windows):
+    """Relative difference and argmax agreement of full-window predictions"""
+    expected = keras_model(windows, training=False).numpy()
+    actual = numpy_model.predict(windows)
+    return {
+        'windows': len(windows),
+        'max_rel_diff': relative_diff(expected, actual),
+        'argmax_agreement': float((expected.argmax(1) == actual.argmax(1)).mean())
+    }
+
+
+def check_steps(tf_session, np_session, seed_texts, steps):
+    """Relative difference of probabilities and |difference| of the states
+    over batched decoding, each engine carrying its own states"""
+    windows = tf_session.seed_windows(seed_texts)
+    zeros = np.zeros((len(seed_texts), tf_session.units), dtype=np.float32)
+    tf_out = tf_session.forward(windows, zeros, zeros)
+    np_out = np_session.forward(windows, zeros, zeros)
+
+    diffs = {'probs_rel': 0.0, 'h': 0.0, 'c': 0.0}
+    for step in range(steps + 1):
+        diffs['probs_rel'] = max(diffs['probs_rel'], relative_diff(tf_out[0], np_out[0]))
+        for name, expected, actual in zip(['h', 'c'], tf_out[1:], np_out[1:]):
+            diffs[name] = max(diffs[name], float(np.abs(expected - actual).max()))
+        if step == steps:
+            break
+        # Both engines are fed the TensorFlow session's greedy tokens
+        tokens = tf_out[0][:, 1:].argmax(axis=1).reshape(-1, 1) + 1
+        np_out = np_session.forward(tokens, np_out[1], np_out[2])
+        tf_out = tf_session.forward(tokens, tf_out[1], tf_out[2])
+    return {'rows': len(seed_texts), 'steps': steps,
+            **{f'max_diff_{k}': v for k, v in diffs.items()}}
+
+
+def measure_engine(engine, model_dir, num_words=50, repeats=5):
+    """Import time, load time, RSS and per-token latency in a fresh process"""
+    module, session, weights = ENGINES[engine]
+    code = MEASURE_SCRIPT.format(
+        module=module,
+        session=session,
+        imports=f'{session}, {weights}' if weights else session,
+        load_args=f', {weights}' if weights else ''
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code, os.path.abspath(model_dir),
+         str(num_words), str(repeats)],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, TF_CPP_MIN_LOG_LEVEL='3')
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{engine} measurement failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def sampled_tokens(model, rows, length, seed=0):
+    """Rows of tokens sampled from the float model, from random start words"""
+    from decoding import sample_tokens
+
+    rng = np.random.default_rng(seed)
+    tokens = np.zeros((rows, length), dtype=np.int32)
+    tokens[:, 0] = rng.choice(np.flatnonzero(model.step_mask[1:]) + 1, rows)
+    h = c = np.zeros((rows, model.units), dtype=np.float32)
+    for t in range(1, length):
+        probs, h, c = model.forward(tokens[:, t - 1:t], h, c)
+        tokens[:, t] = sample_tokens(probs, 1.0, rng)
+    return tokens
+
+
+def text_tokens(session, path, rows, length):
+    """Rows of consecutive tokens from a text file"""
+    from preprocessing import clean_text
+
+    with open(path, 'r', encoding='utf-8') as f:
+        ids = np.array(session.encode(clean_text(f.read())), dtype=np.int32)
+    rows = min(rows, len(ids) // length)
+    if rows == 0:
+        raise ValueError(f"{path} has fewer than {length} known tokens")
+    return ids[:rows * length].reshape(rows, length)
+
+
+def check_quantized(float_model, quantized_model, tokens):
+    """Top-1/top-5 agreement and perplexity of the int8 model vs the float model
+
+    Both models read the rows token by token from their own states;
+    every position predicts the next token of its row.
+    """
+    rows = np.arange(len(tokens))
+    h_f = c_f = h_q = c_q = np.zeros((len(tokens), float_model.units), dtype=np.float32)
+    top1 = top5 = nll_float = nll_quantized = 0.0
+    for t in range(tokens.shape[1] - 1):
+        p_f, h_f, c_f = float_model.forward(tokens[:, t:t + 1], h_f, c_f)
+        p_q, h_q, c_q = quantized_model.forward(tokens[:, t:t + 1], h_q, c_q)
+        target = tokens[:, t + 1]
+
+        top1 += (p_f.argmax(axis=1) == p_q.argmax(axis=1)).sum()
+        best_f = np.argpartition(-p_f, 4, axis=1)[:, :5]
+        best_q = np.argpartition(-p_q, 4, axis=1)[:, :5]
+        top5 += (best_f[:, :, None] == best_q[:, None, :]).any(axis=2).sum() / 5
+        nll_float -= np.log(p_f[rows, target] + 1e-10).sum()
+        nll_quantized -= np.log(p_q[rows, target] + 1e-10).sum()
+
+    predictions = len(tokens) * (tokens.shape[1] - 1)
+    perplexity_float = float(np.exp(nll_float / predictions))
+    perplexity_quantized = float(np.exp(nll_quantized / predictions))
+    return {
+        'predictions': predictions,
+        'top1_agreement': float(top1 / predictions),
+        'top5_agreement': float(top5 / predictions),
+        'perplexity_float': perplexity_float,
+        'perplexity_int8': perplexity_quantized,
+        'perplexity_delta_pct': (perplexity_quantized / perplexity_float - 1) * 100,
+        'weights_mb_float': float_model.nbytes / 2**20,
+        'weights_mb_int8': quantized_model.nbytes / 2**20
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export final_model.h5 for the NumPy inference engine and verify it'
+    )
+    parser.add_argument(
+        '--model-dir',
+        default='saved_models',
+        help='Directory with final_model.h5 and the tokenizer (default: saved_models)'
+    )
+    parser.add_argument(
+        '--windows',
+        type=int,
+        default=256,
+        help='Random windows compared against Keras (default: 256)'
+    )
+    parser.add_argument(
+        '--steps',
+        type=int,
+        default=30,
+        help='Decoding steps compared against the TensorFlow session (default: 30)'
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f'Largest allowed relative difference of probabilities and '
+             f'absolute difference of states (default: {DEFAULT_TOLERANCE})'
+    )
+    parser.add_argument(
+        '--quantize',
+        action='store_true',
+        help='Also write int8 weights and report their accuracy against the float model'
+    )
+    parser.add_argument(
+        '--eval-text',
+        help='Text file for the int8 accuracy report (default: text sampled from the model)'
+    )
+    parser.add_argument(
+        '--no-measure',
+        action='store_true',
+        help='Skip the import time, RSS and latency measurements'
+    )
+    args = parser.parse_args()
+
+    from tensorflow import keras
+
+    from inference import InferenceSession
+    from numpy_engine import (
+        NumpyModel, NumpySession, WEIGHTS_FILE, QUANTIZED_WEIGHTS_FILE,
+        export_weights, quantize_weights
+    )
+
+    print("="*60)
+    print("EXPORT")
+    print("="*60)
+    model_path = os.path.join(args.model_dir, 'final_model.h5')
+    keras_model = keras.models.load_model(model_path, compile=False)
+    weights_path = export_weights(keras_model, os.path.join(args.model_dir, WEIGHTS_FILE))
+    print(f"✓ Exported {model_path} -> {weights_path} "
+          f"({os.path.getsize(weights_path) / 2**20:.1f}MB)")
+
+    print("\n" + "="*60)
+    print("EQUIVALENCE")
+    print("="*60)
+    numpy_model = NumpyModel.load(weights_path)
+    windows = random_windows(
+        args.windows, keras_model.input_shape[1], numpy_model.num_classes
+    )
+    window_check = check_windows(keras_model, numpy_model, windows)
+    print(f"Windows:  max relative diff {window_check['max_rel_diff']:.2e}, "
+          f"argmax agreement {window_check['argmax_agreement']:.1%} "
+          f"over {window_check['windows']} windows")
+
+    tf_session = InferenceSession.load(args.model_dir)
+    np_session = NumpySession(numpy_model, tf_session.tokenizer)
+    seed_texts = ['to be or not to', 'the king of', 'once upon a time', '']
+    step_check = check_steps(tf_session, np_session, seed_texts, args.steps)
+    print(f"Decoding: max relative diff {step_check['max_diff_probs_rel']:.2e}, "
+          f"|diff| h {step_check['max_diff_h']:.2e}, c {step_check['max_diff_c']:.2e} "
+          f"over {step_check['steps']} steps")
+
+    worst = max(
+        window_check['max_rel_diff'],
+        step_check['max_diff_probs_rel'],
+        step_check['max_diff_h'],
+        step_check['max_diff_c']
+    )
+    report = {'weights': weights_path, 'windows': window_check, 'decoding': step_check}
+    engines = ['tensorflow', 'numpy']
+
+    if args.quantize:
+        print("\n" + "="*60)
+        print("INT8 QUANTIZATION")
+        print("="*60)
+        quantized_path = quantize_weights(
+            weights_path, os.path.join(args.model_dir, QUANTIZED_WEIGHTS_FILE)
+        )
+        print(f"✓ Quantized -> {quantized_path} "
+              f"({os.path.getsize(quantized_path) / 2**20:.1f}MB)")
+
+        if args.eval_text:
+            tokens = text_tokens(np_session, args.eval_text, 64, 65)
+            source = args.eval_text
+        else:
+            tokens = sampled_tokens(numpy_model, 64, 65)
+            source = 'text sampled from the float model'
+        quantized = check_quantized(numpy_model, NumpyModel.load(quantized_path), tokens)
+        quantized.update(weights=quantized_path, eval_text=source)
+        report['int8'] = quantized
+        engines.append('numpy-int8')
+
+        print(f"Weights:    {quantized['weights_mb_float']:.1f}MB float32 -> "
+              f"{quantized['weights_mb_int8']:.1f}MB int8")
+        print(f"Agreement:  top-1 {quantized['top1_agreement']:.1%}, "
+              f"top-5 {quantized['top5_agreement']:.1%} "
+              f"over {quantized['predictions']:,} predictions ({source})")
+        print(f"Perplexity: {quantized['perplexity_float']:.2f} float32, "
+              f"{quantized['perplexity_int8']:.2f} int8 "
+              f"({quantized['perplexity_delta_pct']:+.2f}%)")
+
+    if not args.no_measure:
+        print("\n" + "="*60)
+        print("ENGINES (fresh process each)")
+        print("="*60)
+        print(f"{'engine':<12} {'import':>9} {'load':>9} {'RSS':>9} {'per token':>10}")
+        report['engines'] = {}
+        for engine in engines:
+            stats = measure_engine(engine, args.model_dir)
+            report['engines'][engine] = stats
+            print(f"{engine:<12} {stats['import_s']:>8.2f}s {stats['load_s']:>8.2f}s "
+                  f"{stats['rss_mb']:>7.0f}MB {stats['per_token_ms']:>8.2f}ms")
+
+    report_path = os.path.join(args.model_dir, 'numpy_engine_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Report saved: {report_path}")
+
+    if worst > args.tolerance:
+        print(f"\n⚠️  NumPy engine differs from Keras by {worst:.2e} "
+              f"(tolerance {args.tolerance:.0e})")
+        sys.exit(1)
+    print(f"✓ NumPy engine matches Keras within {args.tolerance:.0e}")
+
+
+if __name__ == "__main__":
+    main()
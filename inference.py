@@ -0,0 +1,141 @@
+"""
+Inference for the next-word model
+The trained model reads a fixed window of tokens per prediction.
+InferenceSession runs its LSTM over the seed once and then advances the
+hidden/cell state by one step per generated token, so n words cost about
+n LSTM steps instead of n full windows.
+"""
+
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from numpy_engine import GenerationSession
+
+
+def build_step_model(model):
+    """Model mapping (tokens, h, c) to (next-token probabilities, h, c)
+
+    Shares every layer of the windowed model except the LSTM, which is
+    re-created with return_state and given the trained weights.
+    """
+    lstms = [layer for layer in model.layers
+             if isinstance(layer, keras.layers.LSTM)]
+    if len(lstms) != 1:
+        raise ValueError("Incremental decoding needs exactly one LSTM layer")
+    lstm = lstms[0]
+
+    step_lstm = keras.layers.LSTM.from_config(dict(
+        lstm.get_config(),
+        return_state=True,
+        return_sequences=False,
+        stateful=False,
+        name=f'{lstm.name}_step'
+    ))
+
+    tokens = keras.Input(shape=(None,), dtype='int32', name='tokens')
+    state_h = keras.Input(shape=(lstm.units,), name='state_h')
+    state_c = keras.Input(shape=(lstm.units,), name='state_c')
+    # The padding mask is tracked by hand: it isn't passed on to an LSTM
+    # called with initial_state
+    x, mask = tokens, None
+    for layer in model.layers:
+        if layer is lstm:
+            _, h, c = step_lstm(x, initial_state=[state_h, state_c], mask=mask)
+            # h is the output, except after a masked step, where the output
+            # is zeros but h carries the last real output, as in the window
+            x, mask = h, None
+        else:
+            x, mask = layer(x), layer.compute_mask(x, mask)
+
+    step_lstm.set_weights(lstm.get_weights())
+    return keras.Model([tokens, state_h, state_c], [x, h, c])
+
+
+class InferenceSession(GenerationSession):
+    """A loaded model ready to generate text, shared by the app and scripts
+
+    Built once at load time: the incremental step model is traced up
+    front, ids map to words through a precomputed array, and the seed
+    window and step inputs are reused buffers. The seed is pre-padded to
+    the model's window, as the model saw it in training, and read once;
+    each sampled token then advances the LSTM state by a single step and
+    the text is only assembled at the end. While the text fits in the
+    window the predictions match re-running the window model; past it the
+    state carries the whole history rather than the last sequence_length
+    tokens.
+    """
+
+    def __init__(self, model, tokenizer, sequence_length=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.sequence_length = sequence_length or model.input_shape[1]
+        self.step_model = build_step_model(model)
+        self.units = self.step_model.inputs[1].shape[-1]
+        self.num_classes = self.step_model.outputs[0].shape[-1]
+
+        self._init_vocabulary()
+
+        self._window = np.zeros((1, self.sequence_length), dtype=np.int32)
+        self._token = np.zeros((1, 1), dtype=np.int32)
+        self._zeros = tf.zeros((1, self.units))
+        # Guards the shared buffers between Flask's request threads
+        self._lock = threading.Lock()
+
+        forward = tf.function(
+            lambda tokens, h, c: self.step_model([tokens, h, c], training=False)
+        )
+        # One concrete function for every batch size and length, called
+        # directly to skip tf.function's per-call argument matching
+        self._forward = forward.get_concrete_function(
+            tf.TensorSpec((None, None), tf.int32),
+            tf.TensorSpec((None, self.units), tf.float32),
+            tf.TensorSpec((None, self.units), tf.float32)
+        )
+        self._call(self._window, (self._zeros, self._zeros))
+
+    @classmethod
+    def load(cls, model_dir):
+        """Session for final_model.h5 and the tokenizer saved in model_dir"""
+        from preprocessing import load_tokenizer
+
+        model = keras.models.load_model(
+            os.path.join(model_dir, 'final_model.h5'), compile=False
+        )
+        tokenizer = load_tokenizer(model_dir)
+        if tokenizer is None:
+            raise FileNotFoundError(f"No tokenizer found in {model_dir}")
+        return cls(model, tokenizer)
+
+    def _call(self, tokens, state):
+        probs, h, c = self._forward(tf.constant(tokens), *state)
+        return probs.numpy(), (h, c)
+
+    def forward(self, tokens, h, c):
+        """Batched step over rows of tokens from states h, c, as NumPy arrays"""
+        probs, h, c = self._forward(
+            tf.constant(tokens, dtype=tf.int32),
+            tf.constant(h, dtype=tf.float32),
+            tf.constant(c, dtype=tf.float32)
+        )
+        return probs.numpy(), h.numpy(), c.numpy()
+
+    def start(self, seed_text):
+        """Next-token probabilities and LSTM state after reading the seed"""
+        ids = self.encode(seed_text)[-self.sequence_length:]
+        with self._lock:
+            self._window[:] = 0
+            if ids:
+                self._window[0, -len(ids):] = ids
+            probs, state = self._call(self._window, (self._zeros, self._zeros))
+        return probs[0], state
+
+    def step(self, token, state):
+        """Next-token probabilities and state after one more token"""
+        with self._lock:
+            self._token[0, 0] = token
+            probs, state = self._call(self._token, state)
+        return probs[0], state
@@ -0,0 +1,385 @@
+"""
+TensorFlow-free inference for the next-word model
+export_weights() flattens the Embedding, LSTM and Dense weights of a
+trained model into one .npz file, and quantize_weights() stores the
+large matrices of such a file as per-channel int8. NumpyModel runs the
+same forward pass (embedding lookup, LSTM cell steps, dense layers,
+softmax) on either file with NumPy alone, so a deployment without
+TensorFlow can still generate text.
+GenerationSession is the engine-independent part of a session, shared
+with inference.InferenceSession.
+"""
+
+import os
+import json
+import threading
+
+import numpy as np
+
+from decoding import pick_tokens, beam_search
+
+WEIGHTS_FILE = 'model_weights.npz'
+QUANTIZED_WEIGHTS_FILE = 'model_weights_int8.npz'
+
+
+def _sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'softmax': _softmax
+}
+
+
+def _activation_name(activation):
+    name = activation if isinstance(activation, str) else activation.__name__
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation for the NumPy engine: {name}")
+    return name
+
+
+def export_weights(model, path):
+    """Write the model's weights and layer layout to a flat .npz file
+
+    Supports the Embedding -> [Masking] -> LSTM -> Dense... stacks that
+    train_model.py builds; Dropout and input layers are skipped. Which
+    token ids the LSTM skips (mask_zero, or all-zero embedding rows under
+    a Masking layer) is resolved here into one flag per id.
+    """
+    from tensorflow import keras
+
+    arrays = {}
+    config = {
+        'format': 1,
+        'sequence_length': model.input_shape[1] or 0,
+        'dense_activations': []
+    }
+    mask_zero = False
+    mask_value = None
+    stage = 'embedding'
+    for layer in model.layers:
+        if isinstance(layer, (keras.layers.InputLayer, keras.layers.Dropout)):
+            continue
+        if isinstance(layer, keras.layers.Embedding) and stage == 'embedding':
+            arrays['embedding'] = layer.get_weights()[0]
+            mask_zero = layer.mask_zero
+            stage = 'lstm'
+        elif isinstance(layer, keras.layers.Masking) and stage == 'lstm':
+            mask_value = layer.mask_value
+        elif isinstance(layer, keras.layers.LSTM) and stage == 'lstm':
+            weights = layer.get_weights()
+            if not layer.use_bias:
+                weights.append(np.zeros(4 * layer.units, dtype=np.float32))
+            arrays['lstm_kernel'], arrays['lstm_recurrent_kernel'], arrays['lstm_bias'] = weights
+            config['lstm_activation'] = _activation_name(layer.activation)
+            config['lstm_recurrent_activation'] = _activation_name(
+                layer.recurrent_activation
+            )
+            stage = 'dense'
+        elif isinstance(layer, keras.layers.Dense) and stage == 'dense':
+            index = len(config['dense_activations'])
+            weights = layer.get_weights()
+            if not layer.use_bias:
+                weights.append(np.zeros(layer.units, dtype=np.float32))
+            arrays[f'dense_{index}_kernel'], arrays[f'dense_{index}_bias'] = weights
+            config['dense_activations'].append(_activation_name(layer.activation))
+        else:
+            raise ValueError(
+                f"Can't export layer '{layer.name}' ({type(layer).__name__}) "
+                f"to the NumPy engine"
+            )
+    if not config['dense_activations']:
+        raise ValueError("Model needs an Embedding, an LSTM and Dense layers")
+
+    # Masking replaces the Embedding's padding mask rather than adding to it
+    embedding = arrays['embedding']
+    if mask_value is not None:
+        step_mask = (embedding != mask_value).any(axis=1)
+    else:
+        step_mask = np.ones(len(embedding), dtype=bool)
+        if mask_zero:
+            step_mask[0] = False
+    arrays['step_mask'] = step_mask
+
+    with open(path, 'wb') as f:
+        np.savez(f, config=np.array(json.dumps(config)), **arrays)
+    return path
+
+
+class Int8Matrix:
+    """Int8 weights with one float32 scale per row (axis=0) or column (axis=1)
+
+    Stands in for the float matrix where NumpyModel uses one: x @ m
+    folds the scales into the input (per row) or the product (per
+    column), and m[ids] returns dequantized rows. The weights stay int8;
+    x @ m converts BLOCK_ELEMENTS of them at a time into a per-thread
+    float32 buffer, so no float copy of a large matrix is ever allocated.
+    """
+
+    # Makes ndarray @ Int8Matrix defer to __rmatmul__
+    __array_ufunc__ = None
+    BLOCK_ELEMENTS = 1 << 16
+    _scratch = threading.local()
+
+    def __init__(self, values, scale, axis):
+        self.values = values
+        self.scale = scale
+        self.axis = axis
+        self.shape = values.shape
+
+    @classmethod
+    def quantize(cls, matrix, axis):
+        """Symmetric quantization: each channel's largest |weight| maps to 127"""
+        peak = np.abs(matrix).max(axis=1 - axis)
+        scale = np.where(peak > 0, peak / 127, 1.0).astype(np.float32)
+        values = np.round(matrix / np.expand_dims(scale, 1 - axis))
+        return cls(np.clip(values, -127, 127).astype(np.int8), scale, axis)
+
+    def dequantize(self):
+        return self.values * np.expand_dims(self.scale, 1 - self.axis)
+
+    def __getitem__(self, ids):
+        if self.axis == 0:
+            return self.values[ids] * self.scale[ids][..., None]
+        return self.dequantize()[ids]
+
+    def __rmatmul__(self, x):
+        if self.axis == 0:
+            x = x * self.scale
+        rows, columns = self.shape
+        block = max(1, self.BLOCK_ELEMENTS // rows)
+        scratch = getattr(self._scratch, 'buffer', None)
+        if scratch is None or scratch.size < rows * block:
+            scratch = self._scratch.buffer = np.empty(rows * block, dtype=np.float32)
+
+        out = np.empty(x.shape[:-1] + (columns,), dtype=np.float32)
+        for start in range(0, columns, block):
+            quantized = self.values[:, start:start + block]
+            values = scratch[:quantized.size].reshape(quantized.shape)
+            np.copyto(values, quantized, casting='unsafe')
+            np.matmul(x, values, out=out[..., start:start + block])
+        if self.axis == 1:
+            out *= self.scale
+        return out
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.scale.nbytes
+
+
+# Matrices quantize_weights() stores as int8, with their channel axis:
+# one scale per token for the embedding, per output unit for kernels
+QUANTIZED_MATRICES = {
+    'embedding': 0,
+    'lstm_kernel': 1,
+    'lstm_recurrent_kernel': 1
+}
+
+
+def _load_arrays(path):
+    with np.load(path, allow_pickle=False) as data:
+        config = json.loads(str(data['config']))
+        arrays = {key: data[key] for key in data.files if key != 'config'}
+    return arrays, config
+
+
+def quantize_weights(path, output_path):
+    """Write a copy of an exported .npz with int8 embedding, LSTM and output kernels
+
+    Biases, the hidden Dense layers and the step mask stay float.
+    """
+    arrays, config = _load_arrays(path)
+    if config.get('quantized'):
+        raise ValueError(f"{path} is already quantized")
+
+    output_kernel = f"dense_{len(config['dense_activations']) - 1}_kernel"
+    axes = dict(QUANTIZED_MATRICES, **{output_kernel: 1})
+    for name, axis in axes.items():
+        matrix = Int8Matrix.quantize(arrays[name], axis)
+        arrays[name] = matrix.values
+        arrays[f'{name}_scale'] = matrix.scale
+    config = dict(config, quantized='int8', quantized_axes=axes)
+
+    with open(output_path, 'wb') as f:
+        np.savez(f, config=np.array(json.dumps(config)), **arrays)
+    return output_path
+
+
+class NumpyModel:
+    """The exported model's forward pass in NumPy, float32 or int8 weights"""
+
+    def __init__(self, arrays, config):
+        self.config = config
+        for name, axis in config.get('quantized_axes', {}).items():
+            arrays[name] = Int8Matrix(arrays[name], arrays[f'{name}_scale'], axis)
+        self.embedding = arrays['embedding']
+        self.step_mask = arrays['step_mask']
+        self.kernel = arrays['lstm_kernel']
+        self.recurrent_kernel = arrays['lstm_recurrent_kernel']
+        self.bias = arrays['lstm_bias']
+        self.activation = ACTIVATIONS[config['lstm_activation']]
+        self.recurrent_activation = ACTIVATIONS[config['lstm_recurrent_activation']]
+        self.dense = [
+            (arrays[f'dense_{i}_kernel'], arrays[f'dense_{i}_bias'], ACTIVATIONS[name])
+            for i, name in enumerate(config['dense_activations'])
+        ]
+        self.units = self.recurrent_kernel.shape[0]
+        self.num_classes = self.dense[-1][0].shape[1]
+        self.sequence_length = config['sequence_length'] or None
+
+    @classmethod
+    def load(cls, path):
+        return cls(*_load_arrays(path))
+
+    @property
+    def nbytes(self):
+        """Bytes held by the weights"""
+        weights = [self.embedding, self.step_mask, self.kernel,
+                   self.recurrent_kernel, self.bias]
+        weights += [w for kernel, bias, _ in self.dense for w in (kernel, bias)]
+        return sum(w.nbytes for w in weights)
+
+    def lstm(self, tokens, h, c):
+        """LSTM states after reading rows of tokens from states h, c
+
+        Masked tokens leave a row's state unchanged, as in Keras. Leading
+        steps masked in every row (the padding of pre-padded seeds) are
+        skipped outright.
+        """
+        mask = self.step_mask[tokens]
+        active = mask.any(axis=0)
+        if not active.any():
+            return h, c
+        first = int(active.argmax())
+        tokens, mask = tokens[:, first:], mask[:, first:, None]
+
+        # Input projections for every step in one matmul
+        x = self.embedding[tokens] @ self.kernel + self.bias
+        for t in range(x.shape[1]):
+            z = x[:, t] + h @ self.recurrent_kernel
+            i, f, g, o = np.split(z, 4, axis=1)
+            i = self.recurrent_activation(i)
+            f = self.recurrent_activation(f)
+            o = self.recurrent_activation(o)
+            c_next = f * c + i * self.activation(g)
+            h_next = o * self.activation(c_next)
+            if mask[:, t].all():
+                h, c = h_next, c_next
+            else:
+                h = np.where(mask[:, t], h_next, h)
+                c = np.where(mask[:, t], c_next, c)
+        return h, c
+
+    def forward(self, tokens, h, c):
+        """Next-token probabilities and states after rows of tokens"""
+        h, c = self.lstm(tokens, h, c)
+        x = h
+        for kernel, bias, activation in self.dense:
+            x = activation(x @ kernel + bias)
+        return x, h, c
+
+    def predict(self, windows):
+        """Next-token probabilities for windows read from a zero state"""
+        windows = np.asarray(windows)
+        zeros = np.zeros((len(windows), self.units), dtype=np.float32)
+        return self.forward(windows, zeros, zeros)[0]
+
+
+class GenerationSession:
+    """Tokens in, text out, on top of a subclass's forward pass
+
+    Subclasses set model, tokenizer, sequence_length, units and
+    num_classes, call _init_vocabulary() and implement
+    forward(tokens, h, c) on NumPy arrays.
+    """
+
+    def _init_vocabulary(self):
+        # id -> word; '' for padding and ids the tokenizer doesn't know
+        index_word = self.tokenizer.index_word
+        self.id_to_word = np.array(
+            [index_word.get(i, '') for i in range(self.num_classes)],
+            dtype=object
+        )
+
+    def encode(self, seed_text):
+        """Token ids of the seed, as generate_text tokenized it"""
+        return self.tokenizer.texts_to_sequences([seed_text.lower()])[0]
+
+    def seed_windows(self, seed_texts):
+        """Pre-padded seed windows, one row per text"""
+        windows = np.zeros((len(seed_texts), self.sequence_length), dtype=np.int32)
+        for row, text in zip(windows, seed_texts):
+            ids = self.encode(text)[-self.sequence_length:]
+            if ids:
+                row[-len(ids):] = ids
+        return windows
+
+    def start(self, seed_text):
+        """Next-token probabilities and LSTM state after reading the seed"""
+        zeros = np.zeros((1, self.units), dtype=np.float32)
+        probs, h, c = self.forward(self.seed_windows([seed_text]), zeros, zeros)
+        return probs[0], (h, c)
+
+    def step(self, token, state):
+        """Next-token probabilities and state after one more token"""
+        probs, h, c = self.forward(np.array([[token]], dtype=np.int32), *state)
+        return probs[0], (h, c)
+
+    def generate(self, seed_text, num_words, temperature=1.0, decoding='sample',
+                 top_k=40, top_p=0.9, beam_width=4):
+        """Seed text followed by num_words words under a decoding method"""
+        if decoding == 'beam':
+            return beam_search(self, seed_text, num_words, beam_width)
+
+        probs, state = self.start(seed_text)
+        ids = []
+        for i in range(num_words):
+            index = int(pick_tokens(probs, decoding, temperature, top_k, top_p)[0])
+            if not self.id_to_word[index]:
+                # Padding id: nothing to emit and nothing to feed back
+                continue
+            ids.append(index)
+            if i < num_words - 1:
+                probs, state = self.step(index, state)
+
+        return ' '.join([seed_text.lower()] + list(self.id_to_word[ids]))
+
+
+class NumpySession(GenerationSession):
+    """A session on NumpyModel: no TensorFlow import, no tracing"""
+
+    def __init__(self, model, tokenizer, sequence_length=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.sequence_length = sequence_length or model.sequence_length
+        self.units = model.units
+        self.num_classes = model.num_classes
+        self._init_vocabulary()
+
+    @classmethod
+    def load(cls, model_dir, weights_file=WEIGHTS_FILE):
+        """Session for the exported weights and tokenizer in model_dir"""
+        from preprocessing import load_tokenizer
+
+        model = NumpyModel.load(os.path.join(model_dir, weights_file))
+        tokenizer = load_tokenizer(model_dir)
+        if tokenizer is None:
+            raise FileNotFoundError(f"No tokenizer found in {model_dir}")
+        return cls(model, tokenizer)
+
+    def forward(self, tokens, h, c):
+        """Batched step over rows of tokens from states h, c"""
+        return self.model.forward(
+            np.asarray(tokens),
+            np.asarray(h, dtype=np.float32),
+            np.asarray(c, dtype=np.float32)
+        )
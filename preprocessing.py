@@ -0,0 +1,432 @@
+"""
+Corpus preprocessing without TensorFlow
+Streaming, line-aligned text cleaning that matches RNNTrainer.clean_text,
+a vocabulary/encoder that replaces the pickled Keras Tokenizer, and
+parallel ingestion of sharded local corpora into one token array
+"""
+
+import os
+import re
+import glob
+import gzip
+import json
+import pickle
+import shutil
+import string
+import sys
+import tempfile
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from operator import itemgetter
+
+import numpy as np
+
+# Brackets never span lines ('.' excludes '\n'), so each line-aligned chunk
+# can be cleaned independently
+BRACKETS_RE = re.compile(r'\[.*?\]')
+
+DEFAULT_CHUNK_CHARS = 1 << 22
+
+
+@lru_cache(maxsize=None)
+def _delete_table():
+    """Digits and punctuation except '.', removed in one translate call"""
+    # \d matches exactly the characters where str.isdecimal() is true
+    return dict.fromkeys(
+        [ord(c) for c in string.punctuation.replace('.', '')]
+        + [i for i in range(sys.maxunicode + 1) if chr(i).isdecimal()]
+    )
+
+
+def clean_chunk(chunk):
+    """Clean one line-aligned chunk and collapse its whitespace"""
+    chunk = BRACKETS_RE.sub('', chunk.lower())
+    return ' '.join(chunk.translate(_delete_table()).split())
+
+
+def iter_chunks(source, chunk_chars=DEFAULT_CHUNK_CHARS):
+    """Yield roughly chunk_chars-long pieces of a str or line iterable, split on '\\n'"""
+    if isinstance(source, str):
+        start = 0
+        while start < len(source):
+            end = source.find('\n', start + chunk_chars)
+            end = len(source) if end == -1 else end + 1
+            yield source[start:end]
+            start = end
+        return
+
+    lines = []
+    size = 0
+    for line in source:
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_chars:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    if lines:
+        yield ''.join(lines)
+
+
+def iter_clean_text(source, chunk_chars=DEFAULT_CHUNK_CHARS, workers=1):
+    """Generator of cleaned, non-empty chunks; ' '.join() gives the full text"""
+    chunks = iter_chunks(source, chunk_chars)
+
+    if workers <= 1:
+        cleaned = map(clean_chunk, chunks)
+        yield from (chunk for chunk in cleaned if chunk)
+        return
+
+    # Keep a bounded number of chunks in flight so memory stays flat
+    _delete_table()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(clean_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                cleaned = pending.popleft().result()
+                if cleaned:
+                    yield cleaned
+        while pending:
+            cleaned = pending.popleft().result()
+            if cleaned:
+                yield cleaned
+
+
+def clean_text(source, chunk_chars=DEFAULT_CHUNK_CHARS, workers=None):
+    """Lowercase, drop [stage directions], digits and punctuation but '.', collapse whitespace"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if isinstance(source, str) and len(source) <= chunk_chars:
+        workers = 1
+
+    return ' '.join(iter_clean_text(source, chunk_chars, workers))
+
+
+class Vocabulary:
+    """Frequency-ranked word table and int32 encoder
+
+    Reproduces the Keras Tokenizer used for training (ids ranked by count,
+    ties by first appearance, 1 reserved for the OOV token, ids at or above
+    num_words encoded as OOV) without importing Keras, and saves to JSON
+    instead of a pickle.
+    """
+
+    FORMAT = 'rnn-vocabulary'
+    VERSION = 1
+
+    def __init__(self, words, counts=None, num_words=None, oov_token='<OOV>',
+                 filters='', lower=False, split=' '):
+        # words[i] is the word with id i; id 0 is reserved for padding
+        self.words = list(words)
+        self.counts = list(counts) if counts is not None else [0] * len(words)
+        self.num_words = num_words
+        self.oov_token = oov_token
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+
+        # Later duplicates win, as in Tokenizer.fit_on_texts
+        self.word_index = {
+            word: i for i, word in enumerate(self.words)
+            if i and word is not None
+        }
+        self.oov_index = self.word_index.get(oov_token, -1)
+
+        self._lookup = {
+            word: i if not num_words or i < num_words else self.oov_index
+            for word, i in self.word_index.items()
+        }
+        self._lookup[''] = -1
+        self._default = self.oov_index if oov_token is not None else -1
+
+    @property
+    def index_word(self):
+        return {i: word for word, i in self.word_index.items()}
+
+    def split_words(self, text):
+        """Tokenize like keras text_to_word_sequence (empty tokens kept)"""
+        if self.lower:
+            text = text.lower()
+        if self.filters:
+            text = text.translate(str.maketrans(
+                dict.fromkeys(self.filters, self.split)
+            ))
+        return text.split(self.split)
+
+    @classmethod
+    def fit(cls, texts, num_words=None, oov_token='<OOV>'):
+        """Count words in a string or an iterable of whole-word chunks"""
+        if isinstance(texts, str):
+            texts = [texts]
+
+        vocab = cls([None], num_words=num_words, oov_token=oov_token)
+        counts = Counter()
+        for text in texts:
+            counts.update(vocab.split_words(text))
+        return cls.from_counts(counts, num_words, oov_token)
+
+    @classmethod
+    def from_counts(cls, counts, num_words=None, oov_token='<OOV>'):
+        """Rank words from a Counter filled in corpus order"""
+        counts.pop('', None)
+
+        # Stable sort: equal counts keep first-appearance order
+        ranked = sorted(counts.items(), key=itemgetter(1), reverse=True)
+        words = [None] + ([oov_token] if oov_token is not None else [])
+        return cls(
+            words + [word for word, _ in ranked],
+            [0] * len(words) + [count for _, count in ranked],
+            num_words=num_words,
+            oov_token=oov_token
+        )
+
+    def encode(self, texts, dtype=np.int32):
+        """Token ids of a string or an iterable of whole-word chunks"""
+        if isinstance(texts, str):
+            texts = [texts]
+
+        arrays = []
+        for text in texts:
+            words = self.split_words(text)
+            ids = np.fromiter(
+                map(self._lookup.get, words, repeat(self._default)),
+                dtype=np.int32,
+                count=len(words)
+            )
+            if (ids < 0).any():
+                ids = ids[ids >= 0]
+            arrays.append(ids.astype(dtype, copy=False))
+
+        if not arrays:
+            return np.empty(0, dtype=dtype)
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+    def texts_to_sequences(self, texts):
+        """Keras-compatible list-of-lists encoding"""
+        return [self.encode(text).tolist() for text in texts]
+
+    def class_counts(self, num_classes):
+        """How often each id below num_classes occurs as an encoded token
+
+        Words at or above num_classes are encoded as OOV, so their counts
+        are folded into the OOV id.
+        """
+        counts = np.zeros(num_classes, dtype=np.int64)
+        head = self.counts[:num_classes]
+        counts[:len(head)] = head
+        if 0 <= self.oov_index < num_classes:
+            counts[self.oov_index] += sum(self.counts[num_classes:])
+        return counts
+
+    def to_dict(self, limit=None):
+        """JSON-serialisable form; limit keeps only the first ids"""
+        return {
+            'format': self.FORMAT,
+            'version': self.VERSION,
+            'num_words': self.num_words,
+            'oov_token': self.oov_token,
+            'filters': self.filters,
+            'lower': self.lower,
+            'split': self.split,
+            'words': self.words[:limit],
+            'counts': self.counts[:limit],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('format') != cls.FORMAT:
+            raise ValueError("Not a vocabulary file")
+        return cls(
+            data['words'],
+            data['counts'],
+            num_words=data['num_words'],
+            oov_token=data['oov_token'],
+            filters=data['filters'],
+            lower=data['lower'],
+            split=data['split']
+        )
+
+    def save(self, path, limit=None):
+        """Write the vocabulary as compact JSON"""
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(limit), f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def from_keras(cls, tokenizer):
+        """Convert a fitted Keras Tokenizer, e.g. from an old tokenizer.pkl"""
+        words = [None] * (max(tokenizer.word_index.values(), default=0) + 1)
+        for word, i in tokenizer.word_index.items():
+            words[i] = word
+        counts = [tokenizer.word_counts.get(word, 0) for word in words]
+
+        return cls(
+            words,
+            counts,
+            num_words=tokenizer.num_words,
+            oov_token=tokenizer.oov_token,
+            filters=tokenizer.filters,
+            lower=tokenizer.lower,
+            split=tokenizer.split
+        )
+
+    def to_keras(self, limit=None):
+        """Keras Tokenizer over the first limit ids, for old pickle readers"""
+        from tensorflow.keras.preprocessing.text import Tokenizer
+
+        tokenizer = Tokenizer(
+            num_words=self.num_words,
+            filters=self.filters,
+            lower=self.lower,
+            split=self.split,
+            oov_token=self.oov_token
+        )
+        words = self.words[:limit]
+        tokenizer.word_index = {
+            word: i for i, word in enumerate(words) if i and word is not None
+        }
+        tokenizer.index_word = {i: word for word, i in tokenizer.word_index.items()}
+        tokenizer.word_counts = OrderedDict(
+            (word, count) for word, count in zip(words, self.counts)
+            if word is not None and word != self.oov_token
+        )
+        return tokenizer
+
+
+def load_tokenizer(model_dir):
+    """Load tokenizer.json, falling back to a pickled tokenizer.pkl"""
+    json_path = os.path.join(model_dir, 'tokenizer.json')
+    if os.path.exists(json_path):
+        return Vocabulary.load(json_path)
+
+    pkl_path = os.path.join(model_dir, 'tokenizer.pkl')
+    if os.path.exists(pkl_path):
+        with open(pkl_path, 'rb') as f:
+            tokenizer = pickle.load(f)
+        # Old pickles hold a Keras Tokenizer (unpickling it imports Keras)
+        if isinstance(tokenizer, Vocabulary):
+            return tokenizer
+        return Vocabulary.from_keras(tokenizer)
+
+    return None
+
+
+def find_shards(source):
+    """Text shards (plain or .gz) in a directory, matching a glob, or one file"""
+    if os.path.isdir(source):
+        paths = [
+            os.path.join(source, name) for name in os.listdir(source)
+            if not name.startswith('.')
+        ]
+    else:
+        paths = glob.glob(source, recursive=True)
+
+    shards = sorted(path for path in paths if os.path.isfile(path))
+    if not shards:
+        raise FileNotFoundError(f"No corpus shards found at {source}")
+    return shards
+
+
+def open_shard(path):
+    """Open a shard for text reading, decompressing .gz files"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def _clean_shard(path, clean_path):
+    """Pass 1 worker: clean a shard to disk and count its words"""
+    counts = Counter()
+    first = True
+    with open_shard(path) as src, open(clean_path, 'w', encoding='utf-8') as out:
+        for chunk in iter_clean_text(src):
+            if not first:
+                out.write(' ')
+            out.write(chunk)
+            counts.update(chunk.split(' '))
+            first = False
+    return counts
+
+
+_worker_vocab = None
+
+
+def _set_worker_vocab(vocab):
+    global _worker_vocab
+    _worker_vocab = vocab
+
+
+def _encode_shard(clean_path, tokens_path, dtype):
+    """Pass 2 worker: encode a cleaned shard into its own .npy part"""
+    with open(clean_path, 'r', encoding='utf-8') as f:
+        ids = _worker_vocab.encode(f.read(), dtype=dtype)
+    np.save(tokens_path, ids)
+    os.remove(clean_path)
+    return len(ids)
+
+
+def ingest_corpus(source, tokens_path, num_words=None, oov_token='<OOV>',
+                  workers=None, dtype_for=None):
+    """Clean, count and encode every shard in parallel into one .npy token array
+
+    Shards are processed in two passes on a process pool: clean + count
+    (to rank the shared vocabulary), then encode. Each worker holds one
+    shard at a time, and shard token arrays are appended in order to
+    tokens_path, which is returned as a memmap with the Vocabulary.
+    """
+    shards = find_shards(source)
+    workers = min(workers or os.cpu_count() or 1, len(shards))
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(tokens_path) or '.')
+
+    try:
+        clean_paths = [
+            os.path.join(work_dir, f"shard{i}.txt") for i in range(len(shards))
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shard_counts = pool.map(_clean_shard, shards, clean_paths)
+
+            # Merging in shard order keeps first-appearance tie-breaking
+            counts = Counter()
+            for i, shard_count in enumerate(shard_counts, 1):
+                counts.update(shard_count)
+                print(f"  Cleaned shard {i}/{len(shards)}")
+
+        vocab = Vocabulary.from_counts(counts, num_words, oov_token)
+        dtype = dtype_for(vocab) if dtype_for else np.int32
+
+        part_paths = [
+            os.path.join(work_dir, f"shard{i}.npy") for i in range(len(shards))
+        ]
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_set_worker_vocab,
+                                 initargs=(vocab,)) as pool:
+            lengths = list(pool.map(
+                _encode_shard, clean_paths, part_paths, repeat(dtype)
+            ))
+
+        tmp_path = os.path.join(work_dir, 'tokens.npy')
+        tokens = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=dtype, shape=(sum(lengths),)
+        )
+        offset = 0
+        for part_path, length in zip(part_paths, lengths):
+            tokens[offset:offset + length] = np.load(part_path, mmap_mode='r')
+            offset += length
+            os.remove(part_path)
+        tokens.flush()
+        del tokens
+        os.replace(tmp_path, tokens_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"✓ Ingested {len(shards):,} shards into {offset:,} tokens")
+    return vocab, np.load(tokens_path, mmap_mode='r')
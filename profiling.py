@@ -0,0 +1,221 @@
+"""
+Per-stage profiling of the training pipeline
+StageProfiler measures wall-clock time, CPU time and peak RSS of named,
+possibly nested, stages and can keep a cProfile dump per stage. A disabled
+profiler hands out one shared no-op context, so instrumented code costs
+nothing when profiling is off.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import pstats
+import cProfile
+import contextlib
+
+# Shared no-op stage for a disabled profiler
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def _max_rss():
+    """Process peak RSS in bytes from getrusage, None where unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def process_rss():
+    """Resident set size of this process in bytes (peak RSS without /proc)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return _max_rss()
+
+
+def _peak_rss():
+    """Peak RSS in bytes since the last reset_peak_rss(), or the process peak"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            match = re.search(r'VmHWM:\s+(\d+) kB', f.read())
+        if match:
+            return int(match.group(1)) * 1024
+    except OSError:
+        pass
+    return _max_rss()
+
+
+def _cpu_time():
+    """User + system CPU seconds of this process and its reaped workers"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter (Linux); False if unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class StageProfiler:
+    """Wall, CPU and peak-memory measurement of named pipeline stages
+
+    Stages nest: each is keyed by its path ('train', 'data/tokenizer')
+    and reports inclusive times; CPU time includes worker processes that
+    finished within the stage. With cprofile, every stage gets its own
+    cProfile that is paused while a child stage runs, so each dump only
+    covers the stage's own code. Peak RSS is per stage where the kernel
+    lets the counter be reset, otherwise the process peak so far.
+    """
+
+    def __init__(self, enabled=False, cprofile=False):
+        self.enabled = enabled
+        self.cprofile = cprofile
+        self.stages = {}
+        self.per_stage_peak = None
+        self._stack = []
+        self._start = time.perf_counter()
+
+    def _fold_peak(self):
+        """Credit the peak since the last reset to every open stage"""
+        peak = _peak_rss()
+        if peak is not None:
+            for frame in self._stack:
+                frame['peak'] = max(frame['peak'] or 0, peak)
+        if self.per_stage_peak is not False:
+            self.per_stage_peak = reset_peak_rss()
+
+    def stage(self, name):
+        """Context manager measuring one stage; a no-op when disabled"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._measure(name)
+
+    @contextlib.contextmanager
+    def _measure(self, name):
+        parent = self._stack[-1] if self._stack else None
+        path = f"{parent['path']}/{name}" if parent else name
+
+        self._fold_peak()
+        if parent is not None and parent['profile'] is not None:
+            parent['profile'].disable()
+
+        self.stages.setdefault(path, {
+            'stage': path,
+            'depth': path.count('/'),
+            'calls': 0,
+            'wall_s': 0.0,
+            'cpu_s': 0.0,
+            'peak_rss_mb': None,
+            'rss_delta_mb': 0.0,
+            'profile': None
+        })
+        frame = {
+            'path': path,
+            'peak': None,
+            'profile': cProfile.Profile() if self.cprofile else None,
+            'rss': process_rss(),
+            'wall': time.perf_counter(),
+            'cpu': _cpu_time()
+        }
+        self._stack.append(frame)
+        if frame['profile'] is not None:
+            frame['profile'].enable()
+        try:
+            yield
+        finally:
+            if frame['profile'] is not None:
+                frame['profile'].disable()
+            wall = time.perf_counter() - frame['wall']
+            cpu = _cpu_time() - frame['cpu']
+            self._fold_peak()
+            self._stack.pop()
+            if parent is not None and parent['profile'] is not None:
+                parent['profile'].enable()
+
+            rss = process_rss()
+            entry = self.stages[path]
+            entry['calls'] += 1
+            entry['wall_s'] += wall
+            entry['cpu_s'] += cpu
+            if frame['peak'] is not None:
+                entry['peak_rss_mb'] = max(
+                    entry['peak_rss_mb'] or 0.0, frame['peak'] / 2**20
+                )
+            if rss is not None and frame['rss'] is not None:
+                entry['rss_delta_mb'] += (rss - frame['rss']) / 2**20
+            if frame['profile'] is not None:
+                if entry['profile'] is None:
+                    entry['profile'] = pstats.Stats(frame['profile'])
+                else:
+                    entry['profile'].add(frame['profile'])
+
+    def report(self):
+        """Stage measurements in the order the stages started"""
+        stages = []
+        for entry in self.stages.values():
+            entry = {k: v for k, v in entry.items() if k != 'profile'}
+            entry['cpu_util'] = (
+                entry['cpu_s'] / entry['wall_s'] if entry['wall_s'] else 0.0
+            )
+            stages.append(entry)
+        return {
+            'total_wall_s': time.perf_counter() - self._start,
+            'per_stage_peak_rss': bool(self.per_stage_peak),
+            'cpu_count': os.cpu_count(),
+            'stages': stages
+        }
+
+    def summary_table(self, report=None):
+        report = report or self.report()
+        lines = [
+            f"{'stage':<36} {'calls':>5} {'wall':>10} {'cpu':>10} "
+            f"{'cpu/wall':>8} {'peak RSS':>10} {'RSS +/-':>9}"
+        ]
+        for entry in report['stages']:
+            name = '  ' * entry['depth'] + entry['stage'].rsplit('/', 1)[-1]
+            peak = entry['peak_rss_mb']
+            peak = f"{peak:>8.0f}MB" if peak is not None else f"{'-':>10}"
+            lines.append(
+                f"{name:<36} {entry['calls']:>5} {entry['wall_s']:>9.2f}s "
+                f"{entry['cpu_s']:>9.2f}s {entry['cpu_util']:>8.2f} {peak} "
+                f"{entry['rss_delta_mb']:>+7.0f}MB"
+            )
+        if not report['per_stage_peak_rss']:
+            lines.append("(peak RSS is the process peak up to each stage's end)")
+        return '\n'.join(lines)
+
+    def save(self, directory, extra=None):
+        """Write profile.json, profile.txt and per-stage .prof files"""
+        report = self.report()
+        if extra:
+            report.update(extra)
+
+        if self.cprofile:
+            profile_dir = os.path.join(directory, 'profile')
+            os.makedirs(profile_dir, exist_ok=True)
+            for path, entry in self.stages.items():
+                if entry['profile'] is None:
+                    continue
+                filename = path.replace('/', '.') + '.prof'
+                entry['profile'].dump_stats(os.path.join(profile_dir, filename))
+                for stage in report['stages']:
+                    if stage['stage'] == path:
+                        stage['cprofile'] = os.path.join('profile', filename)
+
+        table = self.summary_table(report)
+        with open(os.path.join(directory, 'profile.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(directory, 'profile.txt'), 'w') as f:
+            f.write(table + '\n')
+        return report, table
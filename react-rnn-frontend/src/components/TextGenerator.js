@@ -6,6 +6,7 @@ function TextGenerator({ onGenerateComplete, generatedResults }) {
   const [seedText, setSeedText] = useState('');
   const [numWords, setNumWords] = useState(30);
   const [temperature, setTemperature] = useState(1.0);
+  const [numSamples, setNumSamples] = useState(1);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
@@ -28,22 +29,29 @@ function TextGenerator({ onGenerateComplete, generatedResults }) {
 
     try {
       const apiUrl = process.env.REACT_APP_API_URL || '';
-      const response = await axios.post(`${apiUrl}/api/generate`, {
-        seed_text: seedText,
-        num_words: numWords,
-        temperature: temperature
+      // All samples are generated together in one batched request
+      const response = await axios.post(`${apiUrl}/api/generate/batch`, {
+        items: [{
+          seed_text: seedText,
+          num_words: numWords,
+          temperature: temperature,
+          n: numSamples
+        }]
       });
 
       if (response.data.success) {
-        onGenerateComplete({
-          seed: seedText,
-          generated: response.data.generated_text,
-          timestamp: new Date().toISOString(),
-          stats: {
-            words: numWords,
-            temperature: temperature,
-            time: response.data.generation_time || 'N/A'
-          }
+        const item = response.data.results[0];
+        item.generated_texts.forEach((generated) => {
+          onGenerateComplete({
+            seed: seedText,
+            generated: generated,
+            timestamp: new Date().toISOString(),
+            stats: {
+              words: numWords,
+              temperature: temperature,
+              time: item.generation_time || 'N/A'
+            }
+          });
         });
       } else {
         setError(response.data.error || 'Generation failed');
@@ -143,6 +151,25 @@ function TextGenerator({ onGenerateComplete, generatedResults }) {
               <span>2.0 (Wild)</span>
             </div>
           </div>
+
+          <div className="param-group">
+            <label htmlFor="numSamples">
+              Samples: <strong>{numSamples}</strong>
+            </label>
+            <input
+              type="range"
+              id="numSamples"
+              min="1"
+              max="5"
+              value={numSamples}
+              onChange={(e) => setNumSamples(parseInt(e.target.value))}
+              className="slider"
+            />
+            <div className="slider-labels">
+              <span>1</span>
+              <span>5</span>
+            </div>
+          </div>
         </div>
 
         {/* Generate Button */}
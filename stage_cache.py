@@ -0,0 +1,125 @@
+"""
+Content-addressed cache for training pipeline stages
+Each stage output is stored under a key hashed from its inputs, so
+re-runs skip every stage whose inputs and config did not change
+"""
+
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+
+
+def file_fingerprint(path):
+    """Cheap identity for an input file: absolute path, size and mtime"""
+    stat = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+
+class StageCache:
+    """Stores stage outputs as txt/json/npy files keyed by input hashes"""
+
+    FORMATS = ('txt', 'json', 'npy')
+
+    def __init__(self, cache_dir, max_bytes=None, max_age_days=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(stage, **inputs):
+        """Hash a stage name and its JSON-serialisable inputs"""
+        payload = json.dumps(
+            {'stage': stage, 'inputs': inputs},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:20]
+
+    def path(self, stage, key, fmt):
+        """Location of a stage entry"""
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown cache format: {fmt}")
+        return os.path.join(self.cache_dir, f"{stage}-{key}.{fmt}")
+
+    def load(self, stage, key, fmt):
+        """Return the cached value, or None on a miss"""
+        path = self.path(stage, key, fmt)
+        if not os.path.exists(path):
+            return None
+
+        # Refresh the timestamp so eviction is least-recently-used
+        os.utime(path)
+
+        if fmt == 'npy':
+            return np.load(path, mmap_mode='r')
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read() if fmt == 'txt' else json.load(f)
+
+    def save(self, stage, key, fmt, value):
+        """Atomically write a stage output and evict stale entries"""
+        path = self.path(stage, key, fmt)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+
+        if fmt == 'npy':
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.asarray(value))
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                if fmt == 'txt':
+                    f.write(value)
+                else:
+                    json.dump(value, f)
+        os.replace(tmp_path, path)
+
+        self.evict(keep=path)
+        return path
+
+    def entries(self):
+        """(path, size, mtime) for every cache entry, oldest first"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if '.tmp-' in name:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, keep=None):
+        """Drop entries older than max_age_days, then the oldest over max_bytes"""
+        entries = self.entries()
+        removed = []
+
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            for entry in entries:
+                if entry[2] < cutoff and entry[0] != keep:
+                    removed.append(entry)
+
+        if self.max_bytes is not None:
+            remaining = [e for e in entries if e not in removed]
+            total = sum(e[1] for e in remaining)
+            for entry in remaining:
+                if total <= self.max_bytes:
+                    break
+                if entry[0] != keep:
+                    removed.append(entry)
+                    total -= entry[1]
+
+        for path, _, _ in removed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        if removed:
+            print(f"  Evicted {len(removed)} stale cache entries")
+        return [path for path, _, _ in removed]
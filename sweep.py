@@ -0,0 +1,338 @@
+"""
+Hyperparameter sweep for RNNTrainer
+Samples trial configs from a search space, prepares the shared data once,
+and trains trials on a process pool with successive halving: every rung
+trains the survivors for more epochs and keeps the best 1/eta of them.
+Results go to one leaderboard file; the best trial's artifacts are copied
+into model_dir.
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TF warnings
+
+import json
+import math
+import time
+import shutil
+import random
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import tensorflow as tf
+from tensorflow import keras
+
+from train_model import RNNTrainer
+from numpy_engine import WEIGHTS_FILE, QUANTIZED_WEIGHTS_FILE
+
+DEFAULT_SPACE = {
+    'lstm_units': [128, 256, 512],
+    'dense_units': [64, 128, 256],
+    'dropout_rate': {'uniform': [0.1, 0.4]},
+    'learning_rate': {'log_uniform': [1e-4, 3e-3]},
+    'batch_size': [64, 128, 256],
+}
+
+# Artifacts copied from the winning trial into model_dir
+ARTIFACTS = ['final_model.h5', 'tokenizer.json', 'tokenizer.pkl',
+             'config.json', 'history.pkl', WEIGHTS_FILE,
+             QUANTIZED_WEIGHTS_FILE]
+
+
+def sample_value(spec, rng):
+    """Draw one value: a list is a choice, a dict a uniform/log_uniform/int range"""
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    if not isinstance(spec, dict):
+        return spec
+
+    (kind, (low, high)), = spec.items()
+    if kind == 'uniform':
+        return rng.uniform(low, high)
+    if kind == 'log_uniform':
+        return math.exp(rng.uniform(math.log(low), math.log(high)))
+    if kind == 'int':
+        return rng.randint(low, high)
+    raise ValueError(f"Unknown search space entry: {spec}")
+
+
+def sample_configs(space, n_trials, seed=42):
+    """n_trials distinct config overrides drawn from the search space"""
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n_trials * 20):
+        config = {key: sample_value(spec, rng) for key, spec in space.items()}
+        if config not in configs:
+            configs.append(config)
+        if len(configs) == n_trials:
+            break
+    return configs
+
+
+def halving_rungs(min_epochs, max_epochs, eta):
+    """Cumulative epoch budgets: min_epochs * eta**k, ending at max_epochs"""
+    rungs = [min_epochs]
+    while rungs[-1] * eta < max_epochs:
+        rungs.append(rungs[-1] * eta)
+    if rungs[-1] < max_epochs:
+        rungs.append(max_epochs)
+    return rungs
+
+
+def _init_trial_process(threads):
+    """Pool initializer: cap TF threads before the runtime starts"""
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(max(1, threads // 2))
+
+
+def run_trial(config, epochs_done, epochs):
+    """Train one trial up to `epochs` total epochs, resuming from its last rung"""
+    start = time.time()
+    trainer = RNNTrainer(dict(config, epochs=epochs - epochs_done))
+    X, y = trainer.prepare_training_data()
+
+    checkpoint = os.path.join(config['model_dir'], 'trial.keras')
+    exported = (config['output_head'] == 'sampled'
+                or config['training_mode'] == 'tbptt')
+    if epochs_done and not exported:
+        # Weights and optimizer state from the previous rung
+        trainer.model = keras.models.load_model(checkpoint)
+    else:
+        trainer.build_model()
+        if epochs_done:
+            # The sampled head exports a Dense softmax and TBPTT a stateless
+            # windowed model; copy the weights back by layer name
+            saved = keras.models.load_model(checkpoint)
+            for layer in trainer.model.layers:
+                if layer.weights:
+                    weights = saved.get_layer(layer.name).get_weights()
+                    if layer.name == 'output' and config['output_head'] == 'sampled':
+                        weights = [weights[0].T, weights[1]]
+                    layer.set_weights(weights)
+
+    history = trainer.train(X, y)
+    trainer.model.save(checkpoint)
+    trainer.save_model(history)
+
+    return {
+        'val_loss': float(min(history.history['val_loss'])),
+        'loss': float(history.history['loss'][-1]),
+        'epochs': epochs_done + len(history.history['loss']),
+        'time': time.time() - start
+    }
+
+
+def write_leaderboard(path, trials, rungs, best=None):
+    """Rank trials by best validation loss and write them as JSON"""
+    ranked = sorted(
+        trials,
+        key=lambda t: (t['val_loss'] is None, t['val_loss'] or 0.0)
+    )
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'updated': datetime.now().isoformat(),
+            'rungs': rungs,
+            'best': best,
+            'trials': ranked
+        }, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_sweep(space, base_config=None, n_trials=9, min_epochs=1,
+              max_epochs=9, eta=3, cores_per_trial=1, seed=42):
+    """Successive-halving sweep over space; returns the leaderboard entries"""
+    print("\n" + "="*70)
+    print(" " * 18 + "HYPERPARAMETER SWEEP")
+    print("="*70)
+
+    # Prepare the shared data once; trials then hit the stage cache
+    base = RNNTrainer(base_config)
+    if not base.config['use_cache']:
+        raise ValueError("Sweeps share prepared data through the stage cache")
+    base.prepare_training_data()
+
+    sweep_dir = os.path.join(base.config['model_dir'], 'sweep')
+    os.makedirs(sweep_dir, exist_ok=True)
+    leaderboard_path = os.path.join(sweep_dir, 'leaderboard.json')
+
+    trials = []
+    for i, overrides in enumerate(sample_configs(space, n_trials, seed)):
+        trials.append({
+            'trial': i,
+            'overrides': overrides,
+            'model_dir': os.path.join(sweep_dir, f'trial_{i:03d}'),
+            'status': 'pending',
+            'val_loss': None,
+            'epochs': 0,
+            'time': 0.0
+        })
+
+    rungs = halving_rungs(min_epochs, max_epochs, eta)
+    workers = max(1, (os.cpu_count() or 1) // cores_per_trial)
+    print(f"\n{len(trials)} trials, rungs at {rungs} epochs, eta={eta}")
+    print(f"{workers} parallel trials x {cores_per_trial} cores")
+
+    alive = list(trials)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_trial_process,
+        initargs=(cores_per_trial,)
+    ) as pool:
+        for rung, epochs in enumerate(rungs):
+            print(f"\n--- Rung {rung + 1}/{len(rungs)}: "
+                  f"{len(alive)} trials to {epochs} epochs ---")
+
+            futures = {}
+            for trial in alive:
+                config = dict(
+                    base.config,
+                    **trial['overrides'],
+                    model_dir=trial['model_dir']
+                )
+                futures[trial['trial']] = pool.submit(
+                    run_trial, config, trial['epochs'], epochs
+                )
+
+            for trial in alive:
+                try:
+                    result = futures[trial['trial']].result()
+                except Exception as e:
+                    trial['status'] = 'failed'
+                    trial['error'] = str(e)
+                    print(f"⚠️  Trial {trial['trial']} failed: {e}")
+                    continue
+                trial['val_loss'] = result['val_loss']
+                trial['epochs'] = result['epochs']
+                trial['time'] += result['time']
+                trial['status'] = 'running'
+                print(f"  Trial {trial['trial']:>3}: val_loss "
+                      f"{result['val_loss']:.4f} after {result['epochs']} epochs")
+
+            alive = sorted(
+                [t for t in alive if t['status'] == 'running'],
+                key=lambda t: t['val_loss']
+            )
+            if rung < len(rungs) - 1:
+                keep = max(1, len(alive) // eta)
+                for trial in alive[keep:]:
+                    trial['status'] = f'stopped at rung {rung + 1}'
+                alive = alive[:keep]
+
+            write_leaderboard(leaderboard_path, trials, rungs)
+
+    if not alive:
+        raise RuntimeError("Every trial failed")
+
+    for trial in alive:
+        trial['status'] = 'completed'
+    best = alive[0]
+
+    # Promote the winner to the regular serving location
+    model_dir = base.config['model_dir']
+    for name in ARTIFACTS:
+        src = os.path.join(best['model_dir'], name)
+        dst = os.path.join(model_dir, name)
+        if os.path.exists(src):
+            shutil.copy2(src, dst)
+        elif os.path.exists(dst):
+            # Left over from an earlier run; never serve it with the winner
+            os.remove(dst)
+
+    write_leaderboard(leaderboard_path, trials, rungs, best={
+        'trial': best['trial'],
+        'overrides': best['overrides'],
+        'val_loss': best['val_loss'],
+        'model_dir': model_dir
+    })
+
+    print("\n" + "="*70)
+    print(" " * 22 + "SWEEP COMPLETE")
+    print("="*70)
+    print(f"Best trial {best['trial']}: val_loss {best['val_loss']:.4f}")
+    for key, value in best['overrides'].items():
+        print(f"  {key}: {value}")
+    print(f"\n✓ Leaderboard saved: {leaderboard_path}")
+    print(f"✓ Best model copied to: {model_dir}")
+
+    return trials
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='Successive-halving hyperparameter sweep for the RNN model'
+    )
+    parser.add_argument(
+        '--space',
+        default=None,
+        help='JSON file mapping config keys to a list of choices or '
+             '{"uniform"|"log_uniform"|"int": [low, high]} '
+             '(default: a built-in space)'
+    )
+    parser.add_argument(
+        '--trials',
+        type=int,
+        default=9,
+        help='Number of sampled configurations (default: 9)'
+    )
+    parser.add_argument(
+        '--min-epochs',
+        type=int,
+        default=1,
+        help='Epochs in the first rung (default: 1)'
+    )
+    parser.add_argument(
+        '--max-epochs',
+        type=int,
+        default=9,
+        help='Epochs for the trials that survive every rung (default: 9)'
+    )
+    parser.add_argument(
+        '--eta',
+        type=int,
+        default=3,
+        help='Keep the best 1/eta trials at each rung (default: 3)'
+    )
+    parser.add_argument(
+        '--cores-per-trial',
+        type=int,
+        default=1,
+        help='TF threads per trial; trials run on cpu_count // this '
+             'processes (default: 1)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=42,
+        help='Seed for sampling configurations (default: 42)'
+    )
+    parser.add_argument(
+        '--corpus',
+        default=None,
+        help='Directory or glob of local text shards to train on'
+    )
+
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space, 'r') as f:
+            space = json.load(f)
+
+    run_sweep(
+        space,
+        base_config={'corpus': args.corpus},
+        n_trials=args.trials,
+        min_epochs=args.min_epochs,
+        max_epochs=args.max_epochs,
+        eta=args.eta,
+        cores_per_trial=args.cores_per_trial,
+        seed=args.seed
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Check that data-parallel training reports the same loss at any worker count
+Trains a tiny model on a synthetic corpus with one worker at batch 128
+and with two localhost workers at batch 64 each, at the same learning
+rate. The global batch and the updates are the same, so the final loss
+and val_loss must agree up to the window order; a loss or gradient
+scaled by the number of workers shows up as a gap.
+Runs without data or a trained model; exits non-zero on a mismatch.
+Also collected by pytest.
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TF warnings
+
+import tempfile
+
+from benchmark import synthetic_corpus
+
+# Allowed relative gap between the 1- and 2-worker losses
+LOSS_TOLERANCE = 0.1
+
+
+def train_tiny(num_workers, work_dir):
+    """History of a short run with a global batch of 128 over num_workers"""
+    from distributed_train import launch_local
+
+    config = {
+        'corpus': os.path.join(work_dir, 'corpus'),
+        'data_dir': os.path.join(work_dir, 'data'),
+        'model_dir': os.path.join(work_dir, f'models_{num_workers}'),
+        'max_vocab_size': 500,
+        'embedding_dim': 16,
+        'lstm_units': 32,
+        'dense_units': 32,
+        'batch_size': 128 // num_workers,
+        'lr_scaling': 'none',
+        'epochs': 2,
+        'steps_per_epoch': 20,
+        'model_mode': 'fast',
+        'save_model': False
+    }
+    return launch_local(num_workers, config)['history']
+
+
+def test_loss_matches_across_worker_counts():
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(work_dir, 'corpus'))
+        with open(os.path.join(work_dir, 'corpus', 'shard.txt'), 'w') as f:
+            f.write(synthetic_corpus(500, 60000))
+
+        single = train_tiny(1, work_dir)
+        double = train_tiny(2, work_dir)
+
+    for key in ('loss', 'val_loss'):
+        expected, actual = single[key][-1], double[key][-1]
+        gap = abs(actual - expected) / expected
+        assert gap <= LOSS_TOLERANCE, (
+            f"{key}: {expected:.4f} with 1 worker, {actual:.4f} with 2"
+        )
+
+
+if __name__ == '__main__':
+    import sys
+
+    print("="*60)
+    print("DATA-PARALLEL LOSS AT 1 AND 2 WORKERS")
+    print("="*60)
+
+    try:
+        test_loss_matches_across_worker_counts()
+        print("✓ test_loss_matches_across_worker_counts")
+    except AssertionError as e:
+        print(f"❌ test_loss_matches_across_worker_counts: {e}")
+        sys.exit(1)
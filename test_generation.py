@@ -4,13 +4,18 @@ Simple script to test if model works
 """
 
 import numpy as np
-import pickle
 import os
+import time
+
+from preprocessing import load_tokenizer
 
 # Check if model exists
 model_dir = 'saved_models/'
 model_path = os.path.join(model_dir, 'final_model.h5')
-tokenizer_path = os.path.join(model_dir, 'tokenizer.pkl')
+tokenizer_paths = [
+    os.path.join(model_dir, 'tokenizer.json'),
+    os.path.join(model_dir, 'tokenizer.pkl')
+]
 
 if not os.path.exists(model_path):
     print("❌ Model not found!")
@@ -20,23 +25,23 @@ if not os.path.exists(model_path):
     print("   - Or: Run notebook RNN_NextWord_Complete_Assignment.ipynb")
     exit(1)
 
-if not os.path.exists(tokenizer_path):
+if not any(os.path.exists(path) for path in tokenizer_paths):
     print("❌ Tokenizer not found!")
-    print(f"   Expected: {tokenizer_path}")
+    print(f"   Expected: {' or '.join(tokenizer_paths)}")
     exit(1)
 
 print("Loading model...")
 import tensorflow as tf
 from tensorflow import keras
-from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+from inference import InferenceSession
 
 # Load model
 model = keras.models.load_model(model_path)
 print("✓ Model loaded")
 
-# Load tokenizer
-with open(tokenizer_path, 'rb') as f:
-    tokenizer = pickle.load(f)
+# Load tokenizer (tokenizer.json, or an older tokenizer.pkl)
+tokenizer = load_tokenizer(model_dir)
 print("✓ Tokenizer loaded")
 
 # Model info
@@ -45,46 +50,13 @@ print(f"  Vocabulary size: {len(tokenizer.word_index) + 1:,}")
 print(f"  Sequence length: {model.input_shape[1]}")
 
 
-def generate_text(seed_text, num_words=30, temperature=1.0):
-    """Generate text from seed"""
-    sequence_length = model.input_shape[1]
-    generated_text = seed_text.lower()
-
-    for _ in range(num_words):
-        # Tokenize
-        token_list = tokenizer.texts_to_sequences([generated_text])[0]
-        token_list = token_list[-sequence_length:]
-
-        # Pad
-        token_list = pad_sequences(
-            [token_list],
-            maxlen=sequence_length,
-            padding='pre'
-        )
-
-        # Predict
-        predicted_probs = model.predict(token_list, verbose=0)[0]
-
-        # Temperature sampling
-        if temperature != 1.0:
-            predicted_probs = np.log(predicted_probs + 1e-10) / temperature
-            predicted_probs = np.exp(predicted_probs)
-            predicted_probs = predicted_probs / np.sum(predicted_probs)
-
-        # Sample
-        predicted_index = np.random.choice(
-            len(predicted_probs),
-            p=predicted_probs
-        )
-
-        # Convert to word
-        reverse_word_index = {v: k for k, v in tokenizer.word_index.items()}
-        output_word = reverse_word_index.get(predicted_index, '')
+# Traced once; reads each seed once, then one LSTM step per word
+session = InferenceSession(model, tokenizer)
 
-        if output_word:
-            generated_text += " " + output_word
 
-    return generated_text
+def generate_text(seed_text, num_words=30, temperature=1.0, **decoding):
+    """Generate text from seed (decoding: method, top_k, top_p, beam_width)"""
+    return session.generate(seed_text, num_words, temperature, **decoding)
 
 
 # Test generation
@@ -110,6 +82,37 @@ for seed in test_seeds:
         generated = generate_text(seed, num_words=20, temperature=temp)
         print(f"T={temp}: {generated}")
 
+print("\n🔎 Generating with different decoding methods:\n")
+
+decoders = [
+    ('greedy', {'decoding': 'greedy'}),
+    ('top-k 40', {'decoding': 'top_k', 'top_k': 40}),
+    ('top-p 0.9', {'decoding': 'top_p', 'top_p': 0.9}),
+    ('beam 4', {'decoding': 'beam', 'beam_width': 4})
+]
+
+for seed in test_seeds:
+    print(f"\nSeed: '{seed}'")
+    print("-" * 60)
+
+    for name, options in decoders:
+        generated = generate_text(seed, num_words=20, **options)
+        print(f"{name:<10} {generated}")
+
+# Beams advance together in one batched step, so width 8 should cost
+# far less than 8x greedy
+timings = {}
+for name, options in [('greedy', {'decoding': 'greedy'}),
+                      ('beam 8', {'decoding': 'beam', 'beam_width': 8})]:
+    start = time.perf_counter()
+    for seed in test_seeds:
+        generate_text(seed, num_words=20, **options)
+    timings[name] = (time.perf_counter() - start) / len(test_seeds)
+
+print(f"\n⏱ Per request (20 words): greedy {timings['greedy']*1000:.1f}ms, "
+      f"beam 8 {timings['beam 8']*1000:.1f}ms "
+      f"({timings['beam 8'] / timings['greedy']:.1f}x)")
+
 print("\n" + "="*60)
 print("✓ Model is working correctly!")
 print("="*60)
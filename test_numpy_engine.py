@@ -0,0 +1,125 @@
+"""
+Check the NumPy engine and the incremental step model against Keras
+Builds a tiny untrained model in each layout, with padding and words that
+have no pretrained vector, exports it and compares:
+- NumpyModel.predict with model.predict on padded windows
+- build_step_model, reading a window step by step, with the window model
+Runs without a trained model or data; exits non-zero on a mismatch.
+Also collected by pytest.
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TF warnings
+
+import io
+import tempfile
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from export_numpy import DEFAULT_TOLERANCE, random_windows, relative_diff
+
+SEQUENCE_LENGTH = 12
+WORDS = ['the', 'king', 'of', 'to', 'be', 'or', 'not', 'a', 'time', 'once',
+         'upon', 'dream', 'world', 'all', 'crown', 'sword']
+
+
+def build_tiny_model(mode):
+    """Untrained model of the given layout; ids 3-5 have no pretrained vector
+
+    Saved and reloaded from .h5, as the app and scripts load models.
+    """
+    from tensorflow import keras
+    from train_model import RNNTrainer
+
+    trainer = RNNTrainer({
+        'sequence_length': SEQUENCE_LENGTH,
+        'max_vocab_size': 50,
+        'embedding_dim': 8,
+        'lstm_units': 16,
+        'dense_units': 16,
+        'model_mode': mode,
+        'data_dir': tempfile.gettempdir(),
+        'model_dir': tempfile.gettempdir()
+    })
+    with redirect_stdout(io.StringIO()):
+        trainer.create_tokenizer(' '.join(WORDS * 3))
+        trainer.create_embedding_matrix(None)
+        # Zero rows, as GloVe leaves them: padding and words without vectors
+        trainer.embedding_matrix[0] = 0
+        trainer.embedding_matrix[3:6] = 0
+        model = trainer.build_model()
+    model.build((None, SEQUENCE_LENGTH))
+
+    # Trained biases are non-zero; all-zero ones would make padding read
+    # as input leave a zero state unchanged and hide a lost mask
+    lstm = model.get_layer('lstm')
+    kernel, recurrent_kernel, bias = lstm.get_weights()
+    bias = np.random.default_rng(0).normal(0, 0.5, bias.shape).astype(np.float32)
+    lstm.set_weights([kernel, recurrent_kernel, bias])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'final_model.h5')
+        model.save(path)
+        model = keras.models.load_model(path, compile=False)
+    return model, trainer.vocab_size
+
+
+def test_numpy_predict_matches_keras():
+    from numpy_engine import NumpyModel, export_weights
+
+    for mode in ('standard', 'fast'):
+        model, vocab_size = build_tiny_model(mode)
+        windows = random_windows(64, SEQUENCE_LENGTH, vocab_size)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model_weights.npz')
+            export_weights(model, path)
+            numpy_model = NumpyModel.load(path)
+
+        expected = model.predict(windows, verbose=0)
+        actual = numpy_model.predict(windows)
+        diff = relative_diff(expected, actual)
+        assert diff <= DEFAULT_TOLERANCE, f"{mode}: relative diff {diff:.2e}"
+        assert (expected.argmax(axis=1) == actual.argmax(axis=1)).all(), mode
+
+
+def test_step_model_matches_window():
+    from inference import build_step_model
+
+    for mode in ('standard', 'fast'):
+        model, vocab_size = build_tiny_model(mode)
+        step_model = build_step_model(model)
+        windows = random_windows(16, SEQUENCE_LENGTH, vocab_size)
+        expected = model.predict(windows, verbose=0)
+
+        # Half the window at once, then the rest one token at a time
+        half = SEQUENCE_LENGTH // 2
+        zeros = np.zeros((len(windows), step_model.inputs[1].shape[-1]),
+                         dtype=np.float32)
+        step = lambda tokens, h, c: [x.numpy() for x in step_model([tokens, h, c])]
+        probs, h, c = step(windows[:, :half], zeros, zeros)
+        for i in range(half, SEQUENCE_LENGTH):
+            probs, h, c = step(windows[:, i:i + 1], h, c)
+
+        diff = relative_diff(expected, probs)
+        assert diff <= DEFAULT_TOLERANCE, f"{mode}: relative diff {diff:.2e}"
+
+
+if __name__ == '__main__':
+    import sys
+
+    print("="*60)
+    print("NUMPY ENGINE / STEP MODEL EQUIVALENCE")
+    print("="*60)
+
+    failed = False
+    for check in (test_numpy_predict_matches_keras, test_step_model_matches_window):
+        try:
+            check()
+            print(f"✓ {check.__name__}")
+        except AssertionError as e:
+            print(f"❌ {check.__name__}: {e}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
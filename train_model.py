@@ -10,20 +10,30 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TF warnings
 import numpy as np
 import pickle
 import json
+import math
 import time
+import tracemalloc
 from datetime import datetime
 import argparse
 
 # Deep Learning
 import tensorflow as tf
 from tensorflow import keras
-from tensorflow.keras.preprocessing.text import Tokenizer
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Embedding, LSTM, Dense, Dropout, Masking
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
 from tensorflow.keras.utils import to_categorical
 
+import preprocessing
+from preprocessing import Vocabulary
+from profiling import StageProfiler, process_rss
+from checkpoints import CheckpointWriter, latest_checkpoint, load_checkpoint
+from embeddings import load_embedding_table, parse_embedding_file
+from numpy_engine import (WEIGHTS_FILE, QUANTIZED_WEIGHTS_FILE, export_weights,
+                          quantize_weights)
+from stage_cache import StageCache, file_fingerprint
+
 print(f"TensorFlow version: {tf.__version__}")
 print(f"GPU Available: {len(tf.config.list_physical_devices('GPU')) > 0}")
 
@@ -31,6 +41,440 @@ print(f"GPU Available: {len(tf.config.list_physical_devices('GPU')) > 0}")
 np.random.seed(42)
 tf.random.set_seed(42)
 
+DATASET_URL = 'https://storage.googleapis.com/download.tensorflow.org/data/shakespeare.txt'
+
+DEFAULT_EMBEDDING_PATHS = [
+    'glove.2024.dolma.300d/dolma_300_2024_1.2M.100_combined.txt',
+    'dolma_300_2024_1.2M.100_combined.txt',
+    'glove/glove.6B.300d.txt',
+    'glove.6B.300d.txt'
+]
+
+# Bump when clean_text changes output so cached corpora are rebuilt
+CLEAN_TEXT_VERSION = 1
+
+
+def sliding_windows(tokens, window, stride=1):
+    """Read-only strided view of every `window`-long slice of a 1-D token array"""
+    tokens = np.asarray(tokens)
+    if len(tokens) < window:
+        return np.empty((0, window), dtype=tokens.dtype)
+
+    windows = np.lib.stride_tricks.sliding_window_view(tokens, window)
+    return windows[::stride]
+
+
+def token_dtype(vocab_size):
+    """Smallest integer dtype that can hold every token id"""
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.int32
+
+
+class ResetStatesCallback(keras.callbacks.Callback):
+    """Clear stateful LSTM states at each epoch and around validation"""
+
+    def _reset(self):
+        for layer in self.model.layers:
+            if getattr(layer, 'stateful', False):
+                layer.reset_states()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._reset()
+
+    def on_test_begin(self, logs=None):
+        self._reset()
+
+    def on_test_end(self, logs=None):
+        self._reset()
+
+
+@keras.utils.register_keras_serializable(package='rnn')
+class SampledSoftmaxOutput(keras.layers.Layer):
+    """Output layer trained with sampled softmax over a frequency distribution
+
+    Called on [hidden, labels], it adds its own loss instead of returning
+    probabilities: during training only the target and num_sampled
+    candidates drawn from the (distorted) unigram counts are scored, so the
+    step no longer multiplies by the whole vocabulary. Evaluation uses the
+    exact full-softmax cross-entropy so val_loss stays comparable. kernel is
+    stored as (num_classes, units), the transpose of the Dense output.
+    """
+
+    def __init__(self, num_classes, num_sampled, unigrams, distortion=0.75,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.num_classes = num_classes
+        self.num_sampled = min(num_sampled, num_classes - 1)
+        # +1 smoothing keeps padding and unseen ids sampleable
+        self.unigrams = [float(count) + 1.0 for count in unigrams]
+        self.distortion = distortion
+
+    def build(self, input_shape):
+        units = input_shape[0][-1]
+        self.kernel = self.add_weight(
+            shape=(self.num_classes, units),
+            initializer='glorot_uniform',
+            name='kernel'
+        )
+        self.bias = self.add_weight(
+            shape=(self.num_classes,),
+            initializer='zeros',
+            name='bias'
+        )
+
+    def call(self, inputs, training=None):
+        hidden, labels = inputs
+        labels = tf.reshape(tf.cast(labels, tf.int64), (-1, 1))
+
+        if training:
+            sampled = tf.random.fixed_unigram_candidate_sampler(
+                true_classes=labels,
+                num_true=1,
+                num_sampled=self.num_sampled,
+                unique=True,
+                range_max=self.num_classes,
+                distortion=self.distortion,
+                unigrams=self.unigrams
+            )
+            loss = tf.nn.sampled_softmax_loss(
+                weights=self.kernel,
+                biases=self.bias,
+                labels=labels,
+                inputs=hidden,
+                num_sampled=self.num_sampled,
+                num_classes=self.num_classes,
+                sampled_values=sampled
+            )
+        else:
+            logits = tf.matmul(hidden, self.kernel, transpose_b=True) + self.bias
+            loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                labels=tf.reshape(labels, (-1,)),
+                logits=logits
+            )
+
+        self.add_loss(tf.reduce_mean(loss))
+        return hidden
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({
+            'num_classes': self.num_classes,
+            'num_sampled': self.num_sampled,
+            'unigrams': [count - 1.0 for count in self.unigrams],
+            'distortion': self.distortion,
+        })
+        return config
+
+
+class StepCheckpoint(keras.callbacks.Callback):
+    """Snapshot the whole training state every N steps / minutes and per epoch
+
+    A snapshot holds every model variable (including the dropout seed
+    generator states), the optimizer slots and iteration count, the
+    running epoch metrics, the state of the other callbacks and the data
+    position (epoch, step). Variables are copied to host on the training
+    thread; the CheckpointWriter puts them on disk in the background.
+    """
+
+    CALLBACK_STATE = ('wait', 'stopped_epoch', 'best', 'best_epoch',
+                      'cooldown_counter')
+
+    def __init__(self, writer, steps_per_epoch, every_steps=None,
+                 every_minutes=None, callbacks=(), meta=None):
+        super().__init__()
+        self.writer = writer
+        self.steps_per_epoch = steps_per_epoch
+        self.every_steps = every_steps
+        self.every_seconds = every_minutes * 60 if every_minutes else None
+        self.callbacks = list(callbacks)
+        self.meta = meta or {}
+
+        self.epoch = 0
+        self.step = 0
+        self.global_step = 0
+        self.history = {}
+        self.early_stopped = False
+        self._last_save = time.monotonic()
+        self._pending_callbacks = None
+        self._pending_metrics = None
+
+    def _early_stopped(self):
+        # Only EarlyStopping's decision ends the run for good; a stop
+        # requested from outside (e.g. the web app) leaves it resumable
+        return any(
+            isinstance(callback, EarlyStopping) and callback.stopped_epoch > 0
+            for callback in self.callbacks
+        )
+
+    def _callback_states(self):
+        states, arrays = [], {}
+        for i, callback in enumerate(self.callbacks):
+            state = {
+                attr: getattr(callback, attr)
+                for attr in self.CALLBACK_STATE if hasattr(callback, attr)
+            }
+            state = {
+                attr: float(value) if isinstance(value, np.floating) else value
+                for attr, value in state.items()
+            }
+            best_weights = getattr(callback, 'best_weights', None)
+            if best_weights is not None:
+                state['best_weights'] = len(best_weights)
+                for j, weight in enumerate(best_weights):
+                    arrays[f'callbacks/{i}/best_weights/{j}'] = weight
+            states.append(state)
+        return states, arrays
+
+    def _apply_callback_states(self, states, arrays):
+        for i, (callback, state) in enumerate(zip(self.callbacks, states)):
+            state = dict(state)
+            n_weights = state.pop('best_weights', None)
+            if n_weights is not None:
+                callback.best_weights = [
+                    arrays[f'callbacks/{i}/best_weights/{j}']
+                    for j in range(n_weights)
+                ]
+            for attr, value in state.items():
+                setattr(callback, attr, value)
+
+    def save(self, epoch, step):
+        """Queue a snapshot of the state after `step` batches of `epoch`"""
+        arrays = {}
+        for i, variable in enumerate(self.model.variables):
+            arrays[f'model/{i}'] = variable.numpy()
+        for i, variable in enumerate(self.model.optimizer.variables):
+            arrays[f'optimizer/{i}'] = variable.numpy()
+        if step:
+            for i, variable in enumerate(self.model.metrics_variables):
+                arrays[f'metrics/{i}'] = variable.numpy()
+
+        callback_states, callback_arrays = self._callback_states()
+        arrays.update(callback_arrays)
+
+        self.writer.submit(self.global_step, arrays, {
+            **self.meta,
+            'epoch': epoch,
+            'step': step,
+            'global_step': self.global_step,
+            'early_stopped': self._early_stopped(),
+            'callbacks': callback_states,
+            'history': self.history,
+            'timestamp': datetime.now().isoformat()
+        })
+        self._last_save = time.monotonic()
+
+    def restore(self, model, prefix):
+        """Load a checkpoint into the model; returns its (epoch, step)"""
+        arrays, meta = load_checkpoint(prefix)
+
+        for key, value in self.meta.items():
+            if meta.get(key) != value:
+                raise ValueError(
+                    f"Checkpoint was written with {key}={meta.get(key)}, "
+                    f"this run has {key}={value}"
+                )
+
+        def assign(prefix, variables):
+            if sum(k.startswith(prefix) for k in arrays) != len(variables):
+                raise ValueError("Checkpoint does not match the model")
+            for i, variable in enumerate(variables):
+                variable.assign(arrays[f'{prefix}{i}'])
+
+        assign('model/', model.variables)
+        model.optimizer.build(model.trainable_variables)
+        assign('optimizer/', model.optimizer.variables)
+
+        # Metrics are built by the first step; they're added back after it
+        n_metrics = sum(k.startswith('metrics/') for k in arrays)
+        self._pending_metrics = [arrays[f'metrics/{i}'] for i in range(n_metrics)]
+        self._pending_callbacks = (meta['callbacks'], arrays)
+
+        self.epoch = meta['epoch']
+        self.step = meta['step']
+        self.global_step = meta['global_step']
+        self.history = meta['history']
+        self.early_stopped = meta.get('early_stopped', False)
+        return self.epoch, self.step
+
+    def on_train_begin(self, logs=None):
+        # Runs after the other callbacks reset themselves for this fit
+        if self._pending_callbacks is not None:
+            self._apply_callback_states(*self._pending_callbacks)
+            self._pending_callbacks = None
+
+    def on_train_end(self, logs=None):
+        # Carried into the next fit() of a resumed run
+        states, arrays = self._callback_states()
+        self._pending_callbacks = (states, arrays)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self.step = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step += 1
+        self.global_step += 1
+
+        if self._pending_metrics:
+            # Epoch metrics are running sums, so the interrupted part adds back
+            for variable, value in zip(self.model.metrics_variables,
+                                       self._pending_metrics):
+                variable.assign(variable.numpy() + value)
+        self._pending_metrics = None
+
+        if self.step >= self.steps_per_epoch:
+            return  # the epoch-end checkpoint follows
+        due = (
+            (self.every_steps and self.global_step % self.every_steps == 0)
+            or (self.every_seconds
+                and time.monotonic() - self._last_save >= self.every_seconds)
+        )
+        if due:
+            self.save(self.epoch, self.step)
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        self.save(epoch + 1, 0)
+
+
+class TraceWindow(keras.callbacks.Callback):
+    """Record a TensorFlow profiler trace of global training steps first..last"""
+
+    def __init__(self, logdir, first, last):
+        super().__init__()
+        self.logdir = logdir
+        self.first = first
+        self.last = last
+        self.step = 0
+        self.active = False
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.step + 1 == self.first:
+            tf.profiler.experimental.start(self.logdir)
+            self.active = True
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step += 1
+        if self.active and self.step >= self.last:
+            self._stop()
+
+    def on_train_end(self, logs=None):
+        if self.active:
+            self._stop()
+
+    def _stop(self):
+        tf.profiler.experimental.stop()
+        self.active = False
+
+
+class ThroughputMonitor(keras.callbacks.Callback):
+    """Sample step time, throughput, input wait and RSS during fit()
+
+    One batch in every sample_every is timed. The train function is
+    wrapped so that batch pulls its data from the iterator in Python first,
+    splitting input-pipeline wait from compute; throughput is averaged
+    over all batches since the previous sample. Records are appended to a
+    JSONL file and passed to on_sample. The other batches only pay for a
+    counter increment and take Keras' usual path.
+    """
+
+    def __init__(self, batch_size, tokens_per_sample, sample_every=50,
+                 log_path=None, on_sample=None):
+        super().__init__()
+        self.batch_size = batch_size
+        self.tokens_per_sample = tokens_per_sample
+        self.sample_every = max(1, int(sample_every))
+        self.log_path = log_path
+        self.on_sample = on_sample
+
+        self.epoch = 0
+        self.global_step = 0
+        self.last = None
+        self._file = None
+        self._train_function = None
+        self._timing = False
+        self._wait = None
+
+    def _timed_train_function(self, iterator):
+        if not self._timing or not isinstance(iterator, tf.data.Iterator):
+            return self._train_function(iterator)
+        start = time.perf_counter()
+        data = iterator.get_next()
+        self._wait = time.perf_counter() - start
+        # A plain iterable takes Keras' one-step-on-data path
+        return self._train_function([data])
+
+    def on_train_begin(self, logs=None):
+        if self.log_path:
+            self._file = open(self.log_path, 'a')
+        # fit() has built train_function; the custom distributed loop has not
+        train_function = getattr(self.model, 'train_function', None)
+        if (train_function is not None
+                and getattr(self.model, 'steps_per_execution', 1) == 1):
+            self._train_function = train_function
+            self.model.train_function = self._timed_train_function
+
+    def on_train_end(self, logs=None):
+        if self._train_function is not None:
+            self.model.train_function = self._train_function
+            self._train_function = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        # Restart the throughput window so validation time isn't counted
+        self.epoch = epoch
+        self._window_start = time.perf_counter()
+        self._window_steps = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._timing = (self.global_step + 1) % self.sample_every == 0
+        if self._timing:
+            self._wait = None
+            self._batch_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.global_step += 1
+        self._window_steps += 1
+        if not self._timing:
+            return
+        self._timing = False
+
+        now = time.perf_counter()
+        step_time = now - self._batch_start
+        samples_per_sec = (
+            self._window_steps * self.batch_size / (now - self._window_start)
+        )
+        rss = process_rss()
+        record = {
+            'time': datetime.now().isoformat(),
+            'epoch': self.epoch + 1,
+            'batch': batch + 1,
+            'step': self.global_step,
+            'step_time_ms': step_time * 1000,
+            'input_wait_ms': None,
+            'compute_ms': None,
+            'samples_per_sec': samples_per_sec,
+            'tokens_per_sec': samples_per_sec * self.tokens_per_sample,
+            'rss_mb': rss / 2**20 if rss is not None else None,
+            'loss': float(logs['loss']) if logs and 'loss' in logs else None,
+        }
+        if self._wait is not None:
+            record['input_wait_ms'] = self._wait * 1000
+            record['compute_ms'] = (step_time - self._wait) * 1000
+
+        self._window_start = now
+        self._window_steps = 0
+        self.last = record
+
+        if self._file is not None:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+        if self.on_sample is not None:
+            self.on_sample(record)
+
 
 class RNNTrainer:
     """Handles RNN model training end-to-end"""
@@ -48,14 +492,76 @@ class RNNTrainer:
             'batch_size': 128,
             'epochs': 50,
             'validation_split': 0.2,
+            'sequence_stride': 1,
+            # 'sparse' keeps int32 class ids, 'categorical' one-hot encodes
+            # them, 'auto' resolves to sparse
+            'label_mode': 'auto',
+            # 'memory' fits on the X/y arrays, 'stream' builds windows
+            # lazily from the token array with tf.data
+            'input_pipeline': 'memory',
+            # Raised to one stream block's windows when smaller
+            'shuffle_buffer': 10000,
+            'stream_block_tokens': 65536,
             'learning_rate': 0.001,
+            # 'standard' keeps the original layout; 'fast' drops
+            # recurrent_dropout and the Masking layer so the LSTM can run
+            # on its fused kernel
+            'model_mode': 'standard',
+            'jit_compile': False,
+            # 'windows' trains on one window per token; 'tbptt' trains a
+            # stateful LSTM over batch_size contiguous streams, predicting
+            # every position, and exports a windowed model for serving
+            'training_mode': 'windows',
+            # 'softmax' trains the full output layer; 'sampled' scores the
+            # target against num_sampled ids drawn from the token counts
+            # and exports a full-softmax model for serving
+            'output_head': 'softmax',
+            'num_sampled': 1024,
+            # Resumable training: snapshots of weights, optimizer, metrics,
+            # callbacks, data position and RNG state every N steps and/or
+            # minutes (both None: off), written in the background to
+            # model_dir/checkpoints and rotated down to checkpoint_keep
+            'checkpoint_every_steps': None,
+            'checkpoint_every_minutes': None,
+            'checkpoint_keep': 3,
+            'resume': False,
+            'shuffle_seed': 42,
+            # Throughput telemetry: every N batches, time one batch and log
+            # step time, samples/tokens per second, input wait and RSS to
+            # model_dir/telemetry.jsonl (None or 0: off)
+            'telemetry_every_batches': 50,
+            # Per-stage wall/CPU/peak-RSS report (profile.json/.txt next to
+            # config.json), optionally with a cProfile dump per stage and a
+            # TensorFlow trace of global training steps (first, last)
+            'profile': False,
+            'profile_cprofile': False,
+            'profile_steps': None,
             'data_dir': 'data/',
             'model_dir': 'saved_models/',
+            # Stage cache under data_dir/cache, evicted by size and age
+            'use_cache': True,
+            'cache_max_gb': 5.0,
+            'cache_max_age_days': 30,
+            # Convert embedding files to a reusable .npy copy; when off,
+            # only vocabulary lines are parsed on every run
+            'embedding_binary_cache': True,
+            'embedding_workers': None,
+            # Processes for chunked text cleaning (None: all cores)
+            'preprocess_workers': None,
+            # Directory or glob of local text shards (plain or .gz) to
+            # train on instead of the downloaded dataset
+            'corpus': None,
+            'ingest_workers': None,
         }
 
         # Update with provided config
         if config:
             self.config.update(config)
+        if self.config['training_mode'] == 'tbptt' and self.checkpointing():
+            raise ValueError(
+                "Step checkpoints and resume need training_mode='windows'; "
+                "TBPTT runs can't be resumed"
+            )
 
         # Create directories
         os.makedirs(self.config['data_dir'], exist_ok=True)
@@ -65,6 +571,42 @@ class RNNTrainer:
         self.model = None
         self.vocab_size = 0
         self.embedding_matrix = None
+        self.tokens = None
+        self.label_mode = self._resolve_label_mode()
+        self.profiler = StageProfiler(
+            enabled=self.config['profile'],
+            cprofile=self.config['profile_cprofile']
+        )
+
+        self.cache = None
+        if self.config['use_cache']:
+            self.cache = StageCache(
+                os.path.join(self.config['data_dir'], 'cache'),
+                max_bytes=int(self.config['cache_max_gb'] * 1e9),
+                max_age_days=self.config['cache_max_age_days']
+            )
+
+    def checkpointing(self):
+        """Whether step checkpoints or resuming were asked for"""
+        return bool(self.config['checkpoint_every_steps']
+                    or self.config['checkpoint_every_minutes']
+                    or self.config['resume'])
+
+    def _resolve_label_mode(self, y=None):
+        """Pick sparse or categorical targets from the config or label shape"""
+        if y is not None:
+            return 'sparse' if np.ndim(y) == 1 else 'categorical'
+
+        mode = self.config['label_mode']
+        if mode not in ('auto', 'sparse', 'categorical'):
+            raise ValueError(f"Unknown label_mode: {mode}")
+        if mode == 'categorical' and self.config['output_head'] == 'sampled':
+            raise ValueError("The sampled output head needs sparse labels")
+        return 'categorical' if mode == 'categorical' else 'sparse'
+
+    def download_path(self):
+        """Local path of the dataset, fetched once by keras get_file"""
+        return keras.utils.get_file('shakespeare.txt', DATASET_URL)
 
     def download_data(self):
         """Download Shakespeare dataset"""
@@ -72,10 +614,7 @@ class RNNTrainer:
         print("DOWNLOADING DATASET")
         print("="*60)
 
-        path_to_file = keras.utils.get_file(
-            'shakespeare.txt',
-            'https://storage.googleapis.com/download.tensorflow.org/data/shakespeare.txt'
-        )
+        path_to_file = self.download_path()
 
         with open(path_to_file, 'r', encoding='utf-8') as f:
             text = f.read()
@@ -84,32 +623,31 @@ class RNNTrainer:
         return text
 
     def clean_text(self, text):
-        """Clean and preprocess text"""
+        """Clean and preprocess text (a string or an iterable of lines)"""
         print("\nCleaning text...")
-        import re
-        import string
 
-        text = text.lower()
-        text = re.sub(r'\[.*?\]', '', text)
-        text = re.sub(r'\d+', '', text)
-        text = re.sub(f"[{re.escape(string.punctuation.replace('.', ''))}]", '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = preprocessing.clean_text(
+            text,
+            workers=self.config['preprocess_workers']
+        )
 
         print(f"✓ Cleaned: {len(text):,} characters")
         return text
 
     def create_tokenizer(self, text):
-        """Create and fit tokenizer"""
+        """Create and fit tokenizer (a Keras-compatible Vocabulary)"""
         print("\nCreating tokenizer...")
 
-        self.tokenizer = Tokenizer(
+        tokenizer = Vocabulary.fit(
+            text,
             num_words=self.config['max_vocab_size'],
-            oov_token='<OOV>',
-            filters='',
-            lower=False
+            oov_token='<OOV>'
         )
+        return self.set_tokenizer(tokenizer)
 
-        self.tokenizer.fit_on_texts([text])
+    def set_tokenizer(self, tokenizer):
+        """Use a fitted tokenizer and derive the vocabulary size from it"""
+        self.tokenizer = tokenizer
         self.vocab_size = min(
             self.config['max_vocab_size'],
             len(self.tokenizer.word_index) + 1
@@ -118,33 +656,55 @@ class RNNTrainer:
         print(f"✓ Vocabulary size: {self.vocab_size:,}")
         return self.tokenizer
 
-    def create_sequences(self, text):
-        """Generate training sequences"""
-        print("\nCreating sequences...")
-
-        encoded = self.tokenizer.texts_to_sequences([text])[0]
-        sequences = []
-
-        seq_len = self.config['sequence_length']
-        for i in range(seq_len, len(encoded)):
-            seq = encoded[i-seq_len:i+1]
-            sequences.append(seq)
-
-            if len(sequences) % 50000 == 0:
-                print(f"  Generated {len(sequences):,} sequences...")
+    def encode_text(self, text):
+        """Encode the corpus into one compact token id array"""
+        was_tracing = tracemalloc.is_tracing()
+        if was_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+
+        encoded = self.tokenizer.encode(text, dtype=token_dtype(self.vocab_size))
+
+        _, peak = tracemalloc.get_traced_memory()
+        if not was_tracing:
+            tracemalloc.stop()
+
+        print(f"  Token array: {encoded.nbytes / 1e6:.1f} MB "
+              f"(peak {peak / 1e6:.1f} MB)")
+        return encoded
+
+    def sequences_from_tokens(self, tokens):
+        """Zero-copy training windows over an encoded token array"""
+        self.tokens = tokens
+        sequences = sliding_windows(
+            tokens,
+            self.config['sequence_length'] + 1,
+            stride=self.config['sequence_stride']
+        )
 
-        sequences = np.array(sequences)
         print(f"✓ Created {len(sequences):,} sequences")
-
         return sequences
 
+    def create_sequences(self, text):
+        """Generate training sequences as a zero-copy view over the tokens"""
+        print("\nCreating sequences...")
+
+        return self.sequences_from_tokens(self.encode_text(text))
+
     def prepare_data(self, sequences):
         """Split into X and y"""
         print("\nPreparing features and labels...")
 
+        # X is a view into the token array, nothing is copied here
         X = sequences[:, :-1]
-        y = sequences[:, -1]
-        y = to_categorical(y, num_classes=self.vocab_size)
+        y = sequences[:, -1].astype(np.int32)
+
+        self.label_mode = self._resolve_label_mode()
+        if self.label_mode == 'categorical':
+            y = to_categorical(y, num_classes=self.vocab_size)
+
+        print(f"✓ Label mode: {self.label_mode}")
 
         print(f"✓ X shape: {X.shape}")
         print(f"✓ y shape: {y.shape}")
@@ -171,67 +731,61 @@ class RNNTrainer:
         return None
 
     def _load_embedding_file(self, filepath):
-        """Load embedding file"""
-        embeddings_index = {}
-
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                try:
-                    values = line.split()
-                    word = values[0]
-                    vector = np.asarray(values[1:], dtype='float32')
-
-                    if len(vector) == self.config['embedding_dim']:
-                        embeddings_index[word] = vector
-
-                    if len(embeddings_index) % 50000 == 0:
-                        print(f"  Loaded {len(embeddings_index):,} vectors...")
-
-                except:
-                    continue
+        """Load embedding file through its binary copy, or parse only the vocabulary"""
+        workers = self.config['embedding_workers']
+        dim = self.config['embedding_dim']
+
+        if self.config['embedding_binary_cache']:
+            table, stats = load_embedding_table(
+                filepath,
+                os.path.join(self.config['data_dir'], 'embeddings'),
+                dim,
+                workers=workers
+            )
+        else:
+            vocabulary = {
+                word for word, i in self.tokenizer.word_index.items()
+                if i < self.vocab_size
+            }
+            table, stats = parse_embedding_file(
+                filepath, dim, vocabulary=vocabulary, workers=workers
+            )
 
-        print(f"\n✓ Loaded {len(embeddings_index):,} word vectors")
-        return embeddings_index
+        print(f"\n✓ Loaded {len(table):,} word vectors "
+              f"({stats['skipped']:,} skipped, "
+              f"{stats['malformed']:,} malformed lines)")
+        return table
 
     def create_embedding_matrix(self, embeddings_index):
         """Create embedding matrix"""
         print("\nCreating embedding matrix...")
 
-        embedding_matrix = np.zeros((
-            self.vocab_size,
-            self.config['embedding_dim']
-        ))
-
         if embeddings_index is None:
             print("  Using random initialization")
             embedding_matrix = np.random.randn(
                 self.vocab_size,
                 self.config['embedding_dim']
-            ) * 0.01
+            ).astype(np.float32) * 0.01
+            self.embedding_matrix = embedding_matrix
             return embedding_matrix
 
-        found = 0
-        for word, i in self.tokenizer.word_index.items():
-            if i >= self.vocab_size:
-                continue
-
-            vector = embeddings_index.get(word)
-            if vector is not None:
-                embedding_matrix[i] = vector
-                found += 1
+        # Only the rows for the tokenizer's vocabulary are read
+        embedding_matrix, found = embeddings_index.gather(
+            self.tokenizer.word_index,
+            self.vocab_size
+        )
 
         print(f"✓ Found embeddings for {found:,}/{self.vocab_size:,} words")
 
         self.embedding_matrix = embedding_matrix
         return embedding_matrix
 
-    def build_model(self):
-        """Build LSTM model"""
-        print("\n" + "="*60)
-        print("BUILDING MODEL")
-        print("="*60)
+    def _build_layers(self, mode):
+        """Layer stack for the 'standard' or 'fast' model layout"""
+        if mode not in ('standard', 'fast'):
+            raise ValueError(f"Unknown model_mode: {mode}")
 
-        model = Sequential([
+        layers = [
             Embedding(
                 input_dim=self.vocab_size,
                 output_dim=self.config['embedding_dim'],
@@ -240,15 +794,34 @@ class RNNTrainer:
                 trainable=False,
                 mask_zero=True,
                 name='embedding'
-            ),
-            Masking(mask_value=0.0, name='masking'),
-            LSTM(
-                units=self.config['lstm_units'],
-                dropout=self.config['dropout_rate'],
-                recurrent_dropout=self.config['dropout_rate'],
-                return_sequences=False,
-                name='lstm'
-            ),
+            )
+        ]
+
+        if mode == 'standard':
+            layers += [
+                Masking(mask_value=0.0, name='masking'),
+                LSTM(
+                    units=self.config['lstm_units'],
+                    dropout=self.config['dropout_rate'],
+                    recurrent_dropout=self.config['dropout_rate'],
+                    return_sequences=False,
+                    name='lstm'
+                )
+            ]
+        else:
+            # No recurrent_dropout and no second mask keep the LSTM on the
+            # fused kernel; regularisation moves to the LSTM output instead
+            layers += [
+                LSTM(
+                    units=self.config['lstm_units'],
+                    dropout=self.config['dropout_rate'],
+                    return_sequences=False,
+                    name='lstm'
+                ),
+                Dropout(self.config['dropout_rate'], name='lstm_dropout')
+            ]
+
+        layers += [
             Dense(
                 units=self.config['dense_units'],
                 activation='relu',
@@ -260,29 +833,236 @@ class RNNTrainer:
                 activation='softmax',
                 name='output'
             )
-        ], name='RNN_NextWord_Predictor')
+        ]
 
-        model.compile(
-            optimizer=keras.optimizers.Adam(
-                learning_rate=self.config['learning_rate']
-            ),
-            loss='categorical_crossentropy',
-            metrics=['accuracy']
+        return Sequential(layers, name='RNN_NextWord_Predictor')
+
+    def _build_sampled_model(self, mode):
+        """Training model whose output layer is a sampled-softmax head"""
+        tokens = keras.Input(
+            shape=(self.config['sequence_length'],),
+            dtype='int32',
+            name='tokens'
+        )
+        labels = keras.Input(shape=(), dtype='int32', name='labels')
+
+        # Same body as the serving layout, minus its Dense softmax
+        hidden = tokens
+        for layer in self._build_layers(mode).layers[:-1]:
+            hidden = layer(hidden)
+
+        head = SampledSoftmaxOutput(
+            num_classes=self.vocab_size,
+            num_sampled=self.config['num_sampled'],
+            unigrams=self.tokenizer.class_counts(self.vocab_size),
+            name='output'
+        )
+        print(f"Sampled softmax: {head.num_sampled:,} of {self.vocab_size:,} "
+              f"classes per step")
+        return keras.Model(
+            [tokens, labels],
+            head([hidden, labels]),
+            name='RNN_NextWord_Predictor_Sampled'
         )
 
+    def build_model(self):
+        """Build LSTM model"""
+        print("\n" + "="*60)
+        print("BUILDING MODEL")
+        print("="*60)
+
+        head = self.config['output_head']
+        if head not in ('softmax', 'sampled'):
+            raise ValueError(f"Unknown output_head: {head}")
+
+        if self.config['training_mode'] == 'tbptt':
+            if head == 'sampled':
+                raise ValueError("The sampled output head needs training_mode='windows'")
+            # Every position is a target, so labels are always sparse
+            self.label_mode = 'sparse'
+            model = self._build_stateful_layers()
+        elif head == 'sampled':
+            self.label_mode = 'sparse'
+            model = self._build_sampled_model(self.config['model_mode'])
+        else:
+            model = self._build_layers(self.config['model_mode'])
+
+        self.model = model
+        self._compile_model()
+
         print("\n✓ Model built successfully")
         model.summary()
+        print(f"\nLSTM kernel: {self.kernel_path_report()}")
 
-        self.model = model
         return model
 
-    def train(self, X, y):
-        """Train the model"""
+    def kernel_path_report(self, model=None):
+        """Describe which LSTM implementation the model will run on"""
+        model = model or self.model
+        lstm = model.get_layer('lstm')
+        gpu = bool(tf.config.list_logical_devices('GPU'))
+
+        slow = []
+        if lstm.recurrent_dropout:
+            slow.append('recurrent_dropout')
+        if any(isinstance(layer, Masking) for layer in model.layers):
+            slow.append('extra Masking layer')
+        if gpu and model.get_layer('embedding').mask_zero:
+            slow.append('padding mask')
+
+        if gpu and not slow:
+            path = 'cuDNN fused kernel'
+        elif gpu:
+            path = 'generic step loop (cuDNN disabled by ' + ', '.join(slow) + ')'
+        elif slow:
+            path = 'generic step loop on CPU, slowed by ' + ', '.join(slow)
+        else:
+            path = 'generic step loop on CPU, no per-step dropout or extra mask'
+
+        if model.jit_compile:
+            path += ', XLA jit_compile'
+        return path
+
+    def _compile_model(self, model=None, jit_compile=None):
+        """Compile with the loss and metrics matching the label mode"""
+        model = model or self.model
+        if jit_compile is None:
+            jit_compile = self.config['jit_compile']
+
+        optimizer = keras.optimizers.Adam(
+            learning_rate=self.config['learning_rate']
+        )
+        if any(isinstance(layer, SampledSoftmaxOutput) for layer in model.layers):
+            # The head adds its own loss; accuracy would need full logits
+            model.compile(optimizer=optimizer, jit_compile=jit_compile)
+            return
+
+        if self.label_mode == 'sparse':
+            loss = 'sparse_categorical_crossentropy'
+            metrics = [
+                keras.metrics.SparseCategoricalAccuracy(name='accuracy'),
+                keras.metrics.SparseTopKCategoricalAccuracy(
+                    k=5, name='top5_accuracy'
+                )
+            ]
+        else:
+            loss = 'categorical_crossentropy'
+            metrics = [
+                keras.metrics.CategoricalAccuracy(name='accuracy'),
+                keras.metrics.TopKCategoricalAccuracy(
+                    k=5, name='top5_accuracy'
+                )
+            ]
+
+        model.compile(
+            optimizer=optimizer,
+            loss=loss,
+            metrics=metrics,
+            jit_compile=jit_compile
+        )
+
+    def compare_model_modes(self, X, y, samples=20000, repeats=2):
+        """Measure training samples/sec of each model layout on the same data"""
         print("\n" + "="*60)
-        print("TRAINING MODEL")
+        print("MODEL LAYOUT THROUGHPUT")
         print("="*60)
 
-        callbacks = [
+        if X is None:
+            # Streaming pipelines don't materialise X/y; cut a sample here
+            X, y = self.prepare_data(self.sequences_from_tokens(self.tokens))
+
+        X = np.ascontiguousarray(X[:samples])
+        y = np.ascontiguousarray(y[:samples])
+        results = {}
+
+        for mode, jit_compile in [('standard', False), ('fast', False),
+                                  ('fast', True)]:
+            name = f"{mode}{' + XLA' if jit_compile else ''}"
+            model = self._build_layers(mode)
+            self._compile_model(model, jit_compile=jit_compile)
+
+            # The first epoch traces and compiles; time the ones after it
+            model.fit(X, y, batch_size=self.config['batch_size'],
+                      epochs=1, verbose=0)
+            start = time.perf_counter()
+            model.fit(X, y, batch_size=self.config['batch_size'],
+                      epochs=repeats, verbose=0)
+            results[name] = len(X) * repeats / (time.perf_counter() - start)
+
+            print(f"  {name:<16} {results[name]:>10,.0f} samples/sec  "
+                  f"({self.kernel_path_report(model)})")
+
+        baseline = results['standard']
+        for name, rate in results.items():
+            print(f"  {name:<16} {rate / baseline:>9.2f}x standard")
+
+        return results
+
+    def _window_dataset(self, tokens, shuffle):
+        """Lazily cut (X, y) batches out of a contiguous token range"""
+        window = self.config['sequence_length'] + 1
+        stride = self.config['sequence_stride']
+        # Blocks start on a stride boundary so every window is produced once
+        block = max(stride, self.config['stream_block_tokens'] // stride * stride)
+        starts = np.arange(0, max(len(tokens) - window + 1, 0), block)
+        n_windows = len(sliding_windows(tokens, window, stride))
+        rng = np.random.default_rng(42)
+
+        def blocks():
+            order = rng.permutation(starts) if shuffle else starts
+            for start in order:
+                yield np.asarray(tokens[start:start + block + window - 1],
+                                 dtype=np.int32)
+
+        dataset = tf.data.Dataset.from_generator(
+            blocks,
+            output_signature=tf.TensorSpec(shape=(None,), dtype=tf.int32)
+        )
+        dataset = dataset.map(
+            lambda b: tf.signal.frame(b, window, stride),
+            num_parallel_calls=tf.data.AUTOTUNE
+        ).unbatch()
+        if shuffle:
+            # Windows arrive in block order, so the buffer must hold at
+            # least a block's worth for the shuffle to reach across it
+            buffer = max(self.config['shuffle_buffer'], block // stride)
+            dataset = dataset.shuffle(buffer, seed=42)
+
+        batch_size = self.config['batch_size']
+        dataset = dataset.batch(
+            batch_size,
+            num_parallel_calls=tf.data.AUTOTUNE
+        ).map(self._split_xy, num_parallel_calls=tf.data.AUTOTUNE)
+        dataset = dataset.apply(tf.data.experimental.assert_cardinality(
+            -(-n_windows // batch_size)
+        ))
+
+        return dataset.prefetch(tf.data.AUTOTUNE), n_windows
+
+    def _split_xy(self, windows):
+        """Model inputs and targets from a batch of windows"""
+        y = windows[:, -1]
+        if self.config['output_head'] == 'sampled':
+            return ((windows[:, :-1], y),)
+        if self.label_mode == 'categorical':
+            y = tf.one_hot(y, self.vocab_size)
+        return windows[:, :-1], y
+
+    def make_datasets(self, tokens):
+        """Streaming train/val datasets over a contiguous split of the tokens"""
+        split = int(len(tokens) * (1 - self.config['validation_split']))
+
+        train_ds, n_train = self._window_dataset(tokens[:split], shuffle=True)
+        val_ds, n_val = self._window_dataset(tokens[split:], shuffle=False)
+
+        print(f"✓ Streaming {n_train:,} train / {n_val:,} validation windows "
+              f"(held out tokens {split:,}-{len(tokens):,})")
+        return train_ds, val_ds, n_train
+
+    def _training_callbacks(self, callbacks=None, on_telemetry=None):
+        """Checkpointing, early stopping, LR schedule and telemetry shared by
+        all modes, followed by any extra callbacks"""
+        base = [
             ModelCheckpoint(
                 filepath=os.path.join(
                     self.config['model_dir'],
@@ -306,20 +1086,358 @@ class RNNTrainer:
                 verbose=1
             )
         ]
+        if self.config['telemetry_every_batches']:
+            base.append(ThroughputMonitor(
+                batch_size=self.config['batch_size'],
+                tokens_per_sample=self.config['sequence_length'],
+                sample_every=self.config['telemetry_every_batches'],
+                log_path=os.path.join(self.config['model_dir'], 'telemetry.jsonl'),
+                on_sample=on_telemetry
+            ))
+        return base + list(callbacks or [])
+
+    def train(self, X=None, y=None, callbacks=None, on_telemetry=None):
+        """Train the model
+
+        callbacks are extra Keras callbacks; on_telemetry receives each
+        ThroughputMonitor record.
+        """
+        if self.config['training_mode'] == 'tbptt':
+            return self.train_stateful(callbacks, on_telemetry)
+        if self.checkpointing():
+            return self.train_resumable(callbacks, on_telemetry)
+
+        print("\n" + "="*60)
+        print("TRAINING MODEL")
+        print("="*60)
+
+        sampled = self.config['output_head'] == 'sampled'
+        streaming = self.config['input_pipeline'] == 'stream'
+        if streaming:
+            train_ds, val_ds, n_samples = self.make_datasets(self.tokens)
+        else:
+            n_samples = len(X)
+
+            # Recompile if the labels don't match what the model was built for
+            label_mode = self._resolve_label_mode(y)
+            if sampled and label_mode != 'sparse':
+                raise ValueError("The sampled output head needs sparse labels")
+            if label_mode != self.label_mode:
+                self.label_mode = label_mode
+                self._compile_model()
+
+        callbacks = self._training_callbacks(callbacks, on_telemetry)
 
         print(f"\nTraining started: {datetime.now()}")
-        print(f"Samples: {len(X):,}")
+        print(f"Samples: {n_samples:,}")
+        print(f"Input pipeline: {self.config['input_pipeline']}")
+        print(f"Label mode: {self.label_mode}")
+        print(f"Output head: {self.config['output_head']}")
         print(f"Batch size: {self.config['batch_size']}")
         print(f"Max epochs: {self.config['epochs']}")
 
         start_time = time.time()
 
+        if streaming:
+            history = self.model.fit(
+                train_ds,
+                validation_data=val_ds,
+                epochs=self.config['epochs'],
+                callbacks=callbacks,
+                verbose=1
+            )
+        elif sampled:
+            # Labels are a model input: the head scores them itself
+            history = self.model.fit(
+                [X, y], None,
+                batch_size=self.config['batch_size'],
+                epochs=self.config['epochs'],
+                validation_split=self.config['validation_split'],
+                callbacks=callbacks,
+                verbose=1
+            )
+        else:
+            history = self.model.fit(
+                X, y,
+                batch_size=self.config['batch_size'],
+                epochs=self.config['epochs'],
+                validation_split=self.config['validation_split'],
+                callbacks=callbacks,
+                verbose=1
+            )
+
+        training_time = time.time() - start_time
+
+        print("\n" + "="*60)
+        print("TRAINING COMPLETE")
+        print("="*60)
+        print(f"Time: {training_time/3600:.2f} hours")
+        print(f"Final loss: {history.history['loss'][-1]:.4f}")
+        print(f"Final val loss: {history.history['val_loss'][-1]:.4f}")
+
+        if sampled:
+            # Serve a regular full-softmax model so app.py loads it unchanged
+            self.model = self.export_full_softmax(self.model)
+        return history
+
+    def _resumable_windows(self):
+        """Train/validation windows split like the configured input pipeline"""
+        window = self.config['sequence_length'] + 1
+        stride = self.config['sequence_stride']
+
+        if self.config['input_pipeline'] == 'stream':
+            split = int(len(self.tokens) * (1 - self.config['validation_split']))
+            return (sliding_windows(self.tokens[:split], window, stride),
+                    sliding_windows(self.tokens[split:], window, stride))
+
+        # Same tail as Keras' validation_split
+        windows = sliding_windows(self.tokens, window, stride)
+        split = int(math.ceil(len(windows) * (1 - self.config['validation_split'])))
+        return windows[:split], windows[split:]
+
+    def _resumable_dataset(self, windows, epoch=0, step=0, shuffle=True):
+        """Batches in an order fixed by (shuffle_seed, epoch), from any position
+
+        With shuffle the dataset runs on endlessly from `step` batches into
+        `epoch`; without, it is one pass in window order.
+        """
+        batch_size = self.config['batch_size']
+        n = len(windows)
+
+        def batches():
+            if not shuffle:
+                for i in range(0, n, batch_size):
+                    yield np.asarray(windows[i:i + batch_size], dtype=np.int32)
+                return
+
+            current, start = epoch, step * batch_size
+            while True:
+                order = np.random.default_rng(
+                    [self.config['shuffle_seed'], current]
+                ).permutation(n)
+                for i in range(start, n, batch_size):
+                    yield windows[order[i:i + batch_size]].astype(np.int32)
+                current, start = current + 1, 0
+
+        dataset = tf.data.Dataset.from_generator(
+            batches,
+            output_signature=tf.TensorSpec(
+                shape=(None, windows.shape[1]), dtype=tf.int32
+            )
+        ).map(self._split_xy, num_parallel_calls=tf.data.AUTOTUNE)
+        if not shuffle:
+            dataset = dataset.apply(tf.data.experimental.assert_cardinality(
+                -(-n // batch_size)
+            ))
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+    def train_resumable(self, callbacks=None, on_telemetry=None):
+        """Train with periodic checkpoints, optionally resuming the latest one
+
+        Uses the token array (X/y are not needed): the window order of each
+        epoch is derived from shuffle_seed, so a checkpoint's (epoch, step)
+        is enough to continue with exactly the batches that were next.
+        """
+        print("\n" + "="*60)
+        print("TRAINING MODEL (RESUMABLE)")
+        print("="*60)
+
+        train_windows, val_windows = self._resumable_windows()
+        steps = -(-len(train_windows) // self.config['batch_size'])
+        epochs = self.config['epochs']
+
+        writer = CheckpointWriter(
+            os.path.join(self.config['model_dir'], 'checkpoints'),
+            keep=self.config['checkpoint_keep']
+        )
+        callbacks = self._training_callbacks(callbacks, on_telemetry)
+        checkpoint = StepCheckpoint(
+            writer,
+            steps,
+            every_steps=self.config['checkpoint_every_steps'],
+            every_minutes=self.config['checkpoint_every_minutes'],
+            callbacks=callbacks,
+            meta={
+                'batch_size': self.config['batch_size'],
+                'input_pipeline': self.config['input_pipeline'],
+                'sequence_stride': self.config['sequence_stride'],
+                'shuffle_seed': self.config['shuffle_seed'],
+                'train_windows': len(train_windows),
+            }
+        )
+
+        epoch, step = 0, 0
+        if self.config['resume']:
+            prefix = latest_checkpoint(writer.directory)
+            if prefix is None:
+                print("\n⚠️  No checkpoint found, starting from scratch")
+            else:
+                if not self.model.built:
+                    self.model.build((None, self.config['sequence_length']))
+                epoch, step = checkpoint.restore(self.model, prefix)
+                print(f"\n✓ Resuming from {prefix}: epoch {epoch + 1}, "
+                      f"step {step}/{steps}")
+                if checkpoint.early_stopped:
+                    epoch, step = epochs, 0
+
+        print(f"\nTraining started: {datetime.now()}")
+        print(f"Samples: {len(train_windows):,}")
+        print(f"Steps per epoch: {steps:,}")
+        print(f"Checkpoints: every {self.config['checkpoint_every_steps'] or '-'} "
+              f"steps / {self.config['checkpoint_every_minutes'] or '-'} minutes "
+              f"and each epoch, in {writer.directory}")
+
+        fit_args = dict(
+            validation_data=self._resumable_dataset(val_windows, shuffle=False),
+            callbacks=callbacks + [checkpoint],
+            verbose=1
+        )
+        start_time = time.time()
+
+        try:
+            if step and epoch < epochs:
+                # Keras epochs start at step 0, so the interrupted epoch is
+                # finished by a fit() of its own; early stopping must not
+                # restore best weights when that fit ends
+                early = [c for c in callbacks if isinstance(c, EarlyStopping)]
+                for callback in early:
+                    callback.restore_best_weights = False
+                self.model.fit(
+                    self._resumable_dataset(train_windows, epoch, step),
+                    steps_per_epoch=steps - step,
+                    initial_epoch=epoch,
+                    epochs=epoch + 1,
+                    **fit_args
+                )
+                for callback in early:
+                    callback.restore_best_weights = True
+                    if self.model.stop_training and callback.best_weights:
+                        self.model.set_weights(callback.best_weights)
+                epoch = epochs if self.model.stop_training else epoch + 1
+
+            if epoch < epochs:
+                self.model.fit(
+                    self._resumable_dataset(train_windows, epoch),
+                    steps_per_epoch=steps,
+                    initial_epoch=epoch,
+                    epochs=epochs,
+                    **fit_args
+                )
+        finally:
+            writer.close()
+
+        # Epochs from every run that contributed to this model
+        history = keras.callbacks.History()
+        history.history = checkpoint.history
+        training_time = time.time() - start_time
+
+        print("\n" + "="*60)
+        print("TRAINING COMPLETE")
+        print("="*60)
+        print(f"Time: {training_time/3600:.2f} hours")
+        print(f"Final loss: {history.history['loss'][-1]:.4f}")
+        print(f"Final val loss: {history.history['val_loss'][-1]:.4f}")
+
+        if self.config['output_head'] == 'sampled':
+            self.model = self.export_full_softmax(self.model)
+        return history
+
+    def _build_stateful_layers(self):
+        """Stateful LSTM that predicts every position of a segment"""
+        return Sequential([
+            keras.Input(
+                batch_shape=(
+                    self.config['batch_size'],
+                    self.config['sequence_length']
+                ),
+                dtype='int32'
+            ),
+            Embedding(
+                input_dim=self.vocab_size,
+                output_dim=self.config['embedding_dim'],
+                weights=[self.embedding_matrix],
+                trainable=False,
+                name='embedding'
+            ),
+            LSTM(
+                units=self.config['lstm_units'],
+                dropout=self.config['dropout_rate'],
+                return_sequences=True,
+                stateful=True,
+                name='lstm'
+            ),
+            Dropout(self.config['dropout_rate'], name='lstm_dropout'),
+            Dense(
+                units=self.config['dense_units'],
+                activation='relu',
+                name='dense_relu'
+            ),
+            Dropout(self.config['dropout_rate'], name='dropout'),
+            Dense(
+                units=self.vocab_size,
+                activation='softmax',
+                name='output'
+            )
+        ], name='RNN_NextWord_Predictor_TBPTT')
+
+    def stream_segments(self, tokens, n_streams):
+        """Cut tokens into n_streams contiguous rows and consecutive segments
+
+        Row k * n_streams + b of the result is segment k of stream b, so
+        batches of n_streams rows (unshuffled) continue each stream where
+        the previous batch stopped. Targets are the inputs shifted by one.
+        """
+        seq_len = self.config['sequence_length']
+        stream_len = len(tokens) // n_streams
+        n_segments = (stream_len - 1) // seq_len
+        if n_segments < 1:
+            raise ValueError(
+                f"{len(tokens):,} tokens are too few for {n_streams} streams "
+                f"of {seq_len + 1}-token segments"
+            )
+
+        streams = np.asarray(tokens[:n_streams * stream_len]).reshape(
+            n_streams, stream_len
+        )
+
+        def segments(offset):
+            cut = streams[:, offset:offset + n_segments * seq_len]
+            return cut.reshape(n_streams, n_segments, seq_len).transpose(
+                1, 0, 2
+            ).reshape(-1, seq_len).astype(np.int32)
+
+        return segments(0), segments(1)
+
+    def train_stateful(self, callbacks=None, on_telemetry=None):
+        """Stateful truncated-BPTT training over parallel contiguous streams"""
+        print("\n" + "="*60)
+        print("TRAINING MODEL (TRUNCATED BPTT)")
+        print("="*60)
+
+        if self.model is None or not self.model.get_layer('lstm').stateful:
+            self.build_model()
+
+        n_streams = self.config['batch_size']
+        split = int(len(self.tokens) * (1 - self.config['validation_split']))
+        X, y = self.stream_segments(self.tokens[:split], n_streams)
+        X_val, y_val = self.stream_segments(self.tokens[split:], n_streams)
+
+        print(f"\nTraining started: {datetime.now()}")
+        print(f"Streams: {n_streams} x {len(X) // n_streams:,} segments "
+              f"of {self.config['sequence_length']} tokens")
+        print(f"Predictions per epoch: {y.size:,}")
+        print(f"Max epochs: {self.config['epochs']}")
+
+        start_time = time.time()
+
         history = self.model.fit(
             X, y,
-            batch_size=self.config['batch_size'],
+            batch_size=n_streams,
             epochs=self.config['epochs'],
-            validation_split=self.config['validation_split'],
-            callbacks=callbacks,
+            shuffle=False,
+            validation_data=(X_val, y_val),
+            callbacks=(self._training_callbacks(callbacks, on_telemetry)
+                       + [ResetStatesCallback()]),
             verbose=1
         )
 
@@ -332,8 +1450,39 @@ class RNNTrainer:
         print(f"Final loss: {history.history['loss'][-1]:.4f}")
         print(f"Final val loss: {history.history['val_loss'][-1]:.4f}")
 
+        # Serve a regular windowed model so app.py loads it unchanged
+        self.model = self.export_stateless(self.model)
         return history
 
+    def export_stateless(self, trained):
+        """Copy weights of a stateful TBPTT model into the fast inference layout"""
+        model = self._build_layers('fast')
+        model.build((None, self.config['sequence_length']))
+
+        for layer in model.layers:
+            if layer.weights:
+                layer.set_weights(trained.get_layer(layer.name).get_weights())
+
+        self._compile_model(model)
+        return model
+
+    def export_full_softmax(self, trained):
+        """Copy weights of a sampled-softmax model into the Dense softmax layout"""
+        model = self._build_layers(self.config['model_mode'])
+        model.build((None, self.config['sequence_length']))
+
+        for layer in model.layers:
+            if not layer.weights:
+                continue
+            weights = trained.get_layer(layer.name).get_weights()
+            if layer.name == 'output':
+                kernel, bias = weights
+                weights = [kernel.T, bias]
+            layer.set_weights(weights)
+
+        self._compile_model(model)
+        return model
+
     def save_model(self, history):
         """Save model, tokenizer, and config"""
         print("\n" + "="*60)
@@ -345,21 +1494,42 @@ class RNNTrainer:
         self.model.save(model_path)
         print(f"✓ Model saved: {model_path}")
 
-        # Save tokenizer
+        # Same weights for serving without TensorFlow, float32 and int8
+        weights_path = os.path.join(self.config['model_dir'], WEIGHTS_FILE)
+        quantized_path = os.path.join(self.config['model_dir'], QUANTIZED_WEIGHTS_FILE)
+        try:
+            export_weights(self.model, weights_path)
+            quantize_weights(weights_path, quantized_path)
+            print(f"✓ NumPy weights saved: {weights_path}, {quantized_path}")
+        except ValueError as e:
+            # Never leave an earlier model's exports next to this one
+            for path in (weights_path, quantized_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"⚠️  NumPy weights not exported: {e}")
+
+        # Save tokenizer: JSON word table for serving, and the same table as
+        # a pickled Keras Tokenizer for loaders that predate tokenizer.json
         tokenizer_path = os.path.join(
             self.config['model_dir'],
-            'tokenizer.pkl'
+            'tokenizer.json'
         )
-        with open(tokenizer_path, 'wb') as f:
-            pickle.dump(self.tokenizer, f)
+        self.tokenizer.save(tokenizer_path, limit=self.vocab_size)
         print(f"✓ Tokenizer saved: {tokenizer_path}")
 
+        with open(os.path.join(self.config['model_dir'], 'tokenizer.pkl'), 'wb') as f:
+            pickle.dump(self.tokenizer.to_keras(limit=self.vocab_size), f)
+
         # Save config
         config_data = {
             'vocab_size': self.vocab_size,
             'sequence_length': self.config['sequence_length'],
             'embedding_dim': self.config['embedding_dim'],
             'lstm_units': self.config['lstm_units'],
+            'label_mode': self.label_mode,
+            'training_mode': self.config['training_mode'],
+            'output_head': self.config['output_head'],
+            'token_dtype': np.dtype(token_dtype(self.vocab_size)).name,
             'training_samples': len(history.history['loss']),
             'final_loss': float(history.history['loss'][-1]),
             'final_val_loss': float(history.history['val_loss'][-1]),
@@ -382,49 +1552,223 @@ class RNNTrainer:
 
         print("\n✓ All files saved successfully!")
 
-    def run_full_training(self, embedding_paths=None):
-        """Run complete training pipeline"""
-        if embedding_paths is None:
-            embedding_paths = [
-                'glove.2024.dolma.300d/dolma_300_2024_1.2M.100_combined.txt',
-                'dolma_300_2024_1.2M.100_combined.txt',
-                'glove/glove.6B.300d.txt',
-                'glove.6B.300d.txt'
-            ]
+    def save_profile(self, trace_dir=None):
+        """Write the stage profile next to config.json and print it"""
+        report, table = self.profiler.save(
+            self.config['model_dir'],
+            extra={'trace_dir': trace_dir}
+        )
 
-        print("\n" + "="*70)
-        print(" " * 15 + "RNN TRAINING PIPELINE")
-        print("="*70)
+        print("\n" + "="*60)
+        print("PROFILE")
+        print("="*60)
+        print(table)
+        print(f"\n✓ Profile saved: "
+              f"{os.path.join(self.config['model_dir'], 'profile.json')}")
+        if self.profiler.cprofile:
+            print(f"✓ cProfile dumps: "
+                  f"{os.path.join(self.config['model_dir'], 'profile')}/*.prof")
+        if trace_dir:
+            print(f"✓ TensorFlow trace: {trace_dir} (open with TensorBoard)")
+        return report
+
+    def _cached_stage(self, stage, key, fmt, compute):
+        """Return a stage output from the cache, computing and storing it on a miss"""
+        with self.profiler.stage(stage):
+            if self.cache is not None:
+                value = self.cache.load(stage, key, fmt)
+                if value is not None:
+                    print(f"\n✓ Reusing cached {stage} ({key})")
+                    return value
+
+            value = compute()
+            if self.cache is not None:
+                self.cache.save(stage, key, fmt, value)
+            return value
+
+    def _prepare_download_tokens(self, on_stage):
+        """Steps 1-4 for the downloaded dataset, skipping cached stages"""
+        # 1. Download data (get_file keeps its own copy, so only stat it)
+        on_stage('downloading')
+        with self.profiler.stage('download'):
+            source_path = self.download_path()
+            source_key = StageCache.key(
+                'download', **file_fingerprint(source_path)
+            )
 
-        # 1. Download data
-        raw_text = self.download_data()
+        # 2. Clean text, loaded lazily since later stages may all be cached
+        on_stage('preprocessing')
+        clean_key = StageCache.key(
+            'clean', source=source_key, version=CLEAN_TEXT_VERSION
+        )
+        cleaned = {}
+
+        def clean_source():
+            # Streamed line by line, the raw corpus is never held whole
+            with open(source_path, 'r', encoding='utf-8') as f:
+                return self.clean_text(f)
 
-        # 2. Clean text
-        cleaned_text = self.clean_text(raw_text)
+        def cleaned_text():
+            if 'text' not in cleaned:
+                cleaned['text'] = self._cached_stage(
+                    'clean', clean_key, 'txt', clean_source
+                )
+            return cleaned['text']
 
         # 3. Create tokenizer
-        self.create_tokenizer(cleaned_text)
+        tokenizer_key = StageCache.key(
+            'tokenizer', text=clean_key, version=Vocabulary.VERSION,
+            max_vocab_size=self.config['max_vocab_size']
+        )
+        fitted = []
+
+        def fit_tokenizer():
+            fitted.append(self.create_tokenizer(cleaned_text()))
+            return fitted[0].to_dict()
+
+        tokenizer_data = self._cached_stage(
+            'tokenizer', tokenizer_key, 'json', fit_tokenizer
+        )
+        if not fitted:
+            self.set_tokenizer(Vocabulary.from_dict(tokenizer_data))
+
+        # 4. Encode the corpus into one token array
+        tokens = self._cached_stage(
+            'tokens', StageCache.key('tokens', tokenizer=tokenizer_key), 'npy',
+            lambda: self.encode_text(cleaned_text())
+        )
+        return tokenizer_key, tokens
 
-        # 4. Create sequences
-        sequences = self.create_sequences(cleaned_text)
+    def ingest_corpus(self, on_stage=None):
+        """Steps 1-4 for local shards: clean, count and encode them in parallel"""
+        print("\n" + "="*60)
+        print("INGESTING CORPUS")
+        print("="*60)
 
-        # 5. Prepare data
-        X, y = self.prepare_data(sequences)
+        if on_stage is not None:
+            on_stage('preprocessing')
 
-        # 6. Load embeddings
-        embeddings = self.load_embeddings(embedding_paths)
+        shards = preprocessing.find_shards(self.config['corpus'])
+        print(f"Found {len(shards):,} shards in {self.config['corpus']}")
 
-        # 7. Create embedding matrix
-        self.create_embedding_matrix(embeddings)
+        corpus_key = StageCache.key(
+            'corpus', shards=[file_fingerprint(path) for path in shards],
+            version=CLEAN_TEXT_VERSION
+        )
+        tokenizer_key = StageCache.key(
+            'tokenizer', text=corpus_key, version=Vocabulary.VERSION,
+            max_vocab_size=self.config['max_vocab_size']
+        )
+        tokens_key = StageCache.key('tokens', tokenizer=tokenizer_key)
+
+        if self.cache is not None:
+            tokenizer_data = self.cache.load('tokenizer', tokenizer_key, 'json')
+            tokens = self.cache.load('tokens', tokens_key, 'npy')
+            if tokenizer_data is not None and tokens is not None:
+                print(f"\n✓ Reusing cached corpus tokens ({tokens_key})")
+                self.set_tokenizer(Vocabulary.from_dict(tokenizer_data))
+                return tokenizer_key, tokens
+
+            tokens_path = self.cache.path('tokens', tokens_key, 'npy')
+        else:
+            tokens_path = os.path.join(self.config['data_dir'], 'corpus_tokens.npy')
+
+        max_vocab_size = self.config['max_vocab_size']
+        vocab, tokens = preprocessing.ingest_corpus(
+            self.config['corpus'],
+            tokens_path,
+            num_words=max_vocab_size,
+            oov_token='<OOV>',
+            workers=self.config['ingest_workers'],
+            dtype_for=lambda vocab: token_dtype(
+                min(max_vocab_size, len(vocab.word_index) + 1)
+            )
+        )
+        self.set_tokenizer(vocab)
+
+        if self.cache is not None:
+            self.cache.save('tokenizer', tokenizer_key, 'json', vocab.to_dict())
+            self.cache.evict(keep=tokens_path)
+
+        return tokenizer_key, tokens
+
+    def prepare_training_data(self, embedding_paths=None, on_stage=None):
+        """Steps 1-7: data, tokenizer, sequences and embeddings, skipping cached stages"""
+        if embedding_paths is None:
+            embedding_paths = DEFAULT_EMBEDDING_PATHS
+        if on_stage is None:
+            on_stage = lambda stage: None
+
+        # 1-4. Corpus, tokenizer and the (memory-mapped) token array
+        if self.config['corpus']:
+            with self.profiler.stage('ingest_corpus'):
+                tokenizer_key, tokens = self.ingest_corpus(on_stage)
+        else:
+            tokenizer_key, tokens = self._prepare_download_tokens(on_stage)
+        with self.profiler.stage('sequences'):
+            sequences = self.sequences_from_tokens(tokens)
+
+        # 5. Prepare data (streaming and TBPTT cut from the tokens instead)
+        if (self.config['input_pipeline'] == 'stream'
+                or self.config['training_mode'] == 'tbptt'):
+            X, y = None, None
+        else:
+            with self.profiler.stage('prepare_data'):
+                X, y = self.prepare_data(sequences)
+
+        # 6-7. Load embeddings and create the embedding matrix
+        on_stage('loading_embeddings')
+        found = [path for path in embedding_paths if os.path.exists(path)]
+        if found:
+            matrix_key = StageCache.key(
+                'embedding_matrix', tokenizer=tokenizer_key,
+                vocab_size=self.vocab_size,
+                embedding_dim=self.config['embedding_dim'],
+                source=file_fingerprint(found[0])
+            )
+            self.embedding_matrix = np.asarray(self._cached_stage(
+                'embedding_matrix', matrix_key, 'npy',
+                lambda: self.create_embedding_matrix(
+                    self.load_embeddings(found[:1])
+                )
+            ))
+        else:
+            with self.profiler.stage('embedding_matrix'):
+                self.create_embedding_matrix(
+                    self.load_embeddings(embedding_paths)
+                )
+
+        return X, y
+
+    def run_full_training(self, embedding_paths=None):
+        """Run complete training pipeline"""
+        print("\n" + "="*70)
+        print(" " * 15 + "RNN TRAINING PIPELINE")
+        print("="*70)
+
+        # 1-7. Data, tokenizer, sequences and embeddings
+        with self.profiler.stage('prepare_training_data'):
+            X, y = self.prepare_training_data(embedding_paths)
 
         # 8. Build model
-        self.build_model()
+        with self.profiler.stage('build_model'):
+            self.build_model()
 
         # 9. Train
-        history = self.train(X, y)
+        callbacks = []
+        trace_dir = None
+        if self.config['profile_steps']:
+            trace_dir = os.path.join(self.config['model_dir'], 'profile', 'trace')
+            callbacks.append(TraceWindow(trace_dir, *self.config['profile_steps']))
+        with self.profiler.stage('train'):
+            history = self.train(X, y, callbacks=callbacks)
 
         # 10. Save everything
-        self.save_model(history)
+        with self.profiler.stage('save_model'):
+            self.save_model(history)
+
+        if self.profiler.enabled:
+            self.save_profile(trace_dir)
 
         print("\n" + "="*70)
         print(" " * 20 + "TRAINING COMPLETE!")
@@ -465,6 +1809,119 @@ def main():
         default=300,
         help='Embedding dimension (default: 300)'
     )
+    parser.add_argument(
+        '--sequence-stride',
+        type=int,
+        default=1,
+        help='Tokens between consecutive training windows (default: 1)'
+    )
+    parser.add_argument(
+        '--label-mode',
+        choices=['auto', 'sparse', 'categorical'],
+        default='auto',
+        help='Integer (sparse) or one-hot (categorical) targets (default: auto)'
+    )
+    parser.add_argument(
+        '--input-pipeline',
+        choices=['memory', 'stream'],
+        default='memory',
+        help='Fit on in-memory arrays or stream windows with tf.data '
+             '(default: memory)'
+    )
+    parser.add_argument(
+        '--model-mode',
+        choices=['standard', 'fast'],
+        default='standard',
+        help='LSTM layout; fast keeps the fused kernel path (default: standard)'
+    )
+    parser.add_argument(
+        '--training-mode',
+        choices=['windows', 'tbptt'],
+        default='windows',
+        help='Sliding windows, or stateful truncated BPTT over contiguous '
+             'streams (default: windows)'
+    )
+    parser.add_argument(
+        '--output-head',
+        choices=['softmax', 'sampled'],
+        default='softmax',
+        help='Train the full softmax, or sampled softmax driven by token '
+             'counts (default: softmax)'
+    )
+    parser.add_argument(
+        '--num-sampled',
+        type=int,
+        default=1024,
+        help='Candidate classes per step for --output-head sampled '
+             '(default: 1024)'
+    )
+    parser.add_argument(
+        '--checkpoint-steps',
+        type=int,
+        default=None,
+        help='Write a resumable checkpoint every N training steps'
+    )
+    parser.add_argument(
+        '--checkpoint-minutes',
+        type=float,
+        default=None,
+        help='Write a resumable checkpoint every N minutes'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Continue from the latest checkpoint in model_dir/checkpoints'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Measure wall/CPU time and peak memory of every pipeline stage '
+             'and write profile.json/profile.txt to model_dir'
+    )
+    parser.add_argument(
+        '--profile-cprofile',
+        action='store_true',
+        help='With --profile, also dump a cProfile per stage to '
+             'model_dir/profile'
+    )
+    parser.add_argument(
+        '--profile-steps',
+        type=int,
+        nargs=2,
+        metavar=('FIRST', 'LAST'),
+        default=None,
+        help='With --profile, record a TensorFlow trace of training steps '
+             'FIRST..LAST to model_dir/profile/trace'
+    )
+    parser.add_argument(
+        '--telemetry-every',
+        type=int,
+        default=50,
+        help='Sample throughput telemetry every N batches into '
+             'model_dir/telemetry.jsonl, 0 to disable (default: 50)'
+    )
+    parser.add_argument(
+        '--jit-compile',
+        action='store_true',
+        help='Compile the training step with XLA'
+    )
+    parser.add_argument(
+        '--compare-model-modes',
+        action='store_true',
+        help='Measure samples/sec of each model layout and exit'
+    )
+    parser.add_argument(
+        '--corpus',
+        default=None,
+        help='Directory or glob of local text shards (plain or .gz) to '
+             'train on instead of downloading Shakespeare'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Recompute every preprocessing stage instead of reusing '
+             'cached outputs under data_dir'
+    )
 
     args = parser.parse_args()
 
@@ -473,11 +1930,33 @@ def main():
         'epochs': args.epochs,
         'batch_size': args.batch_size,
         'lstm_units': args.lstm_units,
-        'embedding_dim': args.embedding_dim
+        'embedding_dim': args.embedding_dim,
+        'sequence_stride': args.sequence_stride,
+        'label_mode': args.label_mode,
+        'input_pipeline': args.input_pipeline,
+        'use_cache': not args.no_cache,
+        'corpus': args.corpus,
+        'model_mode': args.model_mode,
+        'training_mode': args.training_mode,
+        'output_head': args.output_head,
+        'num_sampled': args.num_sampled,
+        'checkpoint_every_steps': args.checkpoint_steps,
+        'checkpoint_every_minutes': args.checkpoint_minutes,
+        'resume': args.resume,
+        'telemetry_every_batches': args.telemetry_every,
+        'profile': args.profile or args.profile_cprofile
+                   or args.profile_steps is not None,
+        'profile_cprofile': args.profile_cprofile,
+        'profile_steps': args.profile_steps,
+        'jit_compile': args.jit_compile
     }
 
     # Create trainer and run
     trainer = RNNTrainer(config)
+    if args.compare_model_modes:
+        X, y = trainer.prepare_training_data()
+        trainer.compare_model_modes(X, y)
+        return
     trainer.run_full_training()
 
 